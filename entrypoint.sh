@@ -0,0 +1,8 @@
+#!/bin/sh
+# Entrypoint of the dashboard container: first build the figures of the
+# current data version (see pensioendashboard/graphs.py), so that the
+# workers do not have to, then start the dashboard. A failing prerender
+# does not stop the dashboard; the workers then build the figures.
+python -m pensioendashboard.graphs || echo "Prerendering the figures failed"
+
+exec python "$@"
@@ -2,6 +2,7 @@ from dash import dcc, html
 from dash.dependencies import Input, Output
 import dash_bootstrap_components as dbc
 from pathlib import Path
+import os
 from app import app
 from demo1 import app as app1
 from pensioendashboard import app as app2
@@ -32,7 +33,7 @@ def display_page(pathname):
             ])
         else:
             if p.parts[1] == "demo1":
-                return app1.layout
+                return app1.serve_layout()
             elif p.parts[1] == "pensioendashboard":
                 return app2.layout
             else:
@@ -41,5 +42,16 @@ def display_page(pathname):
         pass
 
 
+def warmup():
+    # optional: do the data work of both dashboards before the first
+    # request, instead of on first use
+    app1.serve_layout()
+    app2.warmup()
+
+
+if os.environ.get("DASHBOARD_WARMUP"):
+    warmup()
+
+
 if __name__ == "__main__":
     app.run_server(debug=False, host="0.0.0.0")
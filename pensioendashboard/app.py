@@ -1,65 +1,45 @@
 from dash.dependencies import Input, Output
 from dash import dcc, html
 import dash_bootstrap_components as dbc
-import plotly.io as pio
 from datetime import datetime
-from newsapi import NewsApiClient
 import os
-from flask_caching import Cache
 
 # for pytest, a fallback import needs to be
 # defined
-from .graphs import GraphLibrary
+from .graphs import GraphLibrary, RATES
+from .newsfeed import NewsFeed
+from .viewcache import ViewCache
 from app import app
 
-pio.templates.default = "plotly_dark"
-
-RATES = ["EUSA30", "EURUSD"]
-
 # for threadign purposes
 global FIGURES
 FIGURES = GraphLibrary(RATES)
 
-# set news api
+# set news api; the news is refreshed in the background, starting at
+# the first request
 NEWSAPI_KEY = os.environ["NEWSAPI_KEY"]
-NEWSAPI = NewsApiClient(api_key=NEWSAPI_KEY)
+NEWSFEED = NewsFeed(api_key=NEWSAPI_KEY)
 
 # define the base path of the dashboard
 # needed in a multipage dashboard
 BASEPATH = "/pensioendashboard"
 
-cache = Cache(app.server, config={
-    "CACHE_TYPE": "filesystem",
-    "CACHE_DIR": "cache-directory"
-})
-CACHE_TIMEOUT = 600
-cache.clear()
-
-
-def getNews():
-    topics = ["pensioenfondsen",
-              "beurs",
-              "rente",
-              "valuta"]
-
-    response = {}
-    for topic in topics:
-        response.update({topic:
-                         NEWSAPI.get_everything(q=topic,
-                                                language="nl",
-                                                sort_by="publishedAt",
-                                                page_size=10,
-                                                page=1)})
-
-    return response
+# the rendered pages are cached per data version, shared by the workers
+cache = ViewCache(FIGURES.checkVersion)
 
 
 def buildNewsFeed(topic):
-    results = getNews()[topic]
-    news_items = [dbc.ListGroupItem("Laatste nieuws [{}]".format(
-        datetime.now().strftime("%H:%M:%S")
-        ))]
-    for item in results["articles"]:
+    # only reads the cached news, see newsfeed.py
+    NEWSFEED.ensureStarted()
+    articles, fetched = NEWSFEED.getNews(topic)
+    if fetched is None:
+        _header = "Laatste nieuws [wordt opgehaald]"
+    else:
+        _header = "Laatste nieuws [{}]".format(
+            datetime.fromtimestamp(fetched).strftime("%H:%M:%S"))
+
+    news_items = [dbc.ListGroupItem(_header)]
+    for item in articles:
         news_items.append(dbc.ListGroupItem("{} [{}, {}]".format(
             item["title"],
             item["source"]["name"].lower(),
@@ -151,7 +131,7 @@ content = html.Div(id="page-content")
 # --------------
 
 
-@cache.memoize(timeout=CACHE_TIMEOUT)
+@cache.memoize
 def contentoverview():
     latestDGRCards = FIGURES.buildTopCards()
 
@@ -175,7 +155,7 @@ def contentoverview():
     ])
 
 
-@cache.memoize(timeout=CACHE_TIMEOUT)
+@cache.memoize
 def contentpensioenfondsen():
     return [
         dbc.Row(
@@ -202,8 +182,8 @@ def contentpensioenfondsen():
                             id="fund-name-dropdown",
                             options=[
                                 {"label": fund, "value": fund}
-                                for fund in FIGURES.dgr_contribution[
-                                    "fund"].sort_values().unique()
+                                for fund in sorted(
+                                    FIGURES.contributionsPerFund())
                             ],
                             value="ABP",
                             style=dict(color="black")
@@ -251,7 +231,7 @@ def contentpensioenfondsen():
     ]
 
 
-@cache.memoize(timeout=CACHE_TIMEOUT)
+@cache.memoize
 def contentcountries():
     return [
         dbc.Row(
@@ -294,7 +274,9 @@ def contentcountries():
     ]
 
 
-@cache.memoize(timeout=CACHE_TIMEOUT)
+# not memoized: the figures come from the figure store and the news
+# from the news cache, and the news should not be frozen for the
+# lifetime of a cache entry
 def contenttabs(tab):
     if tab == "tab-dgr":
         return dbc.Row([
@@ -343,7 +325,6 @@ def contenttabs(tab):
 # dash_app.config.suppress_callback_exceptions = True
 # define the layout of the dashboard
 # app.title = "Datarush | Pensioendashboard"
-@cache.memoize(timeout=CACHE_TIMEOUT)
 def serve_layout():
     return dbc.Container([
         topbar,
@@ -356,6 +337,18 @@ def serve_layout():
 layout = serve_layout()
 
 
+def warmup():
+    """
+    Optional: load the data and render the pages before the first
+    request, for instance from a post fork hook of the server. Without
+    a warmup, this is done on first use.
+    """
+    NEWSFEED.ensureStarted()
+    contentoverview()
+    contentpensioenfondsen()
+    contentcountries()
+
+
 @app.callback(
     [Output(f"page-{i}-link", "active") for i in range(1, 5)],
     [Input("url", "pathname")],
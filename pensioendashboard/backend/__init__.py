@@ -1,100 +1,140 @@
 import os
-import time
 from pathlib import Path
 import logging as LOG
-from datetime import datetime
-import shutil
-from sqlalchemy import create_engine
+
+try:
+    from .backup import BackupStore
+    from .connections import writerEngine
+except ImportError:
+    from backup import BackupStore
+    from connections import writerEngine
 
 DIRPATH = Path(os.path.dirname(__file__)).parent
-DBLOCATION = os.path.join(DIRPATH, "db/marketdata.db")
+# the location of the db can be overridden, e.g. for testing
+DBLOCATION = os.environ.get("PENSIOENDASHBOARD_DB",
+                            os.path.join(DIRPATH, "db/marketdata.db"))
 LOGLOCATION = os.path.join(DIRPATH, "log/backend.log")
-DBCONNECTION = create_engine("sqlite:///{}".format(DBLOCATION))
+CACHELOCATION = os.path.join(DIRPATH, "db/cache")
+BACKUPLOCATION = os.path.join(os.path.dirname(DBLOCATION), "old")
+# number of days that a backup is kept
+BACKUPDAYS = 30
+# number of months that the prediction history is kept, see purgeDB
+HISTORYMONTHS = 2
+# a single connection in wal mode: the stages of the pipeline run in
+# threads and take turns writing, while the dashboard keeps reading
+DBCONNECTION = writerEngine(DBLOCATION)
 
 
 def backupDB():
-    # make a backup of the file
+    # make a snapshot of the db, next to the db in the old folder. Only
+    # the parts of the db that changed since an earlier snapshot take
+    # extra disk space, see backup.py
     try:
         LOG.info("Start with backup of db")
-        _name, _ext = os.path.splitext(DBLOCATION)
-        _namecopy = "{}_{}".format(_name, datetime.now().strftime(
-            "%Y%m%d"))
-        _copylocation = "{}/old/{}{}".format(os.path.dirname(_namecopy),
-                                             os.path.basename(_namecopy),
-                                             _ext)
-        shutil.copyfile(DBLOCATION, _copylocation)
-
-        LOG.info("Succesfully copied db to {}".format(_copylocation))
-
-        # remove oldest backup; in order to save disk space
-        # logic is: remove backups older than 30 days
-        days = 30
-        seconds = days * 24 * 60 * 60
-        now = time.time()
-        backupLocation = os.path.dirname(_copylocation)
-
-        LOG.info("Remove old backups")
-
-        for f in os.listdir(backupLocation):
-            f = os.path.join(backupLocation, f)
-            if os.stat(f).st_mtime < now - seconds:
-                if os.path.isfile(f) and f.endswith(".db"):
-                    if os.path.isfile(f):
-                        os.remove(os.path.join(backupLocation,
-                                  f))
-                        LOG.info(
-                            "Removed old log file {}".format(f)
-                        )
+        _store = BackupStore(BACKUPLOCATION)
+        _store.backup(DBLOCATION)
+
+        # remove backups older than 30 days, in order to save disk space
+        _store.prune(BACKUPDAYS)
 
     except Exception as err:
         LOG.error("Backing up the db resulted in an error: {}".format(err))
 
 
 def purgeDB():
-    # clean db entries for dgr_prediction and
-    # dgr_contribution older than X months
+    # clean db entries for the prediction history older than
+    # HISTORYMONTHS months.
+    # dgr_prediction_current and dgr_contribution_current only hold the
+    # latest run, so these do not need to be purged
     try:
-        _MONTHS = 2
+        # date_run is stored as 'yyyy-mm-dd hh:mm:ss' text, so it can be
+        # compared directly, which allows the use of the date_run index
         _query = [
-            """DELETE FROM dgr_prediction WHERE """
-            """date(date_run) < date("now", "-{} month")""".format(_MONTHS),
-            """DELETE FROM dgr_contribution WHERE date(date_run) """
-            """< date("now", "-{} month")""".format(_MONTHS)
+            """DELETE FROM dgr_prediction_history WHERE """
+            """date_run < date('now', '-{} month')""".format(HISTORYMONTHS)
             ]
-        con = DBCONNECTION.connect()
+        with DBCONNECTION.begin() as con:
+            for query in _query:
+                con.execute(query)
 
-        for query in _query:
-            con.execute(query)
+    except Exception as err:
+        LOG.error("Purging the db resulted in an error: {}".format(err))
 
-        con.close()
+
+def bumpDataVersion():
+    # increase the generation counter in the db. The dashboard keeps
+    # the data in memory and only reloads it when this counter changes
+    try:
+        _query = [
+            """CREATE TABLE IF NOT EXISTS data_version ("""
+            """id INTEGER NOT NULL PRIMARY KEY CHECK (id = 1), """
+            """version INTEGER NOT NULL)""",
+            """INSERT INTO data_version (id, version) VALUES (1, 1) """
+            """ON CONFLICT (id) DO UPDATE SET version = version + 1"""
+            ]
+        with DBCONNECTION.begin() as con:
+            for query in _query:
+                con.execute(query)
+
+        LOG.info("Increased the data version of the db")
 
     except Exception as err:
-        LOG.error("Purging the db resulted in an error: {}".format(err))
+        LOG.error("Bumping the data version resulted in an error: {}".format(
+            err))
 
 
-# this script runs all the backend script in sequence.
+def modelInputs() -> str:
+    # fingerprint of the data the risk model is estimated on; the model
+    # only needs to run again when this changes
+    _query = """SELECT (SELECT COUNT(*) || ':' || MAX(date) || ':' || """ \
+        """TOTAL(value) FROM marketdata) || '/' || """ \
+        """(SELECT COUNT(*) || ':' || MAX(date) || ':' || TOTAL(value) """ \
+        """FROM dekkingsgraad)"""
+    with DBCONNECTION.connect() as con:
+        return con.execute(_query).scalar()
+
+
+# this script runs all the backend scripts. The stages that only depend on
+# the (migrated) db run at the same time, see pipeline.py
 if __name__ == "__main__":
     from marketdata import MarketData
     from websitesDgr import UpdateDGR
     from dataimport import DataImport
     from riskmodel import RiskModelPF
-
-    # first, backup the database
-    backupDB()
-    purgeDB()
-
-    # update market data
-    data = MarketData()
-    data.UpdateEquityAndFX()
-    data.UpdateInterestRates()
-
-    # update dekkingsgraad data
-    update = UpdateDGR()
-    update.updateDB()
-
-    # update the risk metrics
-    dataimport = DataImport()
-    riskmodel = RiskModelPF(dataimport.marketdata, dataimport.dekkingsgraden)
-    riskmodel.runLinearModel()
-    riskmodel.makePrediction()
-    riskmodel.makeContribution()
+    from migrations import migrate
+    from pipeline import Pipeline, Stage
+
+    def runModel():
+        # update the risk metrics
+        dataimport = DataImport()
+        riskmodel = RiskModelPF(dataimport.marketdata,
+                                dataimport.dekkingsgraden)
+        _succeeded = [riskmodel.runLinearModel(batched=True),
+                      riskmodel.makePrediction(incremental=True),
+                      riskmodel.makeContribution()]
+
+        # every run writes new predictions, so signal the dashboard
+        # that it needs to reload its data
+        bumpDataVersion()
+
+        # the risk model logs its errors instead of raising them; a failed
+        # step marks the stage as failed, so that it runs again next time
+        return all(_succeeded)
+
+    # each market data stage gets its own MarketData object, as the
+    # object keeps track of the latest date per ticker
+    pipeline = Pipeline(
+        [Stage("backup", backupDB),
+         Stage("migrate", lambda: migrate(DBCONNECTION), after=["backup"]),
+         Stage("purge", purgeDB, after=["migrate"]),
+         Stage("equityfx", lambda: MarketData().UpdateEquityAndFX(),
+               after=["migrate"]),
+         Stage("rates", lambda: MarketData().UpdateInterestRates(),
+               after=["migrate"]),
+         Stage("dekkingsgraad", lambda: UpdateDGR().updateDB(),
+               after=["migrate"]),
+         Stage("model", runModel,
+               after=["purge", "equityfx", "rates", "dekkingsgraad"],
+               fingerprint=modelInputs)],
+        DBCONNECTION)
+    pipeline.run()
@@ -0,0 +1,210 @@
+import json
+import os
+import time
+import threading
+import logging as LOG
+import pandas as pd
+import requests
+from concurrent.futures import ThreadPoolExecutor
+
+ALPHAVANTAGEURL = os.environ.get("ALPHAVANTAGE_URL",
+                                 "https://www.alphavantage.co/query")
+# quota of the free api key
+CALLSPERMINUTE = 5
+# number of data points in a "compact" response; for a longer gap the
+# "full" history is requested
+COMPACTSIZE = 100
+# timeout in seconds for connecting to and reading from the api
+TIMEOUT = (5, 30)
+
+
+class AlphaVantageError(Exception):
+    pass
+
+
+class TokenBucket:
+    """
+    Allows `rate` calls per `per` seconds, with bursts of at most `rate`
+    calls. acquire() blocks until a call is allowed.
+    """
+
+    def __init__(self, rate: int, per: float = 60,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.capacity = rate
+        self.interval = per / rate
+        self.clock = clock
+        self.sleep = sleep
+        self._tokens = float(rate)
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                _now = self.clock()
+                self._tokens = min(self.capacity,
+                                   self._tokens +
+                                   (_now - self._updated) / self.interval)
+                self._updated = _now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                _wait = (1 - self._tokens) * self.interval
+
+            self.sleep(_wait)
+
+
+def outputSize(latest: pd.Timestamp, today: pd.Timestamp = None) -> str:
+    # compact holds the last COMPACTSIZE trading days; only ask for the
+    # full history when more is missing
+    if today is None:
+        today = pd.Timestamp("today").normalize()
+
+    if latest == pd.Timestamp.min or \
+            len(pd.bdate_range(latest, today)) > COMPACTSIZE:
+        return "full"
+    return "compact"
+
+
+def parseDaily(response: dict) -> pd.DataFrame:
+    # the close per date of a daily (fx) time series response
+    _key = next((key for key in response if key.startswith("Time Series")),
+                None)
+    if _key is None:
+        raise AlphaVantageError(
+            response.get("Error Message") or response.get("Note") or
+            response.get("Information") or "No time series in response")
+
+    _df = pd.DataFrame.from_dict(response[_key], orient="index",
+                                 dtype=float)
+    _df = _df[["4. close"]].rename(columns={"4. close": "value"})
+    _df.index = pd.to_datetime(_df.index)
+    _df.index.name = "date"
+
+    return _df.sort_index()
+
+
+class AlphaVantage:
+    """
+    Client for the daily series of Alpha Vantage. Requests run at the
+    same time, but never more than the quota per minute. The responses
+    are cached on disk per symbol and date, so a rerun of the backend on
+    the same day does not use the quota again.
+    """
+
+    def __init__(self,
+                 api_key: str,
+                 url: str = ALPHAVANTAGEURL,
+                 callsperminute: int = CALLSPERMINUTE,
+                 cachedir: str = None,
+                 timeout=TIMEOUT,
+                 bucket: TokenBucket = None):
+        self.api_key = api_key
+        self.url = url
+        self.callsperminute = callsperminute
+        self.cachedir = cachedir
+        self.timeout = timeout
+        self.bucket = bucket if bucket is not None \
+            else TokenBucket(callsperminute)
+
+        if self.cachedir is not None:
+            os.makedirs(self.cachedir, exist_ok=True)
+            self.pruneCache()
+
+    def pruneCache(self):
+        # a cached response is only used on the day it was requested, and
+        # a full one can be several MB: remove those of earlier days
+        _today = pd.Timestamp("today").strftime("%Y%m%d")
+
+        for name in os.listdir(self.cachedir):
+            _parts = name.rsplit("_", 2)
+            if not name.endswith(".json") or len(_parts) != 3 \
+                    or _parts[1] == _today:
+                continue
+            try:
+                os.remove(os.path.join(self.cachedir, name))
+            except OSError as err:
+                LOG.info("Unable to remove cache file {}: {}".format(
+                    name, err))
+
+    def cacheLocation(self, symbol: str, size: str) -> str:
+        return os.path.join(self.cachedir, "{}_{}_{}.json".format(
+            symbol, pd.Timestamp("today").strftime("%Y%m%d"), size))
+
+    def readCache(self, symbol: str, size: str):
+        # a full response also answers a compact request
+        if self.cachedir is None:
+            return None
+
+        for _size in ["full"] if size == "full" else ["compact", "full"]:
+            try:
+                with open(self.cacheLocation(symbol, _size)) as f:
+                    return json.load(f)
+            except (OSError, ValueError):
+                continue
+
+        return None
+
+    def writeCache(self, symbol: str, size: str, response: dict):
+        if self.cachedir is None:
+            return
+
+        _location = self.cacheLocation(symbol, size)
+        _tmp = "{}.{}.tmp".format(_location, threading.get_ident())
+        with open(_tmp, "w") as f:
+            json.dump(response, f)
+        os.replace(_tmp, _location)
+
+    def query(self, params: dict) -> dict:
+        self.bucket.acquire()
+
+        _response = requests.get(self.url,
+                                 params=dict(params, apikey=self.api_key),
+                                 timeout=self.timeout)
+        _response.raise_for_status()
+
+        return _response.json()
+
+    def getDaily(self, symbol: str, params: dict,
+                 latest: pd.Timestamp = pd.Timestamp.min) -> pd.DataFrame:
+        """
+        The daily closes of `symbol`, requested with the api `params`.
+        `latest` is the last date in the db and determines whether the
+        compact or the full history is needed.
+        """
+        _size = outputSize(latest)
+
+        _response = self.readCache(symbol, _size)
+        if _response is None:
+            _response = self.query(dict(params, outputsize=_size))
+            # parse before caching, so that errors are not cached
+            _df = parseDaily(_response)
+            self.writeCache(symbol, _size, _response)
+        else:
+            LOG.info("Using the cached Alpha Vantage response for "
+                     "{}".format(symbol))
+            _df = parseDaily(_response)
+
+        _df["name"] = symbol
+        return _df
+
+    def getAll(self, symbols: dict, latest) -> dict:
+        """
+        Request all `symbols` (name: api params) at the same time. The
+        function `latest` gives the last date in the db per name. Names
+        that fail get an empty dataframe.
+        """
+        def _get(symbol):
+            try:
+                return self.getDaily(symbol, symbols[symbol],
+                                     latest(symbol))
+            except Exception as err:
+                LOG.error("Getting {} from Alpha Vantage resulted in an "
+                          "error: {}".format(symbol, err))
+                return pd.DataFrame()
+
+        with ThreadPoolExecutor(
+                max_workers=min(len(symbols), self.callsperminute) or 1) \
+                as executor:
+            return dict(zip(symbols, executor.map(_get, symbols)))
@@ -0,0 +1,168 @@
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import logging as LOG
+from datetime import datetime
+
+# size of the pieces a snapshot is stored in; a piece that is the same
+# as in an earlier snapshot is not stored again. A multiple of the page
+# size of the db (4096 bytes by default)
+CHUNKSIZE = 256 * 1024
+# number of pages copied per step of the online backup. Between the
+# steps other connections can use the db
+BACKUPPAGES = 1024
+BACKUPSLEEP = 0.01
+
+
+class BackupStore:
+    """
+    Compressed, deduplicated snapshots of a sqlite db. A snapshot is made
+    with the online backup api of sqlite, so it is consistent even while
+    the db is used. The snapshot is split into chunks that are stored
+    gzipped under their sha256 hash; index.json lists the snapshots with
+    their chunks, so pruning needs no scan of the backup folder.
+    """
+
+    def __init__(self, location: str, chunksize: int = CHUNKSIZE):
+        self.location = location
+        self.chunksize = chunksize
+        os.makedirs(self.chunkFolder(), exist_ok=True)
+
+    def indexLocation(self) -> str:
+        return os.path.join(self.location, "index.json")
+
+    def chunkFolder(self) -> str:
+        return os.path.join(self.location, "chunks")
+
+    def chunkLocation(self, digest: str) -> str:
+        return os.path.join(self.chunkFolder(), "{}.gz".format(digest))
+
+    def readIndex(self) -> dict:
+        try:
+            with open(self.indexLocation()) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"snapshots": []}
+
+    def writeIndex(self, index: dict):
+        _tmp = "{}.{}.tmp".format(self.indexLocation(), os.getpid())
+        with open(_tmp, "w") as f:
+            json.dump(index, f, indent=1)
+        os.replace(_tmp, self.indexLocation())
+
+    def copyDB(self, dblocation: str, target: str):
+        # copy the db in steps; readers and writers are not blocked for
+        # the whole copy
+        _source = sqlite3.connect(dblocation)
+        _target = sqlite3.connect(target)
+        try:
+            _source.backup(_target, pages=BACKUPPAGES, sleep=BACKUPSLEEP)
+        finally:
+            _target.close()
+            _source.close()
+
+    def storeChunks(self, snapshot: str) -> list:
+        _known = {digest for entry in self.readIndex()["snapshots"]
+                  for digest in entry["chunks"]}
+        _chunks = []
+
+        with open(snapshot, "rb") as f:
+            for _chunk in iter(lambda: f.read(self.chunksize), b""):
+                _digest = hashlib.sha256(_chunk).hexdigest()
+                _chunks.append(_digest)
+
+                if _digest in _known or \
+                        os.path.isfile(self.chunkLocation(_digest)):
+                    continue
+
+                _tmp = "{}.{}.tmp".format(self.chunkLocation(_digest),
+                                          os.getpid())
+                with gzip.open(_tmp, "wb") as chunkfile:
+                    chunkfile.write(_chunk)
+                os.replace(_tmp, self.chunkLocation(_digest))
+                _known.add(_digest)
+
+        return _chunks
+
+    def backup(self, dblocation: str, name: str = None) -> dict:
+        """
+        Make a snapshot of the db at `dblocation` and add it to the index.
+        Returns the index entry of the snapshot.
+        """
+        if name is None:
+            name = datetime.now().strftime("%Y%m%d-%H%M%S")
+
+        _snapshot = os.path.join(self.location,
+                                 "{}.{}.tmp".format(name, os.getpid()))
+        try:
+            self.copyDB(dblocation, _snapshot)
+            _chunks = self.storeChunks(_snapshot)
+            _entry = {"name": name,
+                      "created": time.time(),
+                      "size": os.path.getsize(_snapshot),
+                      "chunks": _chunks}
+        finally:
+            if os.path.isfile(_snapshot):
+                os.remove(_snapshot)
+
+        _index = self.readIndex()
+        _index["snapshots"] = [entry for entry in _index["snapshots"]
+                               if entry["name"] != name] + [_entry]
+        self.writeIndex(_index)
+
+        LOG.info("Stored backup {} of {} bytes in {} chunks".format(
+            name, _entry["size"], len(_chunks)))
+
+        return _entry
+
+    def prune(self, days: int, now: float = None) -> list:
+        """
+        Remove the snapshots older than `days`, and the chunks that no
+        remaining snapshot uses. The most recent snapshot is always kept.
+        Returns the names of the removed snapshots.
+        """
+        if now is None:
+            now = time.time()
+
+        _index = self.readIndex()
+        _snapshots = sorted(_index["snapshots"],
+                            key=lambda entry: entry["created"])
+        _keep = [entry for entry in _snapshots[:-1]
+                 if entry["created"] >= now - days * 24 * 60 * 60] + \
+            _snapshots[-1:]
+        _removed = [entry for entry in _snapshots if entry not in _keep]
+
+        if not _removed:
+            return []
+
+        _index["snapshots"] = _keep
+        self.writeIndex(_index)
+
+        _used = {digest for entry in _keep for digest in entry["chunks"]}
+        for digest in {digest for entry in _removed
+                       for digest in entry["chunks"]} - _used:
+            try:
+                os.remove(self.chunkLocation(digest))
+            except OSError as err:
+                LOG.error("Removing backup chunk {} resulted in an error: "
+                          "{}".format(digest, err))
+
+        LOG.info("Removed old backups {}".format(
+            [entry["name"] for entry in _removed]))
+
+        return [entry["name"] for entry in _removed]
+
+    def restore(self, name: str, target: str):
+        # write snapshot `name` as a db file to `target`
+        _entry = next(entry for entry in self.readIndex()["snapshots"]
+                      if entry["name"] == name)
+
+        _tmp = "{}.{}.tmp".format(target, os.getpid())
+        with open(_tmp, "wb") as f:
+            for digest in _entry["chunks"]:
+                with gzip.open(self.chunkLocation(digest), "rb") as chunk:
+                    f.write(chunk.read())
+        os.replace(_tmp, target)
@@ -0,0 +1,66 @@
+import functools
+from urllib.parse import quote
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import QueuePool
+
+# settings of every connection to the db. In wal mode readers do not
+# wait for a writer (and the other way around); with synchronous=normal
+# a commit does not wait for the disk, which is safe in wal mode
+PRAGMAS = {"synchronous": "NORMAL",
+           "mmap_size": 256 * 1024 * 1024,
+           # in KiB when negative
+           "cache_size": -32 * 1024,
+           "temp_store": "MEMORY"}
+# number of reader connections kept open per db
+READERPOOLSIZE = 8
+# number of seconds to wait for a lock on the db, or for the writer
+# connection when another thread is using it
+TIMEOUT = 30
+
+
+def setPragmas(engine, pragmas: dict):
+    @event.listens_for(engine, "connect")
+    def _connect(dbapi_connection, connection_record):
+        _cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            _cursor.execute("PRAGMA {} = {}".format(name, value))
+        _cursor.close()
+
+
+@functools.lru_cache(maxsize=None)
+def writerEngine(location: str):
+    """
+    The engine the backend writes with: a single connection, so that the
+    stages of the backend that run at the same time take turns. Switches
+    the db to wal mode.
+    """
+    _engine = create_engine("sqlite:///{}".format(location),
+                            poolclass=QueuePool,
+                            pool_size=1,
+                            max_overflow=0,
+                            pool_timeout=TIMEOUT,
+                            connect_args={"timeout": TIMEOUT,
+                                          "check_same_thread": False})
+    setPragmas(_engine, dict(PRAGMAS, journal_mode="WAL"))
+
+    return _engine
+
+
+@functools.lru_cache(maxsize=None)
+def readerEngine(location: str):
+    """
+    The engine the dashboard reads with: a pool of read-only connections,
+    shared by the threads of a worker. Connections are only opened on
+    first use, so this does not touch the db.
+    """
+    _engine = create_engine("sqlite:///file:{}?mode=ro&uri=true".format(
+                                quote(str(location))),
+                            poolclass=QueuePool,
+                            pool_size=READERPOOLSIZE,
+                            max_overflow=READERPOOLSIZE,
+                            pool_timeout=TIMEOUT,
+                            connect_args={"timeout": TIMEOUT,
+                                          "check_same_thread": False})
+    setPragmas(_engine, dict(PRAGMAS, query_only=1))
+
+    return _engine
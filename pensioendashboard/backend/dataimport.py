@@ -1,24 +1,88 @@
 import pandas as pd
-from sqlalchemy import create_engine
+from sqlalchemy import text
 import os
+import time
+import threading
 from pathlib import Path
 
+try:
+    from .connections import readerEngine
+    from .widetable import readWide, wideTableFilled
+except ImportError:
+    from connections import readerEngine
+    from widetable import readWide, wideTableFilled
+
 DIRPATH = Path(os.path.dirname(__file__)).parent
-DBLOCATION = os.path.join(DIRPATH, "db/marketdata.db")
-DBCONNECTION = create_engine("sqlite:///{}".format(DBLOCATION))
+# the location of the db can be overridden, e.g. for testing
+DBLOCATION = os.environ.get("PENSIOENDASHBOARD_DB",
+                            os.path.join(DIRPATH, "db/marketdata.db"))
+# the dashboard only reads, with a pool of read-only connections
+DBCONNECTION = readerEngine(DBLOCATION)
+
+# minimum number of seconds between two lookups of the data version
+# in the db. Within this interval, the snapshot is served as is.
+VERSIONCHECKINTERVAL = 5
 
 
 class DataImport:
 
-    def __init__(self):
-        # to do: error handling
-        pass
+    def __init__(self, checkinterval: float = VERSIONCHECKINTERVAL):
+        # the datasets are loaded once and kept in memory (the snapshot).
+        # The snapshot is only reloaded when the backend has bumped the
+        # data version in the db, see backend/__init__.py
+        self.checkinterval = checkinterval
+        self.cache_stats = {"hits": 0, "misses": 0, "refreshes": 0}
+        self._snapshot = {}
+        self._snapshot_version = None
+        self._lastcheck = None
+        self._lock = threading.RLock()
 
-    def getMarketData(self) -> pd.DataFrame:
-        _query = "SELECT date, name, value FROM marketdata ORDER BY date"
-        _df = pd.read_sql(_query, DBCONNECTION, index_col="date",
+    def getMarketData(self, start_date=None, end_date=None) -> pd.DataFrame:
+        """
+        Market data in wide format: one row per date, one column per
+        ticker, forward filled. Read from the marketdata_wide table that
+        is maintained by the backend.
+        """
+        _where = []
+        _params = {}
+        if start_date is not None:
+            _where.append("date >= :start_date")
+            _params["start_date"] = pd.Timestamp(start_date).strftime(
+                "%Y-%m-%d")
+        if end_date is not None:
+            _where.append("date <= :end_date")
+            _params["end_date"] = pd.Timestamp(end_date).strftime("%Y-%m-%d")
+
+        _query = "SELECT * FROM marketdata_wide"
+        if _where:
+            _query += " WHERE " + " AND ".join(_where)
+        _query += " ORDER BY date"
+
+        with DBCONNECTION.connect() as con:
+            _filled = wideTableFilled(con)
+
+        if not _filled:
+            # the backend has not built the wide table yet, or it is
+            # empty (e.g. created by an older init.sql): pivot the long
+            # table instead
+            _df = self.getMarketDataFromLong()
+            if start_date is not None:
+                _df = _df[_df.index >= pd.Timestamp(start_date)]
+            if end_date is not None:
+                _df = _df[_df.index <= pd.Timestamp(end_date)]
+            return _df
+
+        _df = pd.read_sql(text(_query), DBCONNECTION, params=_params,
+                          index_col="date",
                           parse_dates={"date": "%Y-%m-%d"})
-        _df = _df.pivot_table(values="value", index="date", columns="name")
+
+        _df = _df.astype(float).sort_index(axis=1)
+        _df.columns.name = "name"
+        return _df
+
+    def getMarketDataFromLong(self) -> pd.DataFrame:
+        with DBCONNECTION.connect() as con:
+            _df = readWide(con)
         _df.ffill(inplace=True)
         return _df
 
@@ -30,7 +94,7 @@ class DataImport:
 
     def getDekkingsgraden(self) -> pd.DataFrame:
         _query = "SELECT date, name AS fonds, value AS dekkingsgraad " \
-            "FROM dekkingsgraad"
+            "FROM dekkingsgraad ORDER BY name, date"
         _df_dgr = pd.read_sql(_query, DBCONNECTION,
                               parse_dates={"date": "%Y-%m-%d"}).sort_values(
                                   "date")
@@ -47,44 +111,181 @@ class DataImport:
 
     def getDGRPrediction(self) -> pd.DataFrame:
         _query = "SELECT date, fund, value AS dekkingsgraad FROM " \
-            "dgr_prediction_latest"
+            "dgr_prediction_current ORDER BY fund, date"
         _df = pd.read_sql(_query, DBCONNECTION, index_col="date",
                           parse_dates={"date": "%Y-%m-%d"})
 
         return _df
 
-    def getDGRContribution(self) -> pd.DataFrame:
-        _query = "SELECT date, fund, [index], value FROM " \
-            "dgr_contribution_latest"
+    def getDGRContributionWide(self) -> pd.DataFrame:
+        """
+        Return the contributions as stored: one row per fund per date,
+        with a column per risk factor.
+        """
+        _query = "SELECT * FROM dgr_contribution_current ORDER BY fund, date"
         _df = pd.read_sql(_query, DBCONNECTION, index_col="date",
                           parse_dates={"date": "%Y-%m-%d"})
 
         return _df
 
+    def getDGRContribution(self) -> pd.DataFrame:
+        # the graphs expect a flat table, with the risk factor in the
+        # index column
+        _df = self.getDGRContributionWide()
+        _df = _df.reset_index().melt(id_vars=["date", "fund"],
+                                     var_name="index",
+                                     value_name="value")
+        _df = _df.dropna(subset=["value"]).set_index("date")
+
+        return _df
+
+    def getLatest(self) -> dict:
+        """
+        The latest numbers for the top cards, looked up through the
+        indexes, so independent of the length of the history:
+        - "funds": per fund the latest official and predicted
+          dekkingsgraad, with their dates
+        - "markets": per ticker the last two observations
+        The cross join makes sqlite loop over the (few) tickers and look
+        up their last dates in the index.
+        """
+        _queryfunds = """
+            SELECT o.fund, o.date AS official_date,
+                o.value * 100 AS official,
+                p.date AS predict_date, p.value AS predict
+            FROM (SELECT d.name AS fund, d.date, d.value
+                  FROM (SELECT name, MAX(date) AS date
+                        FROM dekkingsgraad GROUP BY name) AS l
+                  JOIN dekkingsgraad AS d
+                      ON d.name = l.name AND d.date = l.date) AS o
+            JOIN (SELECT c.fund, c.date, c.value
+                  FROM (SELECT fund, MAX(date) AS date
+                        FROM dgr_prediction_current GROUP BY fund) AS l
+                  JOIN dgr_prediction_current AS c
+                      ON c.fund = l.fund AND c.date = l.date) AS p
+                ON p.fund = o.fund
+            ORDER BY o.fund"""
+        _querymarkets = """
+            SELECT m.name, m.date, m.value
+            FROM marketdata_names
+            CROSS JOIN marketdata AS m
+                ON m.name = marketdata_names.short_name AND m.date IN (
+                    SELECT date FROM marketdata
+                    WHERE name = marketdata_names.short_name
+                    ORDER BY date DESC LIMIT 2)"""
+
+        _df_funds = pd.read_sql(_queryfunds, DBCONNECTION, index_col="fund",
+                                parse_dates={"official_date": "%Y-%m-%d",
+                                             "predict_date": "%Y-%m-%d"})
+
+        _df = pd.read_sql(_querymarkets, DBCONNECTION,
+                          parse_dates={"date": "%Y-%m-%d"}).sort_values(
+                              ["name", "date"])
+        _df_markets = _df.groupby("name").agg(date=("date", "last"),
+                                              value=("value", "last"),
+                                              previous=("value", "first"))
+        # a ticker with a single observation has no change yet
+        _df_markets.loc[_df.groupby("name").size() < 2, "previous"] = \
+            float("nan")
+
+        return {"funds": _df_funds, "markets": _df_markets}
+
+    def getDataVersion(self) -> int:
+        """
+        Return the generation counter of the db. The backend increases
+        this counter after each run that wrote new data.
+        """
+        _query = "SELECT version FROM data_version WHERE id = 1"
+        try:
+            with DBCONNECTION.connect() as con:
+                _version = con.execute(_query).scalar()
+        except Exception:
+            # db without a data_version table (yet)
+            _version = None
+
+        return _version or 0
+
+    def checkVersion(self) -> int:
+        """
+        Return the data version of the snapshot. The db is only asked for
+        the data version once per check interval; on a new version the
+        snapshot is dropped.
+        """
+        with self._lock:
+            _now = time.monotonic()
+            if self._lastcheck is None or \
+                    _now - self._lastcheck >= self.checkinterval:
+                self._lastcheck = _now
+                _version = self.getDataVersion()
+
+                if _version != self._snapshot_version:
+                    if self._snapshot_version is not None:
+                        self.cache_stats["refreshes"] += 1
+                    self._snapshot = {}
+                    self._snapshot_version = _version
+
+            return self._snapshot_version
+
+    def getSnapshot(self, name: str, loader):
+        """
+        Return dataset `name` from the in-memory snapshot, loading it
+        with `loader` on a miss. The snapshot is dropped as soon as the
+        data version in the db changes.
+
+        The returned objects are shared between callers, so they should
+        not be modified in place.
+        """
+        with self._lock:
+            self.checkVersion()
+
+            if name in self._snapshot:
+                self.cache_stats["hits"] += 1
+            else:
+                self.cache_stats["misses"] += 1
+                self._snapshot[name] = loader()
+
+            return self._snapshot[name]
+
+    def resetSnapshot(self):
+        # force a reload of all datasets on the next access
+        with self._lock:
+            self._snapshot = {}
+            self._snapshot_version = None
+            self._lastcheck = None
+
     def closeConnection(self):
         pass
         # self.engine.close()
 
     @property
     def marketdata(self):
-        return self.getMarketData()
+        return self.getSnapshot("marketdata", self.getMarketData)
 
     @property
     def marketdatanames(self):
-        return self.getMarketDataNames()
+        return self.getSnapshot("marketdatanames", self.getMarketDataNames)
 
     @property
     def dekkingsgraden(self):
-        return self.getDekkingsgraden()
+        return self.getSnapshot("dekkingsgraden", self.getDekkingsgraden)
 
     @property
     def countryexposure(self):
-        return self.getCountryExposure()
+        return self.getSnapshot("countryexposure", self.getCountryExposure)
 
     @property
     def dgr_prediction(self):
-        return self.getDGRPrediction()
+        return self.getSnapshot("dgr_prediction", self.getDGRPrediction)
 
     @property
     def dgr_contribution(self):
-        return self.getDGRContribution()
+        return self.getSnapshot("dgr_contribution", self.getDGRContribution)
+
+    @property
+    def latest(self):
+        return self.getSnapshot("latest", self.getLatest)
+
+    @property
+    def dgr_contribution_wide(self):
+        return self.getSnapshot("dgr_contribution_wide",
+                                self.getDGRContributionWide)
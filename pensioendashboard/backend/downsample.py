@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+
+# number of points per line that is sent to the browser; about the
+# width in pixels of the graphs on a large screen
+CHARTPOINTS = 1000
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Largest-triangle-three-buckets downsampling. Returns the (sorted)
+    positions of the `threshold` points that keep the visual shape of
+    the line: the first and last point, plus per bucket the point that
+    makes the largest triangle with the previous selected point and the
+    average of the next bucket.
+    """
+    _n = len(y)
+    if threshold >= _n or threshold < 3:
+        return np.arange(_n)
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    # threshold - 2 buckets between the first and the last point
+    _edges = np.linspace(1, _n - 1, threshold - 1).astype(int)
+    _indices = np.empty(threshold, dtype=int)
+    _indices[0] = 0
+    _indices[-1] = _n - 1
+
+    _a = 0
+    for i in range(threshold - 2):
+        _start, _end = _edges[i], _edges[i + 1]
+        _next = _edges[i + 2] if i + 2 < len(_edges) else _n
+
+        _avgx = x[_end:_next].mean()
+        _avgy = y[_end:_next].mean()
+
+        _area = np.abs((x[_a] - _avgx) * (y[_start:_end] - y[_a])
+                       - (x[_a] - x[_start:_end]) * (_avgy - y[_a]))
+        _a = _start + int(np.argmax(_area))
+        _indices[i + 1] = _a
+
+    return _indices
+
+
+def downsampleFrame(df: pd.DataFrame,
+                    threshold: int = CHARTPOINTS) -> pd.DataFrame:
+    """
+    Downsample every column of `df` with LTTB and keep the union of the
+    selected rows, so the lines in one graph share their x values.
+    """
+    if len(df) <= threshold:
+        return df
+
+    if isinstance(df.index, pd.DatetimeIndex):
+        _x = df.index.asi8.astype(float)
+    else:
+        _x = np.arange(len(df), dtype=float)
+
+    _keep = np.zeros(len(df), dtype=bool)
+    for column in df.columns:
+        _values = df[column].to_numpy(dtype=float)
+        _valid = np.flatnonzero(~np.isnan(_values))
+        _keep[_valid[lttb(_x[_valid], _values[_valid], threshold)]] = True
+
+    return df[_keep]
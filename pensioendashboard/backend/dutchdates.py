@@ -0,0 +1,127 @@
+import threading
+import logging as LOG
+import numpy as np
+import pandas as pd
+from collections import Counter
+
+# the Dutch month names, and their abbreviations, as used on the websites
+# of the funds and of IEX
+MONTHS = {"januari": 1, "jan": 1,
+          "februari": 2, "feb": 2,
+          "maart": 3, "mrt": 3, "mar": 3,
+          "april": 4, "apr": 4,
+          "mei": 5,
+          "juni": 6, "jun": 6,
+          "juli": 7, "jul": 7,
+          "augustus": 8, "aug": 8,
+          "september": 9, "sep": 9, "sept": 9,
+          "oktober": 10, "okt": 10,
+          "november": 11, "nov": 11,
+          "december": 12, "dec": 12}
+# e.g. 17-07-2020
+DAYFORMAT = "%d-%m-%Y"
+
+# number of strings parsed with the lookup table ("fast"), with
+# dateparser ("fallback") and that could not be parsed at all ("failed")
+COUNTERS = Counter()
+_COUNTERLOCK = threading.Lock()
+
+
+def count(key: str, number: int):
+    with _COUNTERLOCK:
+        COUNTERS[key] += number
+
+
+def normalize(values: pd.Series) -> pd.Series:
+    # lower case, without footnote marks (e.g. "Mei 2020*") and without
+    # the dots of abbreviations (e.g. "30 jun. 2020")
+    return values.astype(str).str.lower() \
+        .str.replace(r"[^0-9a-z\-/ ]", " ", regex=True) \
+        .str.split().str.join(" ")
+
+
+def monthStarts(years: np.ndarray, months: np.ndarray) -> np.ndarray:
+    return ((years - 1970) * 12 + months - 1).astype("datetime64[M]")
+
+
+def matchDays(values: pd.Series, format: str = DAYFORMAT) -> np.ndarray:
+    # "17-07-2020" in the given format, or "17 juli 2020"
+    _parsed = pd.to_datetime(values, format=format,
+                             errors="coerce").to_numpy()
+
+    _parts = values.str.extract(r"^(\d{1,2}) ([a-z]+) (\d{4})$")
+    _month = _parts[1].map(MONTHS).to_numpy(dtype=float)
+    _named = ~np.isnan(_month) & np.isnat(_parsed)
+
+    if _named.any():
+        _days = _parts[0].to_numpy()[_named].astype(int)
+        _start = monthStarts(_parts[2].to_numpy()[_named].astype(int),
+                             _month[_named].astype(int))
+        _dates = _start.astype("datetime64[D]") + (_days - 1)
+        # e.g. 31 juni does not exist
+        _valid = (_days >= 1) & (_dates.astype("datetime64[M]") == _start)
+        _parsed[_named] = np.where(_valid, _dates, np.datetime64("NaT"))
+
+    return _parsed
+
+
+def matchMonths(values: pd.Series, monthend: bool = True) -> np.ndarray:
+    # "februari 2020", as the last (or first) day of the month
+    _parts = values.str.extract(r"^([a-z]+) (\d{4})$")
+    _month = _parts[0].map(MONTHS).to_numpy(dtype=float)
+    _parsed = np.full(len(values), np.datetime64("NaT"),
+                      dtype="datetime64[ns]")
+
+    _known = ~np.isnan(_month)
+    if _known.any():
+        _start = monthStarts(_parts[1].to_numpy()[_known].astype(int),
+                             _month[_known].astype(int))
+        _parsed[_known] = (_start + 1).astype("datetime64[D]") - 1 \
+            if monthend else _start.astype("datetime64[D]")
+
+    return _parsed
+
+
+def fallback(values: pd.Series, monthend: bool = True) -> np.ndarray:
+    # dateparser is slow to import and to run, so only used for the
+    # strings that are not in the lookup table
+    from dateparser import parse
+
+    LOG.info("Parsing dates {} with dateparser".format(list(values)))
+    _settings = {"PREFER_DAY_OF_MONTH": "last" if monthend else "first"}
+
+    return pd.to_datetime(values.apply(
+        lambda value: parse(value, languages=["nl"], settings=_settings))
+        ).to_numpy(dtype="datetime64[ns]")
+
+
+def parseDates(values: pd.Series, format: str = DAYFORMAT,
+               monthend: bool = True) -> pd.Series:
+    """
+    Parse the dates in `values` at once: days in the given format or with
+    a Dutch month name, and months ("Februari 2020"), which become the
+    last day of the month (or the first, if not `monthend`). Only the
+    strings that do not match are handed over to dateparser.
+    """
+    _values = pd.Series(values)
+    _present = _values.notna().to_numpy()
+    _normalized = normalize(_values[_present])
+
+    _parsed = np.full(len(_values), np.datetime64("NaT"),
+                      dtype="datetime64[ns]")
+    _parsed[_present] = matchDays(_normalized, format)
+
+    _missing = _present & np.isnat(_parsed)
+    if _missing.any():
+        _parsed[_missing] = matchMonths(_normalized[_missing[_present]],
+                                        monthend)
+
+    _missing = _present & np.isnat(_parsed)
+    count("fast", int(_present.sum() - _missing.sum()))
+    if _missing.any():
+        count("fallback", int(_missing.sum()))
+        _parsed[_missing] = fallback(_values[_missing].astype(str),
+                                     monthend)
+        count("failed", int((_present & np.isnat(_parsed)).sum()))
+
+    return pd.Series(_parsed, index=_values.index)
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+import lxml.html
+
+try:
+    from .dutchdates import parseDates
+except ImportError:
+    from dutchdates import parseDates
+
+
+def parseHTML(html: str):
+    return lxml.html.fromstring(html)
+
+
+def cellText(element) -> str:
+    # the text of an element, with the whitespace collapsed
+    return " ".join(element.text_content().split())
+
+
+def readTable(document, column: str) -> dict:
+    """
+    The first table of the document that has a header cell `column`, as
+    a dict with a list of cell texts per header. Missing cells are empty
+    strings.
+    """
+    _tables = document.xpath(
+        "//table[.//tr[1]/*[normalize-space() = $column]]", column=column)
+    if not _tables:
+        raise ValueError("No table with column {}".format(column))
+
+    _rows = [[cellText(cell) for cell in row.xpath("./th|./td")]
+             for row in _tables[0].xpath(".//tr")]
+    _header, _body = _rows[0], _rows[1:]
+
+    return {name: [row[i] if i < len(row) else "" for row in _body]
+            for i, name in enumerate(_header)}
+
+
+def readTexts(document, xpath: str) -> list:
+    return [cellText(element) for element in document.xpath(xpath)]
+
+
+def parsePercentages(values: list) -> np.ndarray:
+    # e.g. "98,2%" or "98,2%*" to 0.982; empty cells become nan
+    return pd.to_numeric(
+        pd.Series(values, dtype=str)
+        .str.replace(r"[%*\s]", "", regex=True)
+        .str.replace(",", ".", regex=False),
+        errors="coerce").to_numpy(dtype=float) / 100
+
+
+def buildFrame(name: str, dates: list, values: list) -> pd.DataFrame:
+    """
+    The dekkingsgraden of fund `name` in the format of the db: the
+    columns date (datetime), name and value (as a fraction). Rows without
+    a date or a value are left out.
+    """
+    _values = parsePercentages(values)
+    _present = ~np.isnan(_values) & np.array(
+        [bool(date) for date in dates], dtype=bool)
+
+    _dates = [date for date, present in zip(dates, _present) if present]
+
+    return pd.DataFrame({
+        "date": parseDates(pd.Series(_dates, dtype=object)).to_numpy(),
+        "name": name,
+        "value": _values[_present]})
@@ -0,0 +1,211 @@
+import pandas as pd
+import requests
+import json
+import os
+import logging as LOG
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from .dutchdates import parseDates
+    from .extraction import parseHTML, readTable, readTexts, buildFrame
+except ImportError:
+    from dutchdates import parseDates
+    from extraction import parseHTML, readTable, readTexts, buildFrame
+
+# timeout in seconds per website, for connecting and for reading
+TIMEOUT = (5, 20)
+
+
+def transformMonthsToDate(df: pd.DataFrame) -> pd.DataFrame:
+    # months (e.g. "Februari 2020") become the last day of the month,
+    # see dutchdates.py
+    _df_return = df.copy()
+    _df_return["date"] = parseDates(df["date"])
+
+    return _df_return
+
+
+class FundSource:
+    """
+    A website that publishes the dekkingsgraden of a pension fund. A new
+    fund is added by subclassing FundSource and adding an instance to
+    SOURCES; fetching is done by the SourceCollector.
+    """
+    name = None
+    url = None
+
+    def parse(self, html: str) -> pd.DataFrame:
+        """
+        Turn the html of the website into a df with the columns date,
+        name and value, with value as a fraction (0.95 for 95%).
+        """
+        raise NotImplementedError
+
+
+class HTMLTableSource(FundSource):
+    """
+    A website with the dekkingsgraden in a html table: one column with
+    the months and one with the percentages.
+    """
+    datecolumn = None
+    valuecolumn = None
+
+    def select(self, dates: list, values: list):
+        # the rows of the table that hold a dekkingsgraad
+        return dates, values
+
+    def parse(self, html: str) -> pd.DataFrame:
+        _table = readTable(parseHTML(html), self.datecolumn)
+        _dates, _values = self.select(_table[self.datecolumn],
+                                      _table[self.valuecolumn])
+
+        return buildFrame(self.name, _dates, _values)
+
+
+class ABPSource(HTMLTableSource):
+    name = "ABP"
+    url = "https://www.abp.nl/over-abp/financiele-situatie/dekkingsgraad/"
+    datecolumn = "Maanden"
+    valuecolumn = "Dekkingsgraad"
+
+    def select(self, dates: list, values: list):
+        # drop last value, given that is the "Beleidsdekkingsgraad"
+        return dates[:-1], values[:-1]
+
+
+class PFZWSource(FundSource):
+    name = "PFZW"
+    url = "https://www.pfzw.nl/over-ons/dit-presteren-we/dekkingsgraad.html"
+
+    def parse(self, html: str) -> pd.DataFrame:
+        # PFZW does not publish the dekkingsgraden as a table, but as
+        # the heads of collapsible items, for instance "Februari 2020 90,0%"
+        _texts = readTexts(parseHTML(html),
+                           "//span[@slot='pfzw-collapsible--head']")
+        _split = [text.rsplit(" ", 1) for text in _texts]
+
+        return buildFrame(self.name,
+                          [split[0] for split in _split],
+                          [split[-1] for split in _split])
+
+
+class BouwSource(HTMLTableSource):
+    name = "BPF Bouw"
+    url = "https://www.bpfbouw.nl/over-bpfbouw/financiele-situatie/" \
+        "overzicht-beleidsdekkingsgraad.aspx"
+    datecolumn = "Datum"
+    valuecolumn = "Dekkingsgraad"
+
+
+class PMTSource(HTMLTableSource):
+    # as of 2020-07-20, PMT does publish its numbers
+    # through a table, which is different than before
+    name = "PMT"
+    url = "https://www.pmt.nl/dekkingsgraden"
+    datecolumn = "Maanden"
+    # we are not interested in the Beleidsdekkingsgraad
+    valuecolumn = "Actuele dekkingsgraad"
+
+
+SOURCES = [ABPSource(), PFZWSource(), BouwSource(), PMTSource()]
+
+
+class SourceCollector:
+    """
+    Fetch the websites of the fund sources concurrently. When a cache
+    directory is given, the ETag and Last-Modified headers of each site
+    are kept, so that an unchanged page is neither downloaded nor parsed
+    again (the website answers with 304 Not Modified).
+    """
+
+    def __init__(self,
+                 sources: list = SOURCES,
+                 cachedir: str = None,
+                 timeout=TIMEOUT):
+        self.sources = sources
+        self.cachedir = cachedir
+        self.timeout = timeout
+
+        if self.cachedir is not None:
+            os.makedirs(self.cachedir, exist_ok=True)
+
+    def cacheLocation(self, source: FundSource, ext: str) -> str:
+        return os.path.join(self.cachedir, "{}.{}".format(
+            source.name.lower().replace(" ", "_"), ext))
+
+    def readCache(self, source: FundSource):
+        # returns the validators and the parsed df of the previous fetch
+        try:
+            with open(self.cacheLocation(source, "json")) as f:
+                _headers = json.load(f)
+            _df = pd.read_csv(self.cacheLocation(source, "csv"),
+                              parse_dates=["date"])
+            return _headers, _df
+        except (OSError, ValueError):
+            return {}, None
+
+    def writeCache(self, source: FundSource, response, df: pd.DataFrame):
+        _headers = {"ETag": response.headers.get("ETag"),
+                    "Last-Modified": response.headers.get("Last-Modified")}
+
+        if not any(_headers.values()):
+            return
+
+        df.to_csv(self.cacheLocation(source, "csv"), index=False)
+        with open(self.cacheLocation(source, "json"), "w") as f:
+            json.dump(_headers, f)
+
+    def fetch(self, source: FundSource) -> pd.DataFrame:
+        LOG.info("Retrieving latest dekkingsgraad from website {}".format(
+            source.name))
+
+        _headers = {}
+        _df_cache = None
+        if self.cachedir is not None:
+            _validators, _df_cache = self.readCache(source)
+            if _df_cache is not None:
+                if _validators.get("ETag"):
+                    _headers["If-None-Match"] = _validators["ETag"]
+                if _validators.get("Last-Modified"):
+                    _headers["If-Modified-Since"] = \
+                        _validators["Last-Modified"]
+
+        _response = requests.get(source.url, headers=_headers,
+                                 timeout=self.timeout)
+
+        if _response.status_code == 304 and _df_cache is not None:
+            LOG.info("Website {} is unchanged since the last "
+                     "run".format(source.name))
+            return _df_cache
+
+        _response.raise_for_status()
+        _df = source.parse(_response.text)
+
+        if self.cachedir is not None:
+            self.writeCache(source, _response, _df)
+
+        LOG.info("Successfully retrieved latest dekkingsgraad "
+                 "from website {}".format(source.name))
+
+        return _df
+
+    def collect(self) -> dict:
+        """
+        Fetch all sources at the same time. Returns a dict with the df
+        per fund; funds whose website failed are logged and left out.
+        """
+        _results = {}
+
+        with ThreadPoolExecutor(max_workers=len(self.sources) or 1) \
+                as executor:
+            _futures = {source.name: executor.submit(self.fetch, source)
+                        for source in self.sources}
+
+            for name, future in _futures.items():
+                try:
+                    _results[name] = future.result()
+                except Exception as err:
+                    LOG.error("Retrieving dekkingsgraad from {} result "
+                              "in error: {}".format(name, err))
+
+        return _results
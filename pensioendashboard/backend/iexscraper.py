@@ -0,0 +1,106 @@
+import pandas as pd
+import os
+import logging as LOG
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from .dutchdates import parseDates
+except ImportError:
+    from dutchdates import parseDates
+
+# number of months that are downloaded at the same time
+MAXWORKERS = 4
+# date format used in the history tables of IEX, e.g. 17-07-2020
+IEXDATEFORMAT = "%d-%m-%Y"
+
+
+def parseIEXDates(dates: pd.Series) -> pd.Series:
+    """
+    Parse the dates of an IEX history table in one go. Only strings that
+    do not match the fixed format are handed over to dateparser.
+    """
+    return parseDates(dates, IEXDATEFORMAT, monthend=False)
+
+
+class IEXHistory:
+    """
+    Scraper for the monthly history pages of IEX. Months are fetched
+    concurrently. Months that are closed (i.e. before the current month)
+    can no longer change, so these are cached on disk per ticker and
+    month.
+    """
+
+    def __init__(self,
+                 ticker: str,
+                 link: str,
+                 cachedir: str = None,
+                 max_workers: int = MAXWORKERS):
+        self.ticker = ticker
+        self.link = link
+        self.cachedir = cachedir
+        self.max_workers = max_workers
+
+        if self.cachedir is not None:
+            os.makedirs(self.cachedir, exist_ok=True)
+
+    def cacheLocation(self, month: str) -> str:
+        return os.path.join(self.cachedir,
+                            "{}_{}.csv".format(self.ticker, month))
+
+    def isClosed(self, month: str) -> bool:
+        return month < pd.Timestamp("today").strftime("%Y%m")
+
+    def readMonth(self, month: str) -> pd.DataFrame:
+        # the link requires a "yyyymm" extension in order
+        # to get the history of a specific year and month
+        _df = pd.read_html(self.link.format(month),
+                           decimal=",",
+                           thousands=".")[0][["Datum", "Slot"]]
+
+        _df["Datum"] = parseIEXDates(_df["Datum"])
+        _df.rename(columns={"Datum": "date",
+                            "Slot": "value"}, inplace=True)
+
+        return _df
+
+    def fetchMonth(self, month: str) -> pd.DataFrame:
+        _cached = self.cachedir is not None and self.isClosed(month)
+
+        if _cached and os.path.isfile(self.cacheLocation(month)):
+            return pd.read_csv(self.cacheLocation(month),
+                               parse_dates=["date"])
+
+        _df = self.readMonth(month)
+
+        if _cached:
+            # write to a temporary file first, so that a crash never
+            # leaves a partial month in the cache
+            _tmp = "{}.{}.tmp".format(self.cacheLocation(month), os.getpid())
+            _df.to_csv(_tmp, index=False)
+            os.replace(_tmp, self.cacheLocation(month))
+
+        return _df
+
+    def fetch(self, start_date, end_date=None) -> pd.DataFrame:
+        """
+        Get the history from the month of start_date up to and including
+        the month of end_date (default: today).
+        """
+        if end_date is None:
+            end_date = pd.Timestamp("today")
+
+        _months = pd.period_range(pd.Timestamp(start_date),
+                                  pd.Timestamp(end_date),
+                                  freq="M").strftime("%Y%m")
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            _frames = list(executor.map(self.fetchMonth, _months))
+
+        LOG.info("Retrieved {} months of IEX history for {}".format(
+            len(_months), self.ticker))
+
+        _df = pd.concat(_frames, ignore_index=True) if _frames \
+            else pd.DataFrame(columns=["date", "value"])
+        _df["name"] = self.ticker
+
+        return _df.set_index("date").sort_index()
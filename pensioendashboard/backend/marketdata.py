@@ -1,20 +1,22 @@
 import pandas as pd
 import numpy as np
-from alpha_vantage.timeseries import TimeSeries
-from alpha_vantage.foreignexchange import ForeignExchange
-from dateutil.relativedelta import relativedelta
 import logging as LOG
 import os
-from dateparser import parse
 
 # for some reason, pytest and my python interpretor have
 # inconsistencies in the way the __init__ module should
 # be imported
 try:
-    from .__init__ import LOGLOCATION, DBCONNECTION
+    from .__init__ import LOGLOCATION, DBCONNECTION, CACHELOCATION
+    from .widetable import updateWideTable
+    from .iexscraper import IEXHistory
+    from .alphavantage import AlphaVantage
 except ImportError:
     try:
-        from __init__ import LOGLOCATION, DBCONNECTION
+        from __init__ import LOGLOCATION, DBCONNECTION, CACHELOCATION
+        from widetable import updateWideTable
+        from iexscraper import IEXHistory
+        from alphavantage import AlphaVantage
     except Exception as e:
         LOG.error(
             "Marketdata.py: Error while importing the __init__: {}".format(e))
@@ -59,61 +61,49 @@ class MarketData:
     def __init__(self):
         try:
             LOG.info("Start MarketData object")
-            _query = "SELECT date, name, value FROM marketdata"
+            # only the latest date per ticker is needed to determine
+            # which data is missing, so no need to load the full history
+            _query = "SELECT name, MAX(date) AS date FROM marketdata " \
+                "GROUP BY name"
 
             self.conn = DBCONNECTION
-            self.df_db = pd.read_sql(sql=_query,
-                                     con=self.conn,
-                                     index_col="date",
-                                     parse_dates={"date": "%Y-%m-%d"})
-            self.df_db = self.df_db.pivot_table(values="value",
-                                                index="date",
-                                                columns="name")
-            self.df_db.sort_index(inplace=True)
-            self.ts = TimeSeries(key=ALPHAVANTAGE_API,
-                                 output_format="pandas",
-                                 indexing_type="date")
-            self.cc = ForeignExchange(key=ALPHAVANTAGE_API)
+            self.df_latest = pd.read_sql(sql=_query,
+                                         con=self.conn,
+                                         index_col="name",
+                                         parse_dates={"date": "%Y-%m-%d"}
+                                         )["date"]
+            self.av = AlphaVantage(ALPHAVANTAGE_API,
+                                   cachedir=os.path.join(CACHELOCATION,
+                                                         "alphavantage"))
         except Exception as err:
             LOG.error("Unable to load MarketData object: {}".format(err))
 
     # for the EQUITYTICKER list
     # and FXTICKER
     def UpdateEquityAndFX(self):
-        # first, get the EQUITYTICKER
         try:
-            for ticker in EQUITYTICKER:
-                # get the daily quotes, compact size
-                LOG.info("Getting new data for ticker {}".format(ticker))
-                _df, _ = self.ts.get_daily(ticker, outputsize="compact")
-                _df = pd.DataFrame(_df["4. close"]).rename(
-                    columns={"4. close": "value"})
-                # add ticker name to the dataframe as a column
-                _df["name"] = ticker
+            # all equity and fx series are requested at the same time,
+            # within the quota of the api key
+            _symbols = {ticker: {"function": "TIME_SERIES_DAILY",
+                                 "symbol": ticker}
+                        for ticker in EQUITYTICKER}
+            for fx in FXTICKER:
+                _symbols["EUR{}".format(fx)] = {"function": "FX_DAILY",
+                                                "from_symbol": "EUR",
+                                                "to_symbol": fx}
+
+            LOG.info("Getting new data for tickers {}".format(
+                list(_symbols)))
+            _results = self.av.getAll(_symbols, self.getLatestDate)
 
+            for ticker in EQUITYTICKER:
                 _df_fallback = self.IEXScraper(ticker, EQUITYTICKER[ticker])
 
-                self.ProcessToDB(_df, ticker, _df_fallback)
+                self.ProcessToDB(_results[ticker], ticker, _df_fallback)
 
-            # secon, get the FXTICKER
             for fx in FXTICKER:
-                # for fx, Alphavantage returns only json, so need to convert
-                # to pandas
-                _json = self.cc.get_currency_exchange_daily(
-                    from_symbol="EUR",
-                    to_symbol=fx,
-                    outputsize="compact")
-                # add check whether _json returns data...
-                _df = pd.DataFrame(data=_json[0], dtype=float).transpose()
-                _df = pd.DataFrame(_df["4. close"]).rename(
-                    columns={"4. close": "value"})
-                _df["name"] = "EUR{}".format(fx)
-
-                # reformat the index, to be in line with equities
-                _df.index = pd.to_datetime(_df.index)
-                _df.index.name = "date"
-
-                self.ProcessToDB(_df, "EUR{}".format(fx), pd.DataFrame())
+                self.ProcessToDB(_results["EUR{}".format(fx)],
+                                 "EUR{}".format(fx), pd.DataFrame())
         except Exception as err:
             LOG.error("Updating equity and FX result in error: {}".format(err))
 
@@ -129,50 +119,36 @@ class MarketData:
 
     def IEXScraper(self, ticker, link) -> pd.DataFrame:
         # this is a IEX website scraper
-        # determine last data point
-        # is this last data point in the current month?
-        # otherwise include suffix to webaddress equal
-        # to number of months before
+        # determine last data point, and get all months from the month
+        # of the last data point up to the current month
         try:
             if link is not None:
-                _max_date = self.df_db[ticker].dropna().index.max()
+                _max_date = self.getLatestDate(ticker)
                 _today = pd.to_datetime("today")
 
-                # determine the number of months required to download
-                _numbermonths = (_today.year * 12) - (_max_date.year * 12) + \
-                    _today.month - _max_date.month
-
-                _df_return = pd.DataFrame()
-
-                for x in range(0, _numbermonths+1):
-                    # the link requires a "yyymm" extension in order
-                    # to get the history of a specific year and month
-                    # so, determine the extension
-                    _query = (_today - relativedelta(months=x)).strftime(
-                        "%Y%m")
-                    _df = pd.read_html(link.format(
-                                    _query),
-                                    decimal=",",
-                                    thousands=".")[0][["Datum", "Slot"]]
+                # for a new ticker, only start with the current month
+                if _max_date == pd.Timestamp.min:
+                    _max_date = _today
 
-                    # format the date string to a datetime64 object
-                    # using dateparser library
-                    _df["Datum"] = _df["Datum"].apply(parse)
-
-                    _df.rename(columns={"Datum": "date",
-                                        "Slot": "value"}, inplace=True)
-                    _df.set_index("date", inplace=True)
-                    _df["name"] = ticker
-
-                    _df_return = _df_return.append(_df)
-
-                return _df_return
+                _scraper = IEXHistory(ticker, link,
+                                      cachedir=os.path.join(CACHELOCATION,
+                                                            "iex"))
+                return _scraper.fetch(_max_date, _today)
             else:
                 return pd.DataFrame()  # empty dataframe if no link is provided
 
         except Exception as err:
             LOG.error("IEXScraper resulted in an error: {}".format(
                 err))
+            return pd.DataFrame()
+
+    def getLatestDate(self, ticker) -> pd.Timestamp:
+        # latest date in the db for the ticker. For a new ticker, all
+        # available data is considered to be missing
+        if ticker in self.df_latest.index:
+            return self.df_latest[ticker]
+        else:
+            return pd.Timestamp.min
 
     def ProcessToDB(self, df_source: pd.DataFrame, ticker,
                     df_fallback: pd.DataFrame):
@@ -193,7 +169,7 @@ class MarketData:
             # we can do this by a outer join, or just say
             # pick all dates from Alphavintage that are beyond the latest
             # date of the db.
-            _max_date = self.df_db[ticker].dropna().index.max()
+            _max_date = self.getLatestDate(ticker)
             _df = df_source[df_source.index > _max_date]
             _df_fallback = df_fallback[df_fallback.index > _max_date]
             # exclude today's value, for now?
@@ -225,10 +201,18 @@ class MarketData:
                 # write to database
                 _df_write = _df_write.reset_index()
                 _df_write["date"] = _df_write["date"].dt.strftime("%Y-%m-%d")
-                _df_write.to_sql(name="marketdata",
-                                 con=self.conn,
-                                 index=False,
-                                 if_exists="append")
+
+                # the new rows and the matching update of the wide
+                # table are written in one transaction
+                with self.conn.begin() as con:
+                    _df_write.to_sql(name="marketdata",
+                                     con=con,
+                                     index=False,
+                                     if_exists="append")
+                    updateWideTable(con, _df_write["date"].min())
+
+                self.df_latest[ticker] = pd.to_datetime(
+                    _df_write["date"].max())
                 LOG.info("Successfully updated ticker {} with dates {} "
                          "and values {}".format(ticker,
                                                 _df_write["date"].values,
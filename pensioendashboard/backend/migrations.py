@@ -0,0 +1,177 @@
+import logging as LOG
+
+# Versioned schema migrations for the sqlite db. The schema version is
+# stored in the user_version pragma of the db; each migration with a
+# higher version than the db is applied in order. All statements are
+# idempotent, so a migration that was interrupted can simply be rerun.
+MIGRATIONS = [
+    (1,
+     "indexes, uniqueness constraints and sargable date_run",
+     [
+        # tables that are created by pandas in the backend, or that
+        # are missing in older copies of the db
+        """CREATE TABLE IF NOT EXISTS data_version (
+            id INTEGER NOT NULL PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL)""",
+        """INSERT OR IGNORE INTO data_version (id, version) VALUES (1, 0)""",
+        """CREATE TABLE IF NOT EXISTS dgr_prediction (
+            date TEXT, value REAL, fund TEXT, date_run TEXT)""",
+        """CREATE TABLE IF NOT EXISTS dgr_contribution (
+            date TEXT, date_run TEXT, fund TEXT, "index" TEXT,
+            value REAL)""",
+        """CREATE TABLE IF NOT EXISTS country_exposures (
+            date TEXT, fund TEXT, country TEXT, value REAL)""",
+
+        # marketdata: one value per ticker per date
+        """DELETE FROM marketdata WHERE id NOT IN (
+            SELECT MAX(id) FROM marketdata GROUP BY name, date)""",
+        """CREATE UNIQUE INDEX IF NOT EXISTS marketdata_name_date
+            ON marketdata (name, date)""",
+        """CREATE INDEX IF NOT EXISTS marketdata_date
+            ON marketdata (date, name, value)""",
+
+        # dekkingsgraad: one value per fund per date
+        """DELETE FROM dekkingsgraad WHERE id NOT IN (
+            SELECT MAX(id) FROM dekkingsgraad GROUP BY name, date)""",
+        """CREATE UNIQUE INDEX IF NOT EXISTS dekkingsgraad_name_date
+            ON dekkingsgraad (name, date)""",
+        """DROP INDEX IF EXISTS pf_index""",
+
+        # date_run is stored as 'yyyy-mm-dd hh:mm:ss' text, so that it
+        # can be compared directly instead of through date()
+        """UPDATE dgr_prediction
+            SET date_run = strftime('%Y-%m-%d %H:%M:%S', date_run)
+            WHERE date_run IS NOT strftime('%Y-%m-%d %H:%M:%S', date_run)""",
+        """UPDATE dgr_contribution
+            SET date_run = strftime('%Y-%m-%d %H:%M:%S', date_run)
+            WHERE date_run IS NOT strftime('%Y-%m-%d %H:%M:%S', date_run)""",
+        """DELETE FROM dgr_prediction WHERE rowid NOT IN (
+            SELECT MAX(rowid) FROM dgr_prediction
+            GROUP BY fund, date_run, date)""",
+        """DELETE FROM dgr_contribution WHERE rowid NOT IN (
+            SELECT MAX(rowid) FROM dgr_contribution
+            GROUP BY fund, date_run, date, "index")""",
+        """CREATE UNIQUE INDEX IF NOT EXISTS dgr_prediction_fund_run
+            ON dgr_prediction (fund, date_run, date)""",
+        """CREATE INDEX IF NOT EXISTS dgr_prediction_run
+            ON dgr_prediction (date_run)""",
+        """CREATE UNIQUE INDEX IF NOT EXISTS dgr_contribution_fund_run
+            ON dgr_contribution (fund, date_run, date, "index")""",
+        """CREATE INDEX IF NOT EXISTS dgr_contribution_run
+            ON dgr_contribution (date_run)""",
+
+        # the latest run per fund, looked up through the indexes above
+        """DROP VIEW IF EXISTS dgr_prediction_latest""",
+        """CREATE VIEW dgr_prediction_latest AS
+            SELECT p.date, p.fund, p.value, p.date_run
+            FROM (SELECT fund, MAX(date_run) AS date_run
+                  FROM dgr_prediction GROUP BY fund) AS l
+            JOIN dgr_prediction AS p
+                ON p.fund = l.fund AND p.date_run = l.date_run""",
+        """DROP VIEW IF EXISTS dgr_contribution_latest""",
+        """CREATE VIEW dgr_contribution_latest AS
+            SELECT c.date, c.fund, c."index", c.value, c.date_run
+            FROM (SELECT fund, MAX(date_run) AS date_run
+                  FROM dgr_contribution GROUP BY fund) AS l
+            JOIN dgr_contribution AS c
+                ON c.fund = l.fund AND c.date_run = l.date_run""",
+     ]),
+    (2,
+     "state of the incremental prediction",
+     [
+        """CREATE TABLE IF NOT EXISTS dgr_prediction_state (
+            fund TEXT NOT NULL PRIMARY KEY,
+            date_run TEXT NOT NULL,
+            base_date TEXT NOT NULL,
+            base_value REAL NOT NULL,
+            base_prices TEXT NOT NULL,
+            model_key TEXT NOT NULL,
+            last_date TEXT NOT NULL)""",
+     ]),
+    (3,
+     "current predictions and contributions instead of full runs",
+     [
+        # one row per fund per date; replaced by a full run, upserted
+        # by an incremental run
+        """CREATE TABLE IF NOT EXISTS dgr_prediction_current (
+            fund TEXT NOT NULL,
+            date TEXT NOT NULL,
+            value REAL,
+            PRIMARY KEY (fund, date))""",
+        """INSERT OR REPLACE INTO dgr_prediction_current (fund, date, value)
+            SELECT fund, date, value FROM dgr_prediction_latest""",
+
+        # compact history: only the latest prediction of each run
+        """CREATE TABLE IF NOT EXISTS dgr_prediction_history (
+            date_run TEXT NOT NULL,
+            fund TEXT NOT NULL,
+            date TEXT NOT NULL,
+            value REAL,
+            PRIMARY KEY (fund, date_run))""",
+        """CREATE INDEX IF NOT EXISTS dgr_prediction_history_run
+            ON dgr_prediction_history (date_run)""",
+        """INSERT OR REPLACE INTO dgr_prediction_history
+            (date_run, fund, date, value)
+            SELECT date_run, fund, MAX(date), value FROM dgr_prediction
+            GROUP BY fund, date_run""",
+
+        # one column per risk factor, which are added by the backend
+        # when it writes the contributions
+        """CREATE TABLE IF NOT EXISTS dgr_contribution_current (
+            fund TEXT NOT NULL,
+            date TEXT NOT NULL,
+            PRIMARY KEY (fund, date))""",
+
+        # the state refers to runs in the old table, so start with a
+        # full run
+        """DELETE FROM dgr_prediction_state""",
+
+        """DROP VIEW IF EXISTS dgr_prediction_latest""",
+        """DROP VIEW IF EXISTS dgr_contribution_latest""",
+        """DROP TABLE IF EXISTS dgr_prediction""",
+        """DROP TABLE IF EXISTS dgr_contribution""",
+     ]),
+    (4,
+     "state of the stages of the backend pipeline",
+     [
+        # per stage the fingerprint of its inputs at the last successful
+        # run and how long that run took, see pipeline.py
+        """CREATE TABLE IF NOT EXISTS pipeline_state (
+            stage TEXT NOT NULL PRIMARY KEY,
+            fingerprint TEXT,
+            date_run TEXT,
+            seconds REAL)""",
+     ]),
+]
+
+
+def getSchemaVersion(con) -> int:
+    return con.execute("PRAGMA user_version").scalar()
+
+
+def migrate(engine):
+    """
+    Bring the schema of the db behind `engine` to the latest version.
+    """
+    try:
+        with engine.connect() as con:
+            _current = getSchemaVersion(con)
+
+        for version, description, statements in MIGRATIONS:
+            if version <= _current:
+                continue
+
+            LOG.info("Applying db migration {}: {}".format(version,
+                                                           description))
+            with engine.begin() as con:
+                for statement in statements:
+                    con.execute(statement)
+                con.execute("PRAGMA user_version = {:d}".format(version))
+
+            _current = version
+
+        LOG.info("Db schema is at version {}".format(_current))
+
+    except Exception as err:
+        LOG.error("Migrating the db resulted in an error: {}".format(err))
+        raise
@@ -0,0 +1,166 @@
+import time
+import logging as LOG
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+# number of stages that may run at the same time. Most stages wait on
+# websites and apis, not on the cpu
+MAXWORKERS = 6
+
+# the outcome of a stage in Pipeline.status
+DONE = "done"
+SKIPPED = "skipped"
+FAILED = "failed"
+UPSTREAMFAILED = "upstream failed"
+
+
+class Stage:
+    """
+    A step of the backend run. `func` is called without arguments once
+    all the stages in `after` are finished. If a `fingerprint` is given,
+    it is called first and should return a string that describes the
+    inputs of the stage (e.g. row counts and last dates); the stage is
+    skipped when this is the same as at its last successful run.
+
+    A stage fails when `func` raises, or when it returns False (for
+    steps that log their errors instead of raising them).
+    """
+
+    def __init__(self, name: str, func, after: list = (),
+                 fingerprint=None):
+        self.name = name
+        self.func = func
+        self.after = list(after)
+        self.fingerprint = fingerprint
+
+
+class Pipeline:
+    """
+    Runs a set of stages in the order of their dependencies. Stages that
+    do not depend on each other run at the same time in a thread pool.
+    The fingerprint and duration of each successful stage are stored in
+    the pipeline_state table of the db (see migration 4).
+    """
+
+    def __init__(self, stages: list, engine, maxworkers: int = MAXWORKERS):
+        self.stages = {stage.name: stage for stage in stages}
+        self.engine = engine
+        self.maxworkers = maxworkers
+        self.status = {}
+        self.timings = {}
+
+        for stage in stages:
+            for name in stage.after:
+                if name not in self.stages:
+                    raise ValueError("Stage {} depends on unknown stage "
+                                     "{}".format(stage.name, name))
+        self.checkCycles()
+
+    def checkCycles(self):
+        _done = set()
+        _remaining = dict(self.stages)
+        while _remaining:
+            _ready = [name for name, stage in _remaining.items()
+                      if set(stage.after) <= _done]
+            if not _ready:
+                raise ValueError("The stages {} depend on each other".format(
+                    ", ".join(sorted(_remaining))))
+            for name in _ready:
+                _done.add(name)
+                del _remaining[name]
+
+    def getFingerprint(self, name: str):
+        try:
+            with self.engine.connect() as con:
+                return con.execute(
+                    "SELECT fingerprint FROM pipeline_state WHERE stage = ?",
+                    (name, )).scalar()
+        except Exception as err:
+            # e.g. the table does not exist yet, before the migration
+            LOG.info("No pipeline state found for {}: {}".format(name, err))
+            return None
+
+    def saveState(self, name: str, fingerprint, seconds: float):
+        try:
+            with self.engine.begin() as con:
+                con.execute(
+                    "INSERT OR REPLACE INTO pipeline_state "
+                    "(stage, fingerprint, date_run, seconds) "
+                    "VALUES (?, ?, ?, ?)",
+                    (name, fingerprint,
+                     datetime.now().strftime("%Y-%m-%d %H:%M:%S"), seconds))
+        except Exception as err:
+            LOG.error("Saving the pipeline state of {} resulted in an "
+                      "error: {}".format(name, err))
+
+    def runStage(self, stage: Stage) -> str:
+        _start = time.perf_counter()
+
+        _fingerprint = None
+        if stage.fingerprint is not None:
+            _fingerprint = stage.fingerprint()
+            if _fingerprint == self.getFingerprint(stage.name):
+                LOG.info("Skipping stage {}: its inputs have not "
+                         "changed".format(stage.name))
+                self.timings[stage.name] = time.perf_counter() - _start
+                return SKIPPED
+
+        LOG.info("Start stage {}".format(stage.name))
+        _result = stage.func()
+
+        self.timings[stage.name] = time.perf_counter() - _start
+        if _result is False:
+            # no state is saved, so the stage runs again next time
+            raise RuntimeError("Stage {} did not succeed".format(stage.name))
+        LOG.info("Finished stage {} in {:.1f}s".format(
+            stage.name, self.timings[stage.name]))
+        self.saveState(stage.name, _fingerprint, self.timings[stage.name])
+
+        return DONE
+
+    def run(self) -> dict:
+        """
+        Run all stages and return the status per stage. A stage that
+        raises (or returns False) is logged as failed and the stages that
+        depend on it are not run; the other stages continue.
+        """
+        self.status = {}
+        self.timings = {}
+        _start = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=self.maxworkers) as executor:
+            _running = {}
+
+            while len(self.status) < len(self.stages):
+                for name, stage in self.stages.items():
+                    if name in self.status or name in _running.values():
+                        continue
+                    _after = [self.status.get(dep) for dep in stage.after]
+                    if any(s in (FAILED, UPSTREAMFAILED) for s in _after):
+                        LOG.error("Not running stage {}, since a stage it "
+                                  "depends on failed".format(name))
+                        self.status[name] = UPSTREAMFAILED
+                    elif all(s in (DONE, SKIPPED) for s in _after):
+                        _running[executor.submit(self.runStage,
+                                                 stage)] = name
+
+                if not _running:
+                    continue
+
+                _finished, _ = wait(_running, return_when=FIRST_COMPLETED)
+                for future in _finished:
+                    name = _running.pop(future)
+                    try:
+                        self.status[name] = future.result()
+                    except Exception as err:
+                        LOG.error("Stage {} resulted in an error: {}".format(
+                            name, err))
+                        self.status[name] = FAILED
+
+        LOG.info("Pipeline finished in {:.1f}s: {}".format(
+            time.perf_counter() - _start,
+            ", ".join("{} {} ({:.1f}s)".format(
+                name, self.status[name], self.timings.get(name, 0))
+                for name in self.stages)))
+
+        return self.status
@@ -1,18 +1,222 @@
 import pandas as pd
+import numpy as np
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import r2_score
 from sklearn.preprocessing import StandardScaler
 from sklearn.compose import TransformedTargetRegressor
 from sklearn.linear_model import LinearRegression
 import logging as LOG
-from __init__ import LOGLOCATION, DBCONNECTION
+import os
+import json
+import hashlib
 from datetime import datetime
+from sqlalchemy import text
+
+# for some reason, pytest and my python interpretor have
+# inconsistencies in the way the __init__ module should
+# be imported
+try:
+    from .__init__ import LOGLOCATION, DBCONNECTION
+    from .widetable import ensureColumns
+except ImportError:
+    from __init__ import LOGLOCATION, DBCONNECTION
+    from widetable import ensureColumns
+
+# create the log folder, in case it does not exist
+# the logging could crash in case the folder is not present
+os.makedirs(os.path.dirname(LOGLOCATION), exist_ok=True)
 
 LOG.basicConfig(format="%(asctime)s %(message)s",
                 filename=LOGLOCATION,
                 level=LOG.INFO)
 
 ABSCHANGE = "EUSA30"
+# fixed seed for the train/test split, so that a refit on unchanged data
+# gives the same model (and the predictions can be updated incrementally)
+RANDOMSTATE = 0
+# number of days before the last prediction that are recalculated in an
+# incremental prediction, to pick up market data that arrived late
+REFRESHDAYS = 7
+# keep the latest prediction of every run in dgr_prediction_history
+ARCHIVEHISTORY = True
+
+
+class LinearFactorModel:
+    """
+    A fitted linear model of one fund, as returned by fitLinearModels.
+    It can be used in the same way as the fitted sklearn pipeline.
+    """
+
+    def __init__(self, coef, intercept, features):
+        self.coef_ = np.asarray(coef)
+        self.intercept_ = intercept
+        self.feature_names_in_ = np.asarray(features, dtype=object)
+
+    def predict(self, X) -> np.ndarray:
+        if isinstance(X, pd.DataFrame):
+            X = X[list(self.feature_names_in_)]
+        return np.asarray(X, dtype=float) @ self.coef_ + self.intercept_
+
+
+def fitLinearModels(df_dgr: pd.DataFrame,
+                    df_marketdata_ffil: pd.DataFrame,
+                    test_size: float = 0.25,
+                    random_state=None) -> dict:
+    """
+    Fit the linear model of every fund in one batched least-squares
+    solve.
+
+    The design matrix is built once, on all dates with a dekkingsgraad of
+    any fund. Per fund, the changes are taken with respect to the
+    previous date on which that fund published, and a mask selects the
+    dates of the fund that are in its training set. The first date of
+    a fund has no change, like the fillna(0) in the per fund pipeline.
+
+    The scaling of the target in the sklearn pipeline does not change
+    the least-squares solution, so it is not needed here. With
+    test_size=0 all dates are used for training.
+    """
+    _funds = list(df_dgr.columns)
+    _features = list(df_marketdata_ffil.columns)
+
+    _df_join = df_dgr.join(df_marketdata_ffil, how="left")
+    _df_join = _df_join.dropna(subset=_features)
+
+    _P = _df_join[_features].values  # dates x factors
+    _D = _df_join[_funds].values.T  # funds x dates
+    _available = ~np.isnan(_D)
+
+    # per fund and date, the row of the previous date of that fund
+    _rows = np.arange(len(_df_join))
+    _last = np.maximum.accumulate(
+        np.where(_available, _rows[None, :], -1), axis=1)
+    _prev = np.hstack([np.full((len(_funds), 1), -1), _last[:, :-1]])
+    _prev = np.where(_prev < 0, _rows[None, :], _prev)
+
+    # funds x dates x factors; relative changes, except the rate
+    _X = _P[None, :, :] / _P[_prev] - 1
+    _abs = _features.index(ABSCHANGE)
+    _X[:, :, _abs] = _P[None, :, _abs] - _P[_prev][:, :, _abs]
+    _Y = np.where(_available, _D - np.take_along_axis(_D, _prev, axis=1),
+                  0.)
+
+    # create test and train sets per fund
+    if test_size:
+        _train = np.zeros_like(_available)
+        for i in range(len(_funds)):
+            _rows_train, _ = train_test_split(
+                np.flatnonzero(_available[i]),
+                test_size=test_size,
+                random_state=random_state)
+            _train[i, _rows_train] = True
+    else:
+        _train = _available.copy()
+
+    # solve the normal equations of all funds at once, with intercept
+    _A = np.concatenate([np.ones(_X.shape[:2] + (1,)), _X], axis=2)
+    _A = np.where(_available[:, :, None], _A, 0.)
+    _G = np.einsum("fn,fni,fnj->fij", _train, _A, _A)
+    _b = np.einsum("fn,fni,fn->fi", _train, _A, _Y)
+    _beta = np.einsum("fij,fj->fi", np.linalg.pinv(_G), _b)
+
+    _models = {}
+    for i, fund in enumerate(_funds):
+        _model = LinearFactorModel(_beta[i, 1:], _beta[i, 0], _features)
+        _test = _available[i] & ~_train[i]
+        _y_pred = _A[i, _test, 1:] @ _model.coef_ + _model.intercept_
+
+        LOG.info("Linear model succesfully fitted for {}.".format(fund))
+        LOG.info("The specifics for the model of {} are:".format(fund))
+        LOG.info("Period from {} to {}".format(
+            _df_join.index[_available[i]].min(),
+            _df_join.index[_available[i]].max()))
+        LOG.info("Coefficients: {}".format(
+            list(zip(_features, _model.coef_))))
+        LOG.info("Intercept: {:3f}".format(_model.intercept_))
+        if _test.sum() > 1:
+            LOG.info("Coefficient of determination: {:3f}".format(
+                r2_score(_Y[i, _test], _y_pred)))
+
+        _models.update({fund: _model})
+
+    return _models
+
+
+def modelKey(model, features) -> str:
+    """
+    Fingerprint of a fitted model: changes when the coefficients or
+    the intercept change.
+    """
+    _coef = modelCoefficients(model, features)
+    _intercept = model.predict(pd.DataFrame(
+        np.zeros((1, len(features))), columns=features))[0]
+
+    return hashlib.sha1(np.round(np.append(_coef, _intercept),
+                                 12).tobytes()).hexdigest()
+
+
+def modelCoefficients(model, features) -> np.ndarray:
+    """
+    The coefficients of a fitted model in units of the target, ordered
+    as `features`. For the TransformedTargetRegressor with a
+    StandardScaler this is the coefficient of the inner regression
+    times the scale of the target.
+    """
+    if isinstance(model, TransformedTargetRegressor):
+        _coef = np.ravel(model.regressor_.coef_) * \
+            model.transformer_.scale_[0]
+    else:
+        _coef = np.ravel(model.coef_)
+    _names = getattr(model, "feature_names_in_", features)
+
+    return pd.Series(_coef, index=_names).reindex(features).values
+
+
+def contributionMatrix(models: dict,
+                       df_marketdata: pd.DataFrame,
+                       start_dates: dict) -> dict:
+    """
+    Contribution of each risk factor to the daily change of the
+    predicted dekkingsgraad, for all funds at once.
+
+    The models are linear, so the prediction with only risk factor r
+    moving (all other factors at their first value, which is zero)
+    changes from one day to the next by coefficient r times the change
+    of factor r. This gives all contributions in one NumPy operation,
+    instead of a prediction per fund per risk factor.
+
+    Returns a dict with per fund a df indexed by date, with one column
+    per risk factor, starting at the start date of the fund.
+    """
+    _funds = list(models)
+    _features = list(df_marketdata.columns)
+
+    # daily changes of the risk factors: relative, except for the
+    # rate, which is an absolute difference
+    _df_change = df_marketdata.pct_change()
+    _df_change[ABSCHANGE] = df_marketdata[ABSCHANGE].diff()
+    _X = _df_change[_features].values
+
+    # per fund, the first row of its period is zero (no change yet),
+    # as are all rows before it
+    _index = df_marketdata.index
+    _start = np.array([_index.searchsorted(start_dates[fund])
+                       for fund in _funds])
+    _rows = np.arange(len(_index))
+    _X = np.where(_rows[None, :, None] > _start[:, None, None],
+                  _X[None, :, :], 0.)
+
+    # weights: one row of coefficients per fund
+    _W = np.vstack([modelCoefficients(models[fund], _features)
+                    for fund in _funds])
+
+    # change of the single factor predictions: funds x dates x factors
+    _C = np.diff(_X, axis=1, prepend=0.) * _W[:, None, :]
+
+    return {fund: pd.DataFrame(data=_C[i, _start[i]:],
+                               index=_index[_start[i]:],
+                               columns=_features)
+            for i, fund in enumerate(_funds)}
 
 
 class RiskModelPF:
@@ -33,11 +237,14 @@ class RiskModelPF:
         except Exception as err:
             LOG.error("Unable to load RiskModelPF object: {}".format(err))
 
-    def runLinearModel(self):
+    def runLinearModel(self, batched: bool = False):
         """
         Run the machine learning algorithm of sklearn. This is a simple
         regression model, but alternatives could be used.
 
+        With batched=True, the models of all funds are fitted at once
+        with fitLinearModels, instead of a sklearn pipeline per fund.
+
         The function will save all the outcomes to the self.regr dict
         """
         try:
@@ -59,81 +266,112 @@ class RiskModelPF:
                 # initiate the dict for the models
                 self.regr_model = {}
 
-                for fund in self.fondsen:
-                    _df_dgr = pd.DataFrame(self.df_dgr[fund])
-                    # join the dataframes, given the difference
-                    # in frequency (dgr are monthly)
-
-                    _df_join = _df_dgr.join(_df_marketdata_ffil,
-                                            how="left").dropna()
-
-                    # calculate the pct change, except EUSA30
-                    _df_join[_df_join.columns.difference(
-                        [ABSCHANGE, fund])] = \
-                        _df_join[
-                            _df_join.columns.difference([ABSCHANGE, fund])
-                            ].pct_change().fillna(0)
-
-                    # for EUSA30, we take the difference
-                    _df_join[[ABSCHANGE, fund]] = \
-                        _df_join[[ABSCHANGE, fund]].diff().fillna(0)
-                    # new: only take the last 36 months in the regression
-                    # _df_join = _df_join.last("24M")
-
-                    # create features and label sets
-                    _X = _df_join.drop(columns=fund)
-                    _y = _df_join[fund]
-
-                    # create test and train sets
-                    _X_train, _X_test, _y_train, _y_test = \
-                        train_test_split(_X, _y)
-
-                    # create regression
-                    _regr = TransformedTargetRegressor(
-                        regressor=LinearRegression(),
-                        transformer=StandardScaler()
-                    )
-
-                    # Train the model using the training sets
-                    _regr.fit(_X_train, _y_train)
-
-                    _y_pred = _regr.predict(_X_test)
-
-                    LOG.info("Linear model succesfully fitted for {}.".format(
-                        fund))
-                    LOG.info("The specifics for the model of {} are:".format(
-                        fund))
-                    LOG.info("Period from {} to {}".format(
-                        _df_join.index.min(), _df_join.index.max()))
-                    LOG.info("Coefficients: {}".format(
-                        list(zip(_df_marketdata_ffil.columns,
-                                 _regr.regressor_.coef_))))
-                    LOG.info("Intercept: {:3f}".format(
-                        _regr.regressor_.intercept_))
-                    LOG.info("Coefficient of determination: {:3f}".format(
-                        r2_score(_y_test, _y_pred)))
-
-                    self.regr_model.update({fund: _regr})
+                if batched:
+                    # one batched least-squares solve for all funds
+                    self.regr_model = fitLinearModels(
+                        self.df_dgr,
+                        _df_marketdata_ffil,
+                        random_state=RANDOMSTATE)
+                else:
+                    for fund in self.fondsen:
+                        _df_dgr = pd.DataFrame(self.df_dgr[fund])
+                        # join the dataframes, given the difference
+                        # in frequency (dgr are monthly)
+
+                        _df_join = _df_dgr.join(_df_marketdata_ffil,
+                                                how="left").dropna()
+
+                        # calculate the pct change, except EUSA30
+                        _df_join[_df_join.columns.difference(
+                            [ABSCHANGE, fund])] = \
+                            _df_join[
+                                _df_join.columns.difference([ABSCHANGE, fund])
+                                ].pct_change().fillna(0)
+
+                        # for EUSA30, we take the difference
+                        _df_join[[ABSCHANGE, fund]] = \
+                            _df_join[[ABSCHANGE, fund]].diff().fillna(0)
+                        # new: only take the last 36 months in the regression
+                        # _df_join = _df_join.last("24M")
+
+                        # create features and label sets
+                        _X = _df_join.drop(columns=fund)
+                        _y = _df_join[fund]
+
+                        # create test and train sets
+                        _X_train, _X_test, _y_train, _y_test = \
+                            train_test_split(_X, _y,
+                                             random_state=RANDOMSTATE)
+
+                        # create regression
+                        _regr = TransformedTargetRegressor(
+                            regressor=LinearRegression(),
+                            transformer=StandardScaler()
+                        )
+
+                        # Train the model using the training sets
+                        _regr.fit(_X_train, _y_train)
+
+                        _y_pred = _regr.predict(_X_test)
+
+                        LOG.info("Linear model succesfully fitted for "
+                                 "{}.".format(fund))
+                        LOG.info("The specifics for the model of {} "
+                                 "are:".format(fund))
+                        LOG.info("Period from {} to {}".format(
+                            _df_join.index.min(), _df_join.index.max()))
+                        LOG.info("Coefficients: {}".format(
+                            list(zip(_df_marketdata_ffil.columns,
+                                     _regr.regressor_.coef_))))
+                        LOG.info("Intercept: {:3f}".format(
+                            _regr.regressor_.intercept_))
+                        LOG.info("Coefficient of determination: {:3f}".format(
+                            r2_score(_y_test, _y_pred)))
+
+                        self.regr_model.update({fund: _regr})
 
                 LOG.info("Finished runLinearModel")
+                return True
             else:
                 raise Exception("Not all variables are defined. Please check "
                                 "the code.")
         except Exception as err:
             LOG.error("runLinearModel results in an error: {}".format(err))
+            return False
+
+    def getPredictionState(self) -> dict:
+        # the state of the previous prediction per fund, see
+        # makePrediction
+        try:
+            _df = pd.read_sql("SELECT * FROM dgr_prediction_state",
+                              self.conn, index_col="fund")
+            return _df.to_dict("index")
+        except Exception as err:
+            LOG.info("No prediction state available: {}".format(err))
+            return {}
 
-    def makePrediction(self, df_input: pd.DataFrame = None, debug=False):
+    def makePrediction(self, df_input: pd.DataFrame = None, debug=False,
+                       incremental=False):
         # predict using an input df with the
         # 5 (for now) market data risk factors
         # default behavior: predict with data point beyond
         # the latest know official dgr numbers
+        #
+        # the prediction at date t only depends on the market data at t
+        # relative to the base date (the latest official dgr). With
+        # incremental=True, the base prices of the previous run are kept
+        # per fund in dgr_prediction_state and only the days after the
+        # previous run (plus REFRESHDAYS) are calculated, and only the
+        # changed rows are written. A new official dgr, a refit that
+        # changes the model or revised base prices result in a full run.
 
         if self.regr_model is None:
             raise Exception("No model available. First run the model.")
 
         try:
-            # for tagging the date_run column
-            _now = datetime.now()
+            # for tagging the date_run column, stored as text in a fixed
+            # format so that it can be compared directly in queries
+            _now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
             # if df_input is None, that means no override of df
             if df_input is None:
@@ -142,8 +380,13 @@ class RiskModelPF:
                 _df_marketdata = self.df_marketdata.copy()
             else:
                 _df_marketdata = df_input.copy()
+                incremental = False
 
             _df_dgr = self.df_dgr.copy()
+            _features = list(_df_marketdata.columns)
+            _states = self.getPredictionState() if incremental else {}
+            self.df_predictions = {}
+            _writes = []
 
             # now predict for each fund
             # we could use self.funds, or based the funds on
@@ -152,29 +395,39 @@ class RiskModelPF:
             # dict, do a loop on the dict
 
             for fund in self.regr_model:
-                _df_input = _df_marketdata[
-                    _df_marketdata.index >= _df_dgr[fund].dropna().index.max()
-                    ]
-
-                # calculate the percentage change based on first observation
-                _df_input.loc[:, _df_input.columns != ABSCHANGE] = \
-                    _df_input.loc[
-                        :, _df_input.columns != ABSCHANGE
-                        ].pct_change().fillna(0) + 1
-
-                _df_input.loc[:, _df_input.columns != ABSCHANGE] = \
-                    _df_input.loc[
-                        :, _df_input.columns != ABSCHANGE].cumprod() - 1
-
-                # for EUSA30, we take the difference based on first observation
-                _df_input[ABSCHANGE] -= _df_input[ABSCHANGE].iloc[0]
-
-                _df_latest = _df_dgr[fund][
-                    _df_dgr[fund].index == _df_dgr[fund].dropna().index.max()][0]
-                _predict_values = self.regr_model[fund].predict(_df_input)
+                _base_date = _df_dgr[fund].dropna().index.max()
+                _df_latest = _df_dgr[fund][_base_date]
+                _model_key = modelKey(self.regr_model[fund], _features)
+
+                _df_input = _df_marketdata[_df_marketdata.index >= _base_date]
+                _base_prices = _df_input.iloc[0]
+
+                _state = _states.get(fund)
+                _incremental = _state is not None and \
+                    _state["base_date"] == _base_date.strftime("%Y-%m-%d") \
+                    and np.isclose(_state["base_value"], _df_latest) \
+                    and _state["model_key"] == _model_key \
+                    and json.loads(_state["base_prices"]) == \
+                    _base_prices.to_dict()
+
+                if _incremental:
+                    _date_run = _state["date_run"]
+                    _df_input = _df_input[
+                        _df_input.index >= pd.Timestamp(_state["last_date"])
+                        - pd.Timedelta(days=REFRESHDAYS)]
+                else:
+                    _date_run = _now
+
+                # cumulative change since the base date: relative,
+                # except for EUSA30 where we take the difference
+                _df_cum = _df_input / _base_prices - 1
+                _df_cum[ABSCHANGE] = _df_input[ABSCHANGE] - \
+                    _base_prices[ABSCHANGE]
+
+                _predict_values = self.regr_model[fund].predict(_df_cum)
                 _df_predict = pd.DataFrame(data=_predict_values,
                                            index=_df_input.index,
-                                           columns={"dekkingsgraad"})
+                                           columns=["dekkingsgraad"])
 
                 _df_predict["dekkingsgraad"] += _df_latest
 
@@ -183,32 +436,101 @@ class RiskModelPF:
 
                 # date by which the analysis is run. perhaps use datetime to
                 # distinguish multiple runs on the same day
-                _df_predict["date_run"] = _now
+                _df_predict["date_run"] = _date_run
 
                 # rename the 'dekkingsgraad' column to 'value' in order to
                 # be consistent with other db tables
                 _df_predict.rename(columns={"dekkingsgraad": "value"},
                                    inplace=True)
+                _df_predict.index.name = "date"
                 _df_predict.reset_index(inplace=True)
 
                 # change the date column to a string
                 _df_predict["date"] = _df_predict["date"].dt.strftime(
                     "%Y-%m-%d")
-                # write to db
-
-                if not debug:
-                    _df_predict.to_sql(name="dgr_prediction",
-                                       con=self.conn,
-                                       index=False,
-                                       if_exists="append")
-
-                LOG.info("Succesfully predicted values for {}".format(fund))
+                self.df_predictions.update({fund: _df_predict})
+
+                if _incremental:
+                    # only keep the rows that are new or changed
+                    _df_stored = pd.read_sql(
+                        text("SELECT date, value FROM dgr_prediction_current "
+                             "WHERE fund = :fund AND date >= :date"),
+                        self.conn,
+                        params={"fund": fund,
+                                "date": _df_predict["date"].min()},
+                        index_col="date")["value"]
+                    _stored = _df_predict["date"].map(_df_stored)
+                    _df_predict = _df_predict[
+                        ~np.isclose(_df_predict["value"], _stored)]
+
+                # collect for writing to db
+                _writes.append((fund, _df_predict, not _incremental, {
+                        "fund": fund,
+                        "date_run": _date_run,
+                        "base_date": _base_date.strftime("%Y-%m-%d"),
+                        "base_value": float(_df_latest),
+                        "base_prices": json.dumps(_base_prices.to_dict()),
+                        "model_key": _model_key,
+                        "last_date": _df_input.index.max().strftime(
+                            "%Y-%m-%d")}))
+
+                LOG.info("Succesfully predicted values for {} ({}, {} "
+                         "rows to write)".format(
+                             fund,
+                             "incremental" if _incremental else "full run",
+                             len(_df_predict)))
                 LOG.info("Predictions are for period {} to {}".format(
                     _df_input.index.min(), _df_input.index.max()
                 ))
 
+            # write to db; all funds in one transaction
+            if not debug:
+                self.writePredictions(_writes)
+
+            return True
+
         except Exception as err:
             LOG.error("makePrediction results in an error: {}".format(err))
+            return False
+
+    def writePredictions(self, writes: list):
+        """
+        Write the predictions of a run in one transaction. `writes` holds
+        per fund a tuple (fund, df with the rows, full run or not, state).
+
+        For a full run, the rows of the fund in dgr_prediction_current
+        are replaced; an incremental run upserts the changed rows. The
+        latest prediction of each fund is kept in the compact
+        dgr_prediction_history table when ARCHIVEHISTORY is set.
+        """
+        _deletequery = "DELETE FROM dgr_prediction_current WHERE fund = :fund"
+        _upsertquery = "INSERT INTO dgr_prediction_current " \
+            "(fund, date, value) VALUES (:fund, :date, :value) " \
+            "ON CONFLICT (fund, date) DO UPDATE SET value = excluded.value"
+        _historyquery = "INSERT OR REPLACE INTO dgr_prediction_history " \
+            "(date_run, fund, date, value) " \
+            "VALUES (:date_run, :fund, :date, :value)"
+        _statequery = "INSERT OR REPLACE INTO dgr_prediction_state " \
+            "(fund, date_run, base_date, base_value, base_prices, " \
+            "model_key, last_date) VALUES (:fund, :date_run, :base_date, " \
+            ":base_value, :base_prices, :model_key, :last_date)"
+
+        with self.conn.begin() as con:
+            for fund, df_predict, full, state in writes:
+                if full:
+                    con.execute(text(_deletequery), {"fund": fund})
+                if not df_predict.empty:
+                    _rows = df_predict[["fund", "date", "value"]]
+                    con.execute(text(_upsertquery), _rows.to_dict("records"))
+                    # the prediction for the last market data date,
+                    # unless it did not change in an incremental run
+                    _last = df_predict[
+                        df_predict["date"] == state["last_date"]]
+                    if ARCHIVEHISTORY and not _last.empty:
+                        con.execute(text(_historyquery),
+                                    _last[["date_run", "fund", "date",
+                                           "value"]].to_dict("records"))
+                con.execute(text(_statequery), state)
 
     def makeContribution(self, df_input: pd.DataFrame = None, debug=False):
         # predict using an input df with the
@@ -220,8 +542,9 @@ class RiskModelPF:
             raise Exception("No model available. First run the model.")
 
         try:
-            # for tagging the date_run column
-            _now = datetime.now()
+            # for tagging the date_run column, stored as text in a fixed
+            # format so that it can be compared directly in queries
+            _now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
             # if df_input is None, that means no override of df
             if df_input is None:
@@ -234,46 +557,16 @@ class RiskModelPF:
             _df_dgr = self.df_dgr.copy()
             self.df_contributions = {}
 
-            for fund in self.regr_model:
-                _df_input = _df_marketdata[
-                    _df_marketdata.index >= _df_dgr[fund].dropna().index.max()
-                    ]
-
-                _df_input[_df_input.columns.difference([ABSCHANGE])] = \
-                    _df_input[
-                        _df_input.columns.difference([ABSCHANGE])
-                        ].pct_change().fillna(0)
-
-                # for EUSA30, we take the difference
-                _df_input[ABSCHANGE] = _df_input[ABSCHANGE].diff().fillna(0)
-
-                _df_input_firstrow = _df_input.iloc[:1]
-
-                # create blank dataframe for each fund, which is
-                # then added to the return dict per fund
-                _df_predict = pd.DataFrame(index=_df_input.index)
-
-                for riskfactor in _df_input.columns:
-                    _df_input_contribution = _df_input.copy()
-
-                    # fill all columns other than riskfactor
-                    # with the first value of the df
-                    _df_input_contribution.loc[
-                        :, ~_df_input_contribution.columns.isin([riskfactor])
-                        ] = _df_input_firstrow.loc[
-                        :, ~_df_input_firstrow.columns.isin([riskfactor])
-                        ]
-                    _df_input_contribution.ffill(inplace=True)
-                    _predict = self.regr_model[fund].predict(
-                        _df_input_contribution)
-                    _df_predict_right = pd.DataFrame(
-                        data=_predict + 1,
-                        index=_df_input.index,
-                        columns={riskfactor})
-                    _df_predict_right.cumprod()
-                    _df_predict = _df_predict.merge(
-                        right=_df_predict_right.diff().fillna(0),
-                        on="date")
+            # the contributions start at the latest official dgr per fund
+            _start_dates = {fund: _df_dgr[fund].dropna().index.max()
+                            for fund in self.regr_model}
+            _contributions = contributionMatrix(self.regr_model,
+                                                _df_marketdata,
+                                                _start_dates)
+
+            for fund, _df_predict in _contributions.items():
+                _df_predict.index.name = "date"
+                _df_predict = _df_predict.copy()
 
                 # add fund name
                 _df_predict["fund"] = fund
@@ -288,26 +581,34 @@ class RiskModelPF:
                 # add the predictions to the module
                 self.df_contributions.update({fund: _df_predict})
 
-                # melt the dataframe, so that it is a flat table that can be
-                # stored in the db
-                _df_predict = _df_predict.melt(
-                    id_vars=["date", "date_run", "fund"],
-                    var_name="index",
-                    value_name="value")
-
-                # write to database
-
-                if not debug:
-                    _df_predict.to_sql(name="dgr_contribution",
-                                       con=self.conn,
-                                       index=False,
-                                       if_exists="append")
-
-                LOG.info("Succesfully written contribution values to "
-                         "db for {}".format(fund))
+                LOG.info("Succesfully calculated contribution values "
+                         "for {}".format(fund))
                 LOG.info("Contributions are for period {} to {}".format(
-                    _df_input.index.min(), _df_input.index.max()
+                    _start_dates[fund], _df_marketdata.index.max()
                 ))
 
+            # write to database: the contributions are stored wide, one
+            # column per risk factor, and replaced as a whole in one
+            # transaction
+            if not debug and self.df_contributions:
+                self.writeContributions(pd.concat(
+                    self.df_contributions.values(), ignore_index=True))
+                LOG.info("Succesfully written contribution values to db")
+
+            return True
+
         except Exception as err:
             LOG.error("makeContribution results in an error: {}".format(err))
+            return False
+
+    def writeContributions(self, df_contributions: pd.DataFrame):
+        _df = df_contributions.drop(columns=["date_run"])
+
+        with self.conn.begin() as con:
+            ensureColumns(con, "dgr_contribution_current",
+                          list(_df.columns.difference(["fund", "date"])))
+            con.execute("DELETE FROM dgr_contribution_current")
+            _df.to_sql(name="dgr_contribution_current",
+                       con=con,
+                       index=False,
+                       if_exists="append")
@@ -0,0 +1,162 @@
+import numpy as np
+import pandas as pd
+import logging as LOG
+
+# the materialized version of the marketdata table: one row per date,
+# one column per ticker, already forward filled. The long format
+# marketdata table remains the source of truth.
+WIDETABLE = "marketdata_wide"
+# number of rows of the long table that are read at a time
+CHUNKSIZE = 50000
+
+
+def tableExists(con, table: str) -> bool:
+    _query = "SELECT name FROM sqlite_master WHERE type = 'table' " \
+        "AND name = ?"
+    return con.execute(_query, (table,)).first() is not None
+
+
+def wideTableFilled(con) -> bool:
+    # whether the backend has built the wide table, with at least one row;
+    # MIN(date) is looked up in the index of the primary key
+    return tableExists(con, WIDETABLE) and con.execute(
+        "SELECT MIN(date) FROM {}".format(WIDETABLE)).scalar() is not None
+
+
+def ensureColumns(con, table: str, columns: list):
+    """
+    Add the REAL columns that are not yet present in `table`, for
+    instance when a new ticker is added to the market data.
+    """
+    _existing = [row[1] for row in con.execute(
+        "PRAGMA table_info(\"{}\")".format(table))]
+
+    for column in columns:
+        if column not in _existing:
+            con.execute("ALTER TABLE \"{}\" ADD COLUMN \"{}\" REAL".format(
+                table, column))
+            LOG.info("Added column {} to table {}".format(column, table))
+
+
+def readWide(con, start_date: str = None, chunksize: int = CHUNKSIZE,
+             dtype=np.float64) -> pd.DataFrame:
+    """
+    Pivot the marketdata table (from start_date onwards) to one row per
+    date and one column per ticker, without forward filling. The rows are
+    streamed in chunks straight into the wide array, so the long table is
+    never held in memory as a whole.
+    """
+    _where = "" if start_date is None else " WHERE date >= ?"
+    _params = () if start_date is None else (start_date, )
+
+    _dates = np.array([row[0] for row in con.execute(
+        "SELECT DISTINCT date FROM marketdata{} ORDER BY date".format(
+            _where), _params)], dtype=str)
+    _names = pd.Index(sorted(row[0] for row in con.execute(
+        "SELECT DISTINCT name FROM marketdata{}".format(_where), _params)),
+        name="name")
+
+    _values = np.full((len(_dates), len(_names)), np.nan, dtype=dtype)
+    if _values.size == 0:
+        return pd.DataFrame(_values,
+                            index=pd.DatetimeIndex([], name="date"),
+                            columns=_names)
+
+    # the rows are fetched with the cursor of the driver, without wrapping
+    # every row in a sqlalchemy row; in the order of the (date, name,
+    # value) index, which covers the query
+    _cursor = con.connection.cursor()
+    try:
+        _cursor.execute("SELECT date, name, value FROM marketdata{} "
+                        "ORDER BY date".format(_where), _params)
+        while True:
+            _rows = _cursor.fetchmany(chunksize)
+            if not _rows:
+                break
+
+            _chunkdates, _chunknames, _chunkvalues = zip(*_rows)
+            # the position of each row in the wide array: the dates are
+            # sorted and the tickers are coded as the categories of _names
+            _chunkdates = np.array(_chunkdates, dtype=str)
+            _rowpos = np.minimum(np.searchsorted(_dates, _chunkdates),
+                                 len(_dates) - 1)
+            _colpos = pd.Categorical(_chunknames, categories=_names).codes
+            # without a read transaction, the backend may add a date or a
+            # ticker after the lists above were read; these rows are left
+            # out instead of ending up in the wrong cell
+            _known = (_colpos >= 0) & (_dates[_rowpos] == _chunkdates)
+            _values[_rowpos[_known], _colpos[_known]] = np.array(
+                _chunkvalues, dtype=dtype)[_known]
+    finally:
+        _cursor.close()
+
+    return pd.DataFrame(_values,
+                        index=pd.DatetimeIndex(
+                            pd.to_datetime(_dates, format="%Y-%m-%d"),
+                            name="date"),
+                        columns=_names)
+
+
+def writeWideRows(con, df: pd.DataFrame):
+    # replace all rows from the first date of df onwards
+    _df = df.copy()
+    _df.index = _df.index.strftime("%Y-%m-%d")
+    _df.index.name = "date"
+    _df.columns.name = None
+
+    ensureColumns(con, WIDETABLE, list(_df.columns))
+    con.execute("DELETE FROM {} WHERE date >= ?".format(WIDETABLE),
+                (_df.index.min(),))
+    _df.reset_index().to_sql(name=WIDETABLE,
+                             con=con,
+                             index=False,
+                             if_exists="append")
+
+
+def rebuildWideTable(con):
+    """
+    (Re)build the wide table from the complete long format marketdata
+    table. Only needed once, after that updateWideTable keeps it in sync.
+    """
+    LOG.info("Building {} from marketdata".format(WIDETABLE))
+
+    _df = readWide(con)
+    _df.ffill(inplace=True)
+
+    con.execute("DROP TABLE IF EXISTS {}".format(WIDETABLE))
+    con.execute("CREATE TABLE {} (date TEXT NOT NULL PRIMARY KEY)".format(
+        WIDETABLE))
+
+    if not _df.empty:
+        writeWideRows(con, _df)
+
+
+def updateWideTable(con, start_date: str):
+    """
+    Bring the wide table in line with the marketdata table for all dates
+    on or after start_date (format yyyy-mm-dd). Only the new part of the
+    long table is pivoted; the last wide row before start_date seeds the
+    forward fill.
+    """
+    if not wideTableFilled(con):
+        rebuildWideTable(con)
+        return
+
+    _df_new = readWide(con, start_date)
+
+    if _df_new.empty:
+        return
+
+    _query = "SELECT * FROM {} WHERE date < ? ORDER BY date DESC " \
+        "LIMIT 1".format(WIDETABLE)
+    _df_seed = pd.read_sql(_query, con, params=(start_date,),
+                           index_col="date",
+                           parse_dates={"date": "%Y-%m-%d"})
+
+    _df = pd.concat([_df_seed, _df_new]).astype(float).sort_index()
+    _df.ffill(inplace=True)
+    _df = _df[_df.index >= pd.Timestamp(start_date)]
+
+    writeWideRows(con, _df)
+
+    LOG.info("Updated {} from {} onwards".format(WIDETABLE, start_date))
@@ -26,6 +26,11 @@ CREATE TABLE IF NOT EXISTS "pensioenfondsen" (
 	"id"	INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
 	"name"	TEXT
 );
+CREATE TABLE IF NOT EXISTS "data_version" (
+	"id"	INTEGER NOT NULL PRIMARY KEY CHECK ("id" = 1),
+	"version"	INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO "data_version" ("id", "version") VALUES (1, 0);
 CREATE INDEX IF NOT EXISTS "pf_index" ON "dekkingsgraad" (
 	"name"
 );
@@ -0,0 +1,84 @@
+import json
+import os
+import shutil
+import logging as LOG
+from .backend.dataimport import DIRPATH
+from .payload import compactFigure
+
+FIGURELOCATION = os.path.join(DIRPATH, "db/figures")
+
+
+class FigureStore:
+    """
+    Built figures, serialized to json once per data version. The files
+    are kept next to the db, so that all workers (and the prerender run
+    after the backend, see graphs.py) share the same figures. A stored
+    figure is served as a plain dict, without any pandas or plotly work.
+    The figures of older data versions are removed as soon as a figure of
+    a newer version is stored.
+    """
+
+    def __init__(self, location: str = FIGURELOCATION):
+        self.location = location
+
+    def versionLocation(self, version: int) -> str:
+        return os.path.join(self.location, "v{}".format(version))
+
+    def figureLocation(self, version: int, key: str) -> str:
+        return os.path.join(self.versionLocation(version),
+                            "{}.json".format(key))
+
+    def load(self, version: int, key: str):
+        # returns None if the figure is not stored (yet)
+        try:
+            with open(self.figureLocation(version, key)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, version: int, key: str, figure) -> dict:
+        _json = figure if isinstance(figure, str) else figure.to_json()
+        # store the data of the traces as typed arrays, see payload.py
+        _json = json.dumps(compactFigure(json.loads(_json)))
+
+        _new = not os.path.isdir(self.versionLocation(version))
+        os.makedirs(self.versionLocation(version), exist_ok=True)
+        # write to a temporary file first, so that another worker never
+        # reads a partial figure
+        _tmp = "{}.{}.tmp".format(self.figureLocation(version, key),
+                                  os.getpid())
+        with open(_tmp, "w") as f:
+            f.write(_json)
+        os.replace(_tmp, self.figureLocation(version, key))
+
+        # the first figure of a new data version: the workers do not use
+        # the older versions anymore
+        if _new:
+            self.purge(version)
+
+        return json.loads(_json)
+
+    def getOrBuild(self, version: int, key: str, builder) -> dict:
+        """
+        Return the stored figure `key` of `version`. On a miss, the figure
+        is built by calling `builder` and stored for the other workers.
+        """
+        _figure = self.load(version, key)
+
+        if _figure is None:
+            LOG.info("Building figure {} for data version {}".format(
+                key, version))
+            _figure = self.save(version, key, builder())
+
+        return _figure
+
+    def purge(self, version: int):
+        # remove the figures of all older data versions
+        if not os.path.isdir(self.location):
+            return
+
+        for name in os.listdir(self.location):
+            if name.startswith("v") and name[1:].isdigit() \
+                    and int(name[1:]) < version:
+                shutil.rmtree(os.path.join(self.location, name),
+                              ignore_errors=True)
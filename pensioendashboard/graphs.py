@@ -1,14 +1,29 @@
 import plotly.graph_objects as go
+import plotly.io as pio
+import pandas as pd
 from dash import dcc, html
 import dash_bootstrap_components as dbc
 from plotly.subplots import make_subplots
-import pandas as pd
-from datetime import datetime
+from datetime import date, datetime
+from functools import partial
+import logging as LOG
 from dateutil.relativedelta import relativedelta
 from .backend.dataimport import DataImport
+from .backend.downsample import CHARTPOINTS, downsampleFrame
+from .figurestore import FigureStore
+
+pio.templates.default = "plotly_dark"
+
+RATES = ["EUSA30", "EURUSD"]
+# the time horizons of the contribution graph
+CONTRIBUTIONBINS = ["D", "W-FRI"]
 
 INTERVAL = -6  # months
-STARTDATE = datetime.now() + relativedelta(months=INTERVAL)
+# default start date of the graphs: INTERVAL months before today. It is
+# determined at every call, so that it does not go stale in a long
+# running worker
+STARTDATE = object()
+
 
 LINECOLORS = {"ABP": "indianred",
               "PFZW": "mediumseagreen",
@@ -41,15 +56,91 @@ RANGESELECTOR = dict(
     ]))
 
 
+def resolveStartDate(start_date):
+    if start_date is STARTDATE:
+        return datetime.combine(date.today(), datetime.min.time()) + \
+            relativedelta(months=INTERVAL)
+    return start_date
+
+
 class GraphLibrary(DataImport):
 
     def __init__(self,
                  rates_indices: list,
-                 graphConfig: dict = {"displayModeBar": False}):
+                 graphConfig: dict = {"displayModeBar": False},
+                 figurestore: FigureStore = None,
+                 chartpoints: int = CHARTPOINTS):
+        super().__init__()
+        self.chartpoints = chartpoints
         self.rates_indices = rates_indices
         self.graphConfig = graphConfig
+        self.figurestore = FigureStore() if figurestore is None \
+            else figurestore
+
+    def getFigure(self, key: str, builder) -> dict:
+        """
+        Return figure `key` of the current data version. The figure is
+        kept in the snapshot and in the figure store; `builder` is only
+        called when neither has it.
+        """
+        def _load():
+            return self.figurestore.getOrBuild(self._snapshot_version,
+                                               key, builder)
+
+        return self.getSnapshot("figure_{}".format(key), _load)
+
+    def figureKey(self, name: str, start_date) -> str:
+        start_date = resolveStartDate(start_date)
+        if start_date is None:
+            return "{}_all".format(name)
+        return "{}_{}".format(name, start_date.strftime("%Y%m%d"))
+
+    def marketdataWindow(self, start_date) -> pd.DataFrame:
+        """
+        The market data from start_date onwards (all if None). The window
+        is read from the db with the date filter in the query, and kept
+        in the snapshot.
+        """
+        if start_date is None:
+            return self.marketdata
+
+        _start = pd.Timestamp(start_date).normalize()
+        return self.getSnapshot(
+            "marketdata_{}".format(_start.strftime("%Y%m%d")),
+            lambda: self.getMarketData(start_date=_start))
+
+    def prerender(self):
+        """
+        Build all figures of the current data version and store them,
+        so that the dashboard workers do not have to.
+        """
+        _builders = [self.buildDGRGraph,
+                     self.buildEquityGraph,
+                     self.buildRatesGraph,
+                     self.buildCountryExposureGraph]
+        _builders += [partial(self.buildContributionGraph, fund, bin)
+                      for fund in self.contributionsPerFund()
+                      for bin in CONTRIBUTIONBINS]
+
+        for builder in _builders:
+            try:
+                builder()
+            except Exception as err:
+                LOG.error("Prerendering a figure resulted in an error: "
+                          "{}".format(err))
+
+        self.figurestore.purge(self._snapshot_version)
 
     def buildDGRGraph(self, start_date=STARTDATE):
+        return dcc.Graph(id="fig_dgr",
+                         figure=self.getFigure(
+                             self.figureKey("dgr", start_date),
+                             lambda: self.makeDGRFigure(start_date)),
+                         responsive="auto",
+                         config=self.graphConfig)
+
+    def makeDGRFigure(self, start_date=STARTDATE) -> go.Figure:
+        start_date = resolveStartDate(start_date)
 
         fig_dgr = go.Figure()
         hovertemplate = "<b>Datum:</b> %{x}<br><br>" \
@@ -89,24 +180,27 @@ class GraphLibrary(DataImport):
                               title="Verloop dekkingsgraden plus prognose",
                               legend_orientation="h")
 
-        return dcc.Graph(id="fig_dgr",
-                         figure=fig_dgr,
+        return fig_dgr
+
+    def buildEquityGraph(self, start_date=STARTDATE):
+        return dcc.Graph(id="fig_equity",
+                         figure=self.getFigure(
+                             self.figureKey("equity", start_date),
+                             lambda: self.makeEquityFigure(start_date)),
                          responsive="auto",
                          config=self.graphConfig)
 
-    def buildEquityGraph(self,
-                         start_date=STARTDATE):
+    def makeEquityFigure(self, start_date=STARTDATE) -> go.Figure:
         # ----------
-        # first filter on start_date
-        if start_date is None:
-            df = self.marketdata
-        else:
-            df = self.marketdata[self.marketdata.index >= start_date]
+        # first filter on start_date, in the query
+        df = self.marketdataWindow(resolveStartDate(start_date))
 
         # create market indices graphs (equities and commodities)
         df_dailyreturns = df.drop(
             columns=self.rates_indices).pct_change().fillna(0)
         df_cumreturns = (df_dailyreturns + 1).cumprod() * 100
+        # long histories are downsampled to about the width of the graph
+        df_cumreturns = downsampleFrame(df_cumreturns, self.chartpoints)
 
         # create the graph
         fig_equity = go.Figure()
@@ -131,24 +225,26 @@ class GraphLibrary(DataImport):
                                  title="Ontwikkeling aandelen en grondstoffen",
                                  legend_orientation="h")
 
-        return dcc.Graph(id="fig_equity",
-                         figure=fig_equity,
+        return fig_equity
+
+    def buildRatesGraph(self, start_date=STARTDATE):
+        return dcc.Graph(id="fig_rates",
+                         figure=self.getFigure(
+                             self.figureKey("rates", start_date),
+                             lambda: self.makeRatesFigure(start_date)),
                          responsive="auto",
                          config=self.graphConfig)
 
-    def buildRatesGraph(self, start_date=STARTDATE):
+    def makeRatesFigure(self, start_date=STARTDATE) -> go.Figure:
         # ----------
         # create market indices graphs (EUSA30 and EURUSD)
-        df_rates = self.marketdata[self.rates_indices]
+        df_rates = self.marketdataWindow(resolveStartDate(start_date))[
+            self.rates_indices]
+        df_rates = downsampleFrame(df_rates, self.chartpoints)
 
         hovertemplate = "<b>Datum:</b> %{x}<br><br>" \
                         "<b>Niveau:</b> %{y:.2f}<br>"
 
-        if start_date is None:
-            pass
-        else:
-            df_rates = df_rates[df_rates.index >= start_date]
-
         fig_rates = make_subplots(specs=[[{"secondary_y": True}]])
         fig_rates.add_scatter(secondary_y=False,
                               x=df_rates.index,
@@ -166,12 +262,23 @@ class GraphLibrary(DataImport):
                                 title_text="Ontwikkeling rente en valuta",
                                 legend_orientation="h")
 
-        return dcc.Graph(id="fig_rates",
-                         figure=fig_rates,
-                         responsive="auto",
-                         config=self.graphConfig)
+        return fig_rates
+
+    def buildContributionGraph(self, fund, bin=None) -> dict:
+        return self.getFigure(
+            "contribution_{}_{}".format(fund.replace(" ", "_"), bin),
+            lambda: self.makeContributionFigure(fund, bin))
 
-    def buildContributionGraph(self, fund, bin=None):
+    def contributionsPerFund(self) -> dict:
+        # the wide contributions split by fund, once per data version
+        def _split():
+            return {fund: df.drop(columns="fund").dropna(axis=1, how="all")
+                    for fund, df in self.dgr_contribution_wide.groupby(
+                        "fund")}
+
+        return self.getSnapshot("contributions_per_fund", _split)
+
+    def makeContributionFigure(self, fund, bin=None) -> go.Figure:
         fig_contr = make_subplots(specs=[[{"secondary_y": True}]])
 
         hovertemplatebar = "<b>Datum:</b> %{x}<br><br>" \
@@ -181,26 +288,20 @@ class GraphLibrary(DataImport):
         hovertemplatepredict = "<b>Datum:</b> %{x}<br><br>" \
                                "<b>Dekkingsgraad:</b> %{y:.1f}%<br>"
 
-        df_contribution_fund = self.dgr_contribution[
-            self.dgr_contribution["fund"] == fund]
+        # one column per market
+        df_contribution_fund = self.contributionsPerFund()[fund]
 
         if bin is not None:
+            # without bars for the days without data, e.g. holidays,
+            # which the rangebreaks do not hide
             df_contribution_fund = df_contribution_fund.groupby(
-                ["index", pd.Grouper(level="date", freq=bin)]
-            ).sum()
-
-        for market in df_contribution_fund.index.get_level_values(
-                "index").unique():
-            _x = df_contribution_fund.loc[
-                df_contribution_fund.index.get_level_values("index") == market
-                ].index.get_level_values("date")
-            _y = df_contribution_fund.loc[
-                df_contribution_fund.index.get_level_values("index") == market
-                ]["value"]
+                pd.Grouper(freq=bin)).sum(min_count=1).dropna(how="all")
+
+        for market in df_contribution_fund.columns.sort_values():
             long_name = self.marketdatanames[market]
 
-            fig_contr.add_trace(go.Bar(x=_x,
-                                       y=_y,
+            fig_contr.add_trace(go.Bar(x=df_contribution_fund.index,
+                                       y=df_contribution_fund[market],
                                        hovertemplate=hovertemplatebar,
                                        name=long_name),
                                 secondary_y=False)
@@ -215,12 +316,11 @@ class GraphLibrary(DataImport):
             # last value of the prediction equal to the last date value
             # of the bin
             _idx = df_predict_fund.index.to_list()
-            _idx[-1] = max(df_contribution_fund.index.get_level_values("date"))
+            _idx[-1] = df_contribution_fund.index.max()
             df_predict_fund.index = _idx
 
             df_predict_fund = df_predict_fund[
-                df_predict_fund.index.isin(
-                    df_contribution_fund.index.get_level_values("date"))
+                df_predict_fund.index.isin(df_contribution_fund.index)
             ]
 
         fig_contr.add_trace(go.Scatter(x=df_predict_fund.index,
@@ -247,7 +347,11 @@ class GraphLibrary(DataImport):
         )
         return fig_contr
 
-    def buildCountryExposureGraph(self):
+    def buildCountryExposureGraph(self) -> dict:
+        return self.getFigure("countryexposure",
+                              self.makeCountryExposureFigure)
+
+    def makeCountryExposureFigure(self) -> go.Figure:
         # inspired by
         # https://plotly.com/python/horizontal-bar-charts/#bar-chart-with-line-plot
 
@@ -355,27 +459,16 @@ class GraphLibrary(DataImport):
         Build the top cards that present the latest dekkingsgraden and
         the latest markets
         """
+        # only the latest values are needed, see DataImport.getLatest
+        _latest = self.latest
         dbcLayout = []
 
-        for fund in self.dekkingsgraden["fonds"].sort_values().unique():
-            # predictions
-            df_predict_fund = self.dgr_prediction[
-                self.dgr_prediction["fund"] == fund]
-            max_predict_date = max(df_predict_fund.index)
-            max_predict_dgr = df_predict_fund[
-                df_predict_fund.index == max_predict_date]
-            max_predict_dgr = max_predict_dgr["dekkingsgraad"][0]
-
-            # last official number
-            df_dgr_fund = self.dekkingsgraden[
-                self.dekkingsgraden["fonds"] == fund]
-            latest_official_dgr_date = max(df_dgr_fund["date"])
-            latest_official_dgr = df_dgr_fund[
-                df_dgr_fund["date"] == latest_official_dgr_date]
-            latest_official_dgr = latest_official_dgr[
-                "dekkingsgraad"].values[0]
-
-            delta_latest_predict = max_predict_dgr - latest_official_dgr
+        for fund, row in _latest["funds"].iterrows():
+            max_predict_date = row["predict_date"]
+            max_predict_dgr = row["predict"]
+            latest_official_dgr_date = row["official_date"]
+
+            delta_latest_predict = max_predict_dgr - row["official"]
 
             # ugly, but for now ok. For responsiveness change name to
             # short "Bouw"
@@ -403,27 +496,22 @@ class GraphLibrary(DataImport):
                     )
             )
 
-        _marketdata = self.marketdata.dropna()
         dbcMarkets = []
 
-        for market in _marketdata.columns:
-            latest_value = _marketdata[market].iloc[-1:].values[0]
-            max_date = _marketdata.index.max()
-
+        for market, row in _latest["markets"].iterrows():
             if market in self.rates_indices:
-                latest_delta = _marketdata[market].diff().iloc[-1:].values[0]
+                latest_delta = row["value"] - row["previous"]
                 ratesformat = True
             else:
-                latest_delta = _marketdata[market].pct_change().iloc[
-                    -1:].values[0] * 100
+                latest_delta = (row["value"] / row["previous"] - 1) * 100
                 ratesformat = False
 
             dbcMarkets.append(
                 dbc.Col([
                     self.topCardLayout(self.marketdatanames[market],
-                                       latest_value,
+                                       row["value"],
                                        latest_delta,
-                                       max_date,
+                                       row["date"],
                                        False,
                                        ratesformat)
                     ],
@@ -491,3 +579,9 @@ class GraphLibrary(DataImport):
                             className="card-small-{}".format(title))
             ], id="tooltip-dgr-{}".format(title))
         ])
+
+
+# prerender the figures after a run of the backend:
+# python -m pensioendashboard.graphs
+if __name__ == "__main__":
+    GraphLibrary(RATES).prerender()
@@ -0,0 +1,183 @@
+import requests
+import json
+import os
+import time
+import threading
+import logging as LOG
+from concurrent.futures import ThreadPoolExecutor
+from .backend.dataimport import DIRPATH
+
+NEWSAPIURL = os.environ.get("NEWSAPI_URL",
+                            "https://newsapi.org/v2/everything")
+NEWSLOCATION = os.path.join(DIRPATH, "db/cache/news.json")
+TOPICS = ["pensioenfondsen",
+          "beurs",
+          "rente",
+          "valuta"]
+# number of seconds that the news of a topic is considered fresh. Older
+# news is still served, while it is refreshed in the background
+NEWSTTL = 600
+# timeout in seconds for connecting to and reading from the api
+TIMEOUT = (5, 20)
+
+
+class NewsFeed:
+    """
+    The latest news per topic from NewsAPI. The render callbacks only
+    read from the cache and never wait for the api: when the news is
+    older than the ttl, the stale news is returned and a refresh of all
+    topics is started in the background. The cache is also written to
+    a json file, so that the workers of the dashboard share the news.
+    """
+
+    def __init__(self,
+                 api_key: str,
+                 url: str = NEWSAPIURL,
+                 topics: list = TOPICS,
+                 ttl: float = NEWSTTL,
+                 location: str = NEWSLOCATION,
+                 timeout=TIMEOUT):
+        self.api_key = api_key
+        self.url = url
+        self.topics = topics
+        self.ttl = ttl
+        self.location = location
+        self.timeout = timeout
+        # per topic: {"fetched": unix timestamp, "articles": [...]}
+        self._cache = {}
+        self._lock = threading.Lock()
+        self._refreshing = None
+        self._scheduler = None
+
+    def fetchTopic(self, topic: str) -> list:
+        _params = {"q": topic,
+                   "language": "nl",
+                   "sortBy": "publishedAt",
+                   "pageSize": 10,
+                   "page": 1}
+        _response = requests.get(self.url,
+                                 params=_params,
+                                 headers={"X-Api-Key": self.api_key},
+                                 timeout=self.timeout)
+        _response.raise_for_status()
+
+        return _response.json()["articles"]
+
+    def refresh(self):
+        """
+        Fetch all topics at the same time. Topics that fail keep their
+        previous (stale) news.
+        """
+        _now = time.time()
+
+        with ThreadPoolExecutor(max_workers=len(self.topics) or 1) \
+                as executor:
+            _futures = {topic: executor.submit(self.fetchTopic, topic)
+                        for topic in self.topics}
+
+            for topic, future in _futures.items():
+                try:
+                    _articles = future.result()
+                except Exception as err:
+                    LOG.error("Retrieving the news on {} resulted in an "
+                              "error: {}".format(topic, err))
+                    continue
+
+                with self._lock:
+                    self._cache[topic] = {"fetched": _now,
+                                          "articles": _articles}
+
+        self.writeCache()
+
+    def readCache(self):
+        # pick up the news that another worker has fetched
+        if self.location is None:
+            return
+
+        try:
+            with open(self.location) as f:
+                _cache = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        with self._lock:
+            for topic, entry in _cache.items():
+                if entry["fetched"] > self._cache.get(
+                        topic, {"fetched": 0})["fetched"]:
+                    self._cache[topic] = entry
+
+    def writeCache(self):
+        if self.location is None:
+            return
+
+        with self._lock:
+            _json = json.dumps(self._cache)
+
+        try:
+            os.makedirs(os.path.dirname(self.location), exist_ok=True)
+            _tmp = "{}.{}.tmp".format(self.location, os.getpid())
+            with open(_tmp, "w") as f:
+                f.write(_json)
+            os.replace(_tmp, self.location)
+        except OSError as err:
+            LOG.error("Writing the news cache resulted in an error: "
+                      "{}".format(err))
+
+    def isFresh(self, topic: str) -> bool:
+        _entry = self._cache.get(topic)
+        return _entry is not None and \
+            time.time() - _entry["fetched"] < self.ttl
+
+    def refreshInBackground(self) -> threading.Thread:
+        # at most one refresh at a time
+        with self._lock:
+            if self._refreshing is not None and self._refreshing.is_alive():
+                return self._refreshing
+
+            self._refreshing = threading.Thread(target=self.refresh,
+                                                daemon=True)
+            self._refreshing.start()
+            return self._refreshing
+
+    def getNews(self, topic: str):
+        """
+        Return the cached articles of `topic` and the time they were
+        fetched (None if there is no news yet). Never blocks on the api.
+        """
+        if not self.isFresh(topic) and self.location is not None:
+            self.readCache()
+
+        if not self.isFresh(topic):
+            self.refreshInBackground()
+
+        with self._lock:
+            _entry = self._cache.get(topic)
+
+        if _entry is None:
+            return [], None
+        return _entry["articles"], _entry["fetched"]
+
+    def start(self, interval: float = None):
+        """
+        Refresh all topics on a schedule in a background thread, by
+        default every ttl seconds.
+        """
+        _interval = self.ttl if interval is None else interval
+
+        def _run():
+            while True:
+                # skip the refresh when another worker just did it
+                self.readCache()
+                if not all(self.isFresh(topic) for topic in self.topics):
+                    self.refresh()
+                time.sleep(_interval)
+
+        _thread = threading.Thread(target=_run, daemon=True)
+        _thread.start()
+        return _thread
+
+    def ensureStarted(self):
+        # start the schedule once, on first use instead of at import
+        with self._lock:
+            if self._scheduler is None:
+                self._scheduler = self.start()
@@ -0,0 +1,70 @@
+import base64
+import numpy as np
+import pandas as pd
+
+# the data arrays of a trace that are sent as typed arrays. float32
+# keeps about 7 significant digits, so it is only used for y, whose hover
+# and tick formats round it; customdata is shown in full (e.g. the euro
+# amounts of the country exposures)
+TYPEDKEYS = {"x": "f8", "y": "f4", "customdata": "f8"}
+
+
+def typedArray(values: np.ndarray, dtype: str) -> dict:
+    # the typed array format of plotly.js: a base64 encoded buffer
+    _values = np.ascontiguousarray(values, dtype=dtype)
+    return {"dtype": dtype,
+            "bdata": base64.b64encode(_values.tobytes()).decode("ascii")}
+
+
+def encodeValues(values, dtype: str, dates: bool = False):
+    """
+    Encode a list of numbers (or of dates, if `dates`) as a typed array.
+    Dates become milliseconds since the epoch, which plotly.js reads on a
+    date axis. Returns the typed array and whether it holds dates, or
+    None when the values cannot be encoded.
+    """
+    if not isinstance(values, list) or len(values) == 0:
+        return None
+
+    if all(isinstance(value, str) for value in values):
+        if not dates:
+            return None
+        try:
+            _dates = pd.to_datetime(pd.Series(values), errors="raise")
+        except (ValueError, TypeError):
+            return None
+        if _dates.dt.tz is not None:
+            return None
+        return typedArray(_dates.to_numpy("datetime64[ms]").astype(
+            np.int64), "f8"), True
+
+    try:
+        _values = np.array(values, dtype=float)
+    except (ValueError, TypeError):
+        return None
+    return typedArray(_values, dtype), False
+
+
+def compactFigure(figure: dict) -> dict:
+    """
+    Replace the x, y and customdata lists of every trace by typed arrays,
+    so that the figure is smaller to send and faster to parse in the
+    browser. Axes that get dates as numbers are set to a date axis.
+    """
+    _layout = figure.setdefault("layout", {})
+
+    for trace in figure.get("data", []):
+        for key, dtype in TYPEDKEYS.items():
+            _encoded = encodeValues(trace.get(key), dtype,
+                                    dates=key in ("x", "y"))
+            if _encoded is None:
+                continue
+
+            trace[key], _dates = _encoded
+            if _dates:
+                # e.g. xaxis "x2" is layout["xaxis2"]
+                _axis = trace.get("{}axis".format(key), key)
+                _layout.setdefault("{}axis{}".format(key, _axis[1:]),
+                                   {})["type"] = "date"
+
+    return figure
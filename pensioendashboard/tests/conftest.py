@@ -2,13 +2,20 @@
 from selenium.webdriver.chrome.options import Options
 from dotenv import load_dotenv
 import os
+import sqlite3
+import pytest
+import numpy as np
+import pandas as pd
 from pathlib import Path
+from sqlalchemy import create_engine
 
 
 # in case the environment variables are not loaded. These are stored
 # at ../.. location in my development environment
 DIRPATH = Path(os.path.dirname(__file__)).parent.parent
 ENVLOCATION = os.path.join(DIRPATH, ".env")
+INITSQL = os.path.join(Path(os.path.dirname(__file__)).parent,
+                       "db/init.sql")
 
 try:
     load_dotenv(dotenv_path=ENVLOCATION)
@@ -21,6 +28,29 @@ except Exception as e:
           "Error message: {}".format(e))
 
 
+def syntheticDB(location, start: str, end: str,
+                ntickers: int) -> pd.DataFrame:
+    """
+    A sqlite db at `location`, created with init.sql and filled with
+    random market data of the tickers T0, T1, ... for every business day
+    from `start` to `end`. Returns the rows of market data.
+    """
+    _dates = pd.bdate_range(start, end).strftime("%Y-%m-%d")
+    _rows = pd.DataFrame({
+        "date": np.repeat(_dates, ntickers),
+        "name": np.tile(["T{}".format(i) for i in range(ntickers)],
+                        len(_dates)),
+        "value": np.random.default_rng(0).random(ntickers * len(_dates))})
+
+    conn = sqlite3.connect(location)
+    with open(INITSQL) as f:
+        conn.executescript(f.read())
+    _rows.to_sql("marketdata", conn, index=False, if_exists="append")
+    conn.close()
+
+    return _rows
+
+
 def pytest_setup_options():
     options = Options()
     options.add_argument("--disable-gpu")
@@ -28,3 +58,30 @@ def pytest_setup_options():
     options.add_argument("--window-size=1920,1080")
     options.add_argument("--no-sandbox")
     return options
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """
+    A temporary sqlite db, created with init.sql and filled with a few
+    rows of market data. DataImport is pointed to this db; the location
+    of the db file is returned.
+    """
+    from ..backend import dataimport
+
+    _location = os.path.join(tmp_path, "marketdata.db")
+
+    conn = sqlite3.connect(_location)
+    with open(INITSQL) as f:
+        conn.executescript(f.read())
+    conn.executemany(
+        "INSERT INTO marketdata (date, name, value) VALUES (?, ?, ?)",
+        [("2020-07-01", "IWDA.AS", 55.1), ("2020-07-01", "EUSA30", 0.1),
+         ("2020-07-02", "IWDA.AS", 55.6), ("2020-07-03", "EUSA30", 0.12)])
+    conn.commit()
+    conn.close()
+
+    _engine = create_engine("sqlite:///{}".format(_location))
+    monkeypatch.setattr(dataimport, "DBCONNECTION", _engine)
+
+    return _location
@@ -0,0 +1,183 @@
+# tests for the Alpha Vantage client, run against a local fake of the api
+import json
+import os
+import threading
+import time
+import pandas as pd
+import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from ..backend.alphavantage import (AlphaVantage, TokenBucket, outputSize,
+                                    COMPACTSIZE)
+
+SYMBOLS = {"IWDA.AS": {"function": "TIME_SERIES_DAILY",
+                       "symbol": "IWDA.AS"},
+           "EMIM.AS": {"function": "TIME_SERIES_DAILY",
+                       "symbol": "EMIM.AS"},
+           "GSG": {"function": "TIME_SERIES_DAILY", "symbol": "GSG"},
+           "EURUSD": {"function": "FX_DAILY", "from_symbol": "EUR",
+                      "to_symbol": "USD"}}
+
+
+class AlphaVantageServer(ThreadingHTTPServer):
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), AlphaVantageHandler)
+        self.requests = []
+        self.inflight = 0
+        self.maxinflight = 0
+        self.delay = 0.1
+        self.limited = set()
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{}/query".format(self.server_address[1])
+
+
+class AlphaVantageHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        _params = {key: values[0] for key, values in
+                   parse_qs(urlparse(self.path).query).items()}
+        with server.lock:
+            server.requests.append(_params)
+            server.inflight += 1
+            server.maxinflight = max(server.maxinflight, server.inflight)
+
+        time.sleep(server.delay)
+
+        _symbol = _params.get("symbol", _params.get("to_symbol"))
+        if _symbol in server.limited:
+            # the api answers a quota violation with a 200 and a note
+            _body = {"Note": "Thank you for using Alpha Vantage!"}
+        else:
+            _dates = pd.bdate_range(end="2020-07-17", periods=COMPACTSIZE
+                                    if _params["outputsize"] == "compact"
+                                    else 2 * COMPACTSIZE)
+            _key = "Time Series FX (Daily)" \
+                if _params["function"] == "FX_DAILY" \
+                else "Time Series (Daily)"
+            _body = {"Meta Data": {},
+                     _key: {date.strftime("%Y-%m-%d"): {
+                         "1. open": "1.0", "4. close": str(i + 0.5)}
+                         for i, date in enumerate(_dates)}}
+
+        _body = json.dumps(_body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(_body)))
+        self.end_headers()
+        self.wfile.write(_body)
+
+        with server.lock:
+            server.inflight -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    _server = AlphaVantageServer()
+    _thread = threading.Thread(target=_server.serve_forever, daemon=True)
+    _thread.start()
+    yield _server
+    _server.shutdown()
+    _server.server_close()
+
+
+def recent(symbol):
+    return pd.Timestamp("today").normalize() - pd.Timedelta(days=7)
+
+
+def test_tokenbucket_limits_rate():
+    now = [0.0]
+    waits = []
+
+    def sleep(seconds):
+        waits.append(seconds)
+        now[0] += seconds
+
+    bucket = TokenBucket(5, per=60, clock=lambda: now[0], sleep=sleep)
+    for _ in range(7):
+        bucket.acquire()
+
+    # a burst of five, then one call every 12 seconds
+    assert waits == pytest.approx([12, 12])
+    assert now[0] == pytest.approx(24)
+
+
+def test_outputsize_depends_on_gap():
+    today = pd.Timestamp("2020-07-17")
+    assert outputSize(pd.Timestamp("2020-07-10"), today) == "compact"
+    assert outputSize(pd.Timestamp("2019-07-10"), today) == "full"
+    assert outputSize(pd.Timestamp.min, today) == "full"
+
+
+def test_getall_concurrent_within_quota(server):
+    client = AlphaVantage("key", url=server.url, callsperminute=2,
+                          bucket=TokenBucket(2, per=0.5))
+
+    _start = time.perf_counter()
+    results = client.getAll(SYMBOLS, recent)
+    _elapsed = time.perf_counter() - _start
+
+    assert server.maxinflight == 2
+    # two calls at once, then one per 0.25 seconds
+    assert _elapsed >= 0.45
+    assert all(params["apikey"] == "key" and
+               params["outputsize"] == "compact"
+               for params in server.requests)
+
+    assert set(results) == set(SYMBOLS)
+    assert len(results["EURUSD"]) == COMPACTSIZE
+    assert results["IWDA.AS"]["value"].iloc[-1] == COMPACTSIZE - 0.5
+    assert (results["GSG"]["name"] == "GSG").all()
+    assert results["GSG"].index.is_monotonic_increasing
+
+
+def test_getall_full_history_for_new_tickers(server):
+    client = AlphaVantage("key", url=server.url)
+
+    results = client.getAll(
+        SYMBOLS,
+        lambda symbol: pd.Timestamp.min if symbol == "GSG"
+        else recent(symbol))
+
+    sizes = {params.get("symbol", params.get("to_symbol")):
+             params["outputsize"] for params in server.requests}
+    assert sizes == {"IWDA.AS": "compact", "EMIM.AS": "compact",
+                     "GSG": "full", "USD": "compact"}
+    assert len(results["GSG"]) == 2 * COMPACTSIZE
+
+
+def test_getall_caches_responses(server, tmp_path):
+    server.limited = {"EMIM.AS"}
+    client = AlphaVantage("key", url=server.url, cachedir=str(tmp_path))
+
+    results = client.getAll(SYMBOLS, recent)
+    assert results["EMIM.AS"].empty
+    assert len(server.requests) == 4
+
+    # only the failed symbol is requested again
+    server.limited = set()
+    results = client.getAll(SYMBOLS, recent)
+    assert len(server.requests) == 5
+    assert len(results["EMIM.AS"]) == COMPACTSIZE
+
+    client.getAll(SYMBOLS, recent)
+    assert len(server.requests) == 5
+
+
+def test_cache_of_earlier_days_is_removed(tmp_path):
+    today = pd.Timestamp("today").strftime("%Y%m%d")
+    names = ["IWDA.AS_20200717_full.json", "EURUSD_20200716_compact.json",
+             "GSG_{}_full.json".format(today), "notes.txt"]
+    for name in names:
+        (tmp_path / name).write_text("{}")
+
+    client = AlphaVantage("key", cachedir=str(tmp_path))
+
+    assert sorted(os.listdir(tmp_path)) == sorted(names[2:])
+    assert client.readCache("GSG", "compact") == {}
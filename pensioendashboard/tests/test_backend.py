@@ -24,19 +24,21 @@ RECENTDAYS = 3
 
 
 def test_dbdata_available():
-    assert data.df_db.empty is False
+    assert data.df_latest.empty is False
 
 
 def test_alphavantage_available():
-    df = data.ts.get_daily("IWDA.AS", outputsize="compact")
+    df = data.av.query({"function": "TIME_SERIES_DAILY",
+                        "symbol": "IWDA.AS",
+                        "outputsize": "compact"})
     assert df is not None
 
 
 def test_foreignexchange_available():
-    df = data.cc.get_currency_exchange_daily(
-        from_symbol="EUR",
-        to_symbol="USD",
-        outputsize="compact")
+    df = data.av.query({"function": "FX_DAILY",
+                        "from_symbol": "EUR",
+                        "to_symbol": "USD",
+                        "outputsize": "compact"})
     assert df is not None
 
 
@@ -0,0 +1,107 @@
+# tests for the deduplicated backups of the db
+import os
+import sqlite3
+import time
+
+from ..backend.backup import BackupStore
+
+
+def fillDB(location, rows=20000):
+    conn = sqlite3.connect(location)
+    conn.execute("CREATE TABLE IF NOT EXISTS marketdata "
+                 "(id INTEGER PRIMARY KEY, name TEXT, value REAL)")
+    conn.executemany("INSERT INTO marketdata (name, value) VALUES (?, ?)",
+                     [("IWDA.AS", i / 7) for i in range(rows)])
+    conn.commit()
+    conn.close()
+
+
+def readDB(location):
+    conn = sqlite3.connect(location)
+    _rows = conn.execute("SELECT * FROM marketdata ORDER BY id").fetchall()
+    conn.close()
+    return _rows
+
+
+def storedChunks(store):
+    return set(os.listdir(store.chunkFolder()))
+
+
+def test_backup_restores_db(tmp_path):
+    dblocation = str(tmp_path / "marketdata.db")
+    fillDB(dblocation)
+    store = BackupStore(str(tmp_path / "old"), chunksize=4096)
+
+    store.backup(dblocation, name="first")
+    store.restore("first", str(tmp_path / "restored.db"))
+
+    assert readDB(str(tmp_path / "restored.db")) == readDB(dblocation)
+    # no temporary snapshot is left behind
+    assert sorted(os.listdir(store.location)) == ["chunks", "index.json"]
+
+
+def test_backup_only_stores_changed_chunks(tmp_path):
+    dblocation = str(tmp_path / "marketdata.db")
+    fillDB(dblocation)
+    store = BackupStore(str(tmp_path / "old"), chunksize=4096)
+
+    first = store.backup(dblocation, name="first")
+    chunks = storedChunks(store)
+    assert len(chunks) > 10
+
+    # a few new rows only change the last pages of the db
+    fillDB(dblocation, rows=10)
+    second = store.backup(dblocation, name="second")
+    new = storedChunks(store) - chunks
+
+    assert 0 < len(new) < 5
+    assert len(set(second["chunks"]) & set(first["chunks"])) > 10
+
+    store.restore("first", str(tmp_path / "first.db"))
+    assert len(readDB(str(tmp_path / "first.db"))) == 20000
+    store.restore("second", str(tmp_path / "second.db"))
+    assert readDB(str(tmp_path / "second.db")) == readDB(dblocation)
+
+
+def test_backup_while_db_is_written(tmp_path):
+    dblocation = str(tmp_path / "marketdata.db")
+    fillDB(dblocation)
+    store = BackupStore(str(tmp_path / "old"), chunksize=4096)
+
+    # an open write transaction does not make the backup fail
+    conn = sqlite3.connect(dblocation)
+    conn.execute("INSERT INTO marketdata (name, value) VALUES ('GSG', 1)")
+    store.backup(dblocation, name="during")
+    conn.commit()
+    conn.close()
+
+    store.restore("during", str(tmp_path / "during.db"))
+    assert len(readDB(str(tmp_path / "during.db"))) == 20000
+
+
+def test_prune_uses_index(tmp_path):
+    dblocation = str(tmp_path / "marketdata.db")
+    fillDB(dblocation)
+    store = BackupStore(str(tmp_path / "old"), chunksize=4096)
+
+    store.backup(dblocation, name="old")
+    fillDB(dblocation, rows=10)
+    store.backup(dblocation, name="new")
+    chunks = storedChunks(store)
+
+    # both are recent
+    assert store.prune(30) == []
+
+    month = 31 * 24 * 60 * 60
+    assert store.prune(30, now=time.time() + month) == ["old"]
+    assert [entry["name"] for entry in store.readIndex()["snapshots"]] == \
+        ["new"]
+
+    # only the chunks that the new snapshot does not use are removed
+    remaining = storedChunks(store)
+    assert remaining < chunks
+    assert remaining == {"{}.gz".format(digest) for digest in
+                         store.readIndex()["snapshots"][0]["chunks"]}
+
+    # the latest snapshot is always kept
+    assert store.prune(30, now=time.time() + 2 * month) == []
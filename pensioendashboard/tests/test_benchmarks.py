@@ -0,0 +1,297 @@
+# benchmarks of the dashboard, kept small enough to run with the other
+# tests. The timings are printed; run with -s to see them
+import os
+import sys
+import json
+import base64
+import subprocess
+import multiprocessing
+import time
+import pytest
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from sqlalchemy import create_engine
+
+from .conftest import syntheticDB
+from ..backend import dataimport
+from ..backend.connections import readerEngine, writerEngine
+from ..backend.fundsources import SOURCES
+from ..backend.migrations import migrate
+from ..backend.widetable import ensureColumns, rebuildWideTable
+from ..figurestore import FigureStore
+from ..graphs import GraphLibrary, RATES
+from ..payload import compactFigure
+from .test_scrapers import parseBaseline, readFixture
+
+ROOTPATH = Path(os.path.dirname(__file__)).parent.parent
+# peak memory of loading the market data in wide format, in a fresh
+# interpreter; printed in KiB on top of the memory after the imports.
+# Needs linux, for the peak rss in /proc
+LOADCODE = """
+import sys
+import pandas as pd
+from sqlalchemy import create_engine
+from pensioendashboard.backend.widetable import readWide
+def _status(key):
+    with open("/proc/self/status") as f:
+        return next(int(line.split()[1]) for line in f
+                    if line.startswith(key))
+_engine = create_engine("sqlite:///" + sys.argv[1])
+# reset the peak rss, which is reached while importing pandas
+with open("/proc/self/clear_refs", "w") as f:
+    f.write("5")
+_base = _status("VmRSS")
+with _engine.connect() as con:
+    if sys.argv[2] == "stream":
+        _df = readWide(con)
+    else:
+        _df = pd.read_sql("SELECT date, name, value FROM marketdata", con,
+                          index_col="date",
+                          parse_dates={"date": "%Y-%m-%d"}).pivot_table(
+                              values="value", index="date", columns="name")
+print(_status("VmHWM") - _base,
+      _df.shape[0], _df.shape[1])
+"""
+# the benchmarks that compare wall-clock times depend on the load of the
+# machine, so they only run on request:
+# PENSIOENDASHBOARD_BENCHMARKS=1 pytest -s tests/test_benchmarks.py
+timed = pytest.mark.skipif(
+    not os.environ.get("PENSIOENDASHBOARD_BENCHMARKS"),
+    reason="wall-clock benchmark, set PENSIOENDASHBOARD_BENCHMARKS=1")
+IMPORTCODE = "import time; _start = time.perf_counter(); import index; " \
+    "print(time.perf_counter() - _start)"
+
+
+def importTime(dblocation) -> float:
+    # import the dashboards in a fresh interpreter, as a worker does
+    _env = dict(os.environ,
+                PENSIOENDASHBOARD_DB=str(dblocation),
+                NEWSAPI_KEY=os.environ.get("NEWSAPI_KEY", "test"))
+    _env.pop("DASHBOARD_WARMUP", None)
+    _result = subprocess.run([sys.executable, "-c", IMPORTCODE],
+                             cwd=ROOTPATH, env=_env, check=True,
+                             capture_output=True, text=True)
+    return float(_result.stdout.strip().splitlines()[-1])
+
+
+@timed
+def test_import_time_independent_of_data(tmp_path):
+    # a db that does not exist: importing must not touch it
+    missing = tmp_path / "missing.db"
+    time_missing = importTime(missing)
+    assert not missing.exists()
+
+    # twenty years of daily data for twenty tickers
+    large = tmp_path / "large.db"
+    rows = syntheticDB(large, "2000-01-01", "2020-01-01", 20)
+
+    time_large = importTime(large)
+
+    print("\nimport time: {:.2f}s without db, {:.2f}s with {} rows".format(
+        time_missing, time_large, len(rows)))
+    assert time_large < 1.5 * time_missing + 0.5
+
+
+def plainFigure(figure: dict) -> dict:
+    # the figure with plain json lists, as older versions of plotly
+    # serialize it
+    for trace in figure["data"]:
+        for key, values in trace.items():
+            if isinstance(values, dict) and "bdata" in values:
+                trace[key] = np.frombuffer(
+                    base64.b64decode(values["bdata"]),
+                    dtype=values["dtype"]).tolist()
+    return figure
+
+
+@pytest.fixture
+def filleddb(db):
+    # five years of market data, dekkingsgraden, predictions,
+    # contributions and country exposures for two funds
+    engine = dataimport.DBCONNECTION
+    migrate(engine)
+    rng = np.random.default_rng(0)
+    dates = pd.bdate_range("2015-07-01", "2020-07-17")
+    tickers = ["EMIM.AS", "EURUSD", "EUSA30", "GSG", "IWDA.AS"]
+    funds = ["ABP", "PFZW"]
+    monthends = pd.date_range("2015-07-31", "2020-06-30", freq="M")
+    window = dates[dates > monthends[-1]]
+
+    marketdata = pd.DataFrame({
+        "date": np.repeat(dates.strftime("%Y-%m-%d"), len(tickers)),
+        "name": np.tile(tickers, len(dates)),
+        "value": 1 + rng.random(len(dates) * len(tickers))})
+    names = pd.DataFrame({"short_name": tickers, "long_name": tickers})
+    dgr = pd.DataFrame({
+        "date": np.tile(monthends.strftime("%Y-%m-%d"), len(funds)),
+        "name": np.repeat(funds, len(monthends)),
+        "value": 0.9 + rng.random(len(funds) * len(monthends)) / 10})
+    prediction = pd.DataFrame({
+        "fund": np.repeat(funds, len(window)),
+        "date": np.tile(window.strftime("%Y-%m-%d"), len(funds)),
+        "value": 90 + rng.random(len(funds) * len(window))})
+    contribution = prediction[["fund", "date"]].assign(**{
+        ticker: rng.normal(0, 0.1, len(prediction)) for ticker in tickers})
+    exposures = pd.DataFrame({
+        "date": "2019-12-31",
+        "fund": np.repeat(funds, 30),
+        "country": np.tile(["Land {}".format(i) for i in range(30)], 2),
+        "value": rng.random(60) * 1e9})
+
+    with engine.begin() as con:
+        con.execute("DELETE FROM marketdata")
+        marketdata.to_sql("marketdata", con, index=False, if_exists="append")
+        names.to_sql("marketdata_names", con, index=False,
+                     if_exists="append")
+        dgr.to_sql("dekkingsgraad", con, index=False, if_exists="append")
+        prediction.to_sql("dgr_prediction_current", con, index=False,
+                          if_exists="append")
+        ensureColumns(con, "dgr_contribution_current", tickers)
+        contribution.to_sql("dgr_contribution_current", con, index=False,
+                            if_exists="append")
+        exposures.to_sql("country_exposures", con, index=False,
+                         if_exists="append")
+        rebuildWideTable(con)
+
+    return db
+
+
+def test_figure_payload_size(filleddb, tmp_path):
+    library = GraphLibrary(RATES, figurestore=FigureStore(str(tmp_path)))
+    figures = {
+        "dgr": lambda: library.makeDGRFigure(start_date=None),
+        "equity": lambda: library.makeEquityFigure(start_date=None),
+        "rates": lambda: library.makeRatesFigure(start_date=None),
+        "contribution": lambda: library.makeContributionFigure("ABP", "D"),
+        "countryexposure": library.makeCountryExposureFigure}
+
+    print()
+    for name, builder in figures.items():
+        _json = builder().to_json()
+        plain = len(json.dumps(plainFigure(json.loads(_json))))
+        compact = len(json.dumps(compactFigure(json.loads(_json))))
+
+        print("{:16} {:>9} bytes plain, {:>9} bytes typed ({:.0%})".format(
+            name, plain, compact, compact / plain))
+        assert compact < plain
+
+
+def backendRun(location: str, wal: bool, stop):
+    # append market data in large transactions, as the backend does. Runs
+    # in its own process, like the backend container
+    if wal:
+        writer = writerEngine(location)
+    else:
+        # the default journal mode, as before the connection factory
+        writer = create_engine("sqlite:///{}".format(location))
+
+    _day = 0
+    while not stop.is_set():
+        _day += 1
+        _rows = pd.DataFrame({
+            "date": "2030-{:02d}-{:02d}".format(_day // 28 + 1,
+                                                _day % 28 + 1),
+            "name": ["W{}".format(i) for i in range(50000)],
+            "value": 1.0})
+        with writer.begin() as con:
+            _rows.to_sql("marketdata", con, index=False, if_exists="append")
+
+
+def readLatencies(location: str, wal: bool,
+                  seconds: float = 1.5) -> np.ndarray:
+    # read the history of a ticker, as the dashboard does, during a run
+    # of the backend
+    if wal:
+        reader = readerEngine(location)
+    else:
+        reader = create_engine("sqlite:///{}".format(location))
+
+    _stop = multiprocessing.Event()
+    _backend = multiprocessing.Process(target=backendRun,
+                                       args=(location, wal, _stop))
+    _backend.start()
+    # give the backend time to start writing
+    time.sleep(0.5)
+
+    _latencies = []
+    _end = time.perf_counter() + seconds
+    try:
+        while time.perf_counter() < _end:
+            _start = time.perf_counter()
+            with reader.connect() as con:
+                con.execute("SELECT date, value FROM marketdata "
+                            "WHERE name = 'T1'").fetchall()
+            _latencies.append(time.perf_counter() - _start)
+    finally:
+        _stop.set()
+        _backend.join()
+
+    return np.array(_latencies)
+
+
+@timed
+def test_read_latency_during_backend_run(tmp_path):
+    latencies = {}
+    for mode in ["delete", "wal"]:
+        location = str(tmp_path / "{}.db".format(mode))
+        syntheticDB(location, "2015-01-01", "2020-01-01", 10)
+
+        latencies[mode] = readLatencies(location, mode == "wal")
+
+    print()
+    for mode, values in latencies.items():
+        print("{:6} {:>5} reads, p50 {:.1f}ms, p95 {:.1f}ms, max "
+              "{:.1f}ms".format(mode, len(values),
+                                1000 * np.percentile(values, 50),
+                                1000 * np.percentile(values, 95),
+                                1000 * values.max()))
+
+    # in wal mode a read never waits for a commit of the backend, so its
+    # slowest read is faster than without wal
+    assert latencies["wal"].max() < latencies["delete"].max()
+
+
+def test_wide_load_peak_memory(tmp_path):
+    # twenty years of daily data for fifty tickers
+    location = tmp_path / "marketdata.db"
+    rows = syntheticDB(location, "2000-01-01", "2020-01-01", 50)
+    ndates = rows["date"].nunique()
+
+    peaks = {}
+    for method in ["pivot", "stream"]:
+        _result = subprocess.run(
+            [sys.executable, "-c", LOADCODE, str(location), method],
+            cwd=ROOTPATH, check=True, capture_output=True, text=True)
+        peak, nrows, ncolumns = map(
+            int, _result.stdout.strip().splitlines()[-1].split())
+        assert (nrows, ncolumns) == (ndates, 50)
+        peaks[method] = peak
+
+    print("\npeak rss of loading {} rows: {} MiB with read_sql and "
+          "pivot_table, {} MiB streamed".format(
+              len(rows), peaks["pivot"] // 1024, peaks["stream"] // 1024))
+    assert peaks["stream"] < peaks["pivot"]
+
+
+@timed
+def test_fund_parse_speed():
+    repeats = 20
+
+    print()
+    for source in SOURCES:
+        html = readFixture(source.name)
+
+        _start = time.perf_counter()
+        for _ in range(repeats):
+            parseBaseline(source.name, html)
+        baseline = (time.perf_counter() - _start) / repeats
+
+        _start = time.perf_counter()
+        for _ in range(repeats):
+            source.parse(html)
+        parse = (time.perf_counter() - _start) / repeats
+
+        print("{:9} {:6.1f}ms before, {:6.1f}ms with lxml".format(
+            source.name, 1000 * baseline, 1000 * parse))
+        assert parse < baseline
@@ -0,0 +1,79 @@
+# tests for the connection factory of the db
+import threading
+import time
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from ..backend.connections import readerEngine, writerEngine
+
+
+def test_engines_are_shared_per_db(db):
+    assert writerEngine(db) is writerEngine(db)
+    assert readerEngine(db) is readerEngine(db)
+    assert readerEngine(db) is not writerEngine(db)
+
+
+def test_writer_enables_wal(db):
+    with writerEngine(db).connect() as con:
+        assert con.execute("PRAGMA journal_mode").scalar() == "wal"
+        assert con.execute("PRAGMA synchronous").scalar() == 1
+
+    with readerEngine(db).connect() as con:
+        assert con.execute("PRAGMA journal_mode").scalar() == "wal"
+        assert con.execute("PRAGMA mmap_size").scalar() > 0
+
+
+def test_reader_is_read_only(db):
+    with pytest.raises(OperationalError):
+        with readerEngine(db).begin() as con:
+            con.execute("DELETE FROM marketdata")
+
+    with readerEngine(db).connect() as con:
+        assert con.execute("SELECT COUNT(*) FROM marketdata").scalar() == 4
+
+
+def test_reader_does_not_wait_for_writer(db):
+    writer = writerEngine(db)
+
+    with writer.begin() as con:
+        con.execute("INSERT INTO marketdata (date, name, value) "
+                    "VALUES ('2020-07-06', 'IWDA.AS', 56)")
+
+        # the reader sees the last committed state, without waiting
+        _start = time.perf_counter()
+        with readerEngine(db).connect() as reader:
+            assert reader.execute(
+                "SELECT COUNT(*) FROM marketdata").scalar() == 4
+        assert time.perf_counter() - _start < 1
+
+    with readerEngine(db).connect() as reader:
+        assert reader.execute(
+            "SELECT COUNT(*) FROM marketdata").scalar() == 5
+
+
+def test_writers_take_turns(db):
+    writer = writerEngine(db)
+    inside = []
+    overlap = []
+
+    def write(date):
+        with writer.begin() as con:
+            inside.append(date)
+            overlap.append(len(inside))
+            con.execute("INSERT INTO marketdata (date, name, value) "
+                        "VALUES (?, 'GSG', 1)", (date, ))
+            time.sleep(0.05)
+            inside.remove(date)
+
+    threads = [threading.Thread(target=write,
+                                args=("2020-07-{:02d}".format(day), ))
+               for day in range(6, 11)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert max(overlap) == 1
+    with readerEngine(db).connect() as reader:
+        assert reader.execute("SELECT COUNT(*) FROM marketdata "
+                              "WHERE name = 'GSG'").scalar() == 5
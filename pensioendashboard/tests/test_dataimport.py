@@ -0,0 +1,354 @@
+# tests for the data layer of the dashboard, run against a
+# temporary sqlite db instead of the production db
+import sqlite3
+import pytest
+import numpy as np
+import pandas as pd
+from sqlalchemy import event
+
+from .. import backend
+from ..backend import dataimport, websitesDgr
+from ..backend.dataimport import DataImport
+from ..backend.migrations import MIGRATIONS, getSchemaVersion, migrate
+from ..backend.widetable import (readWide, rebuildWideTable,
+                                 updateWideTable)
+
+
+def bumpVersion(location):
+    conn = sqlite3.connect(location)
+    conn.execute("UPDATE data_version SET version = version + 1")
+    conn.commit()
+    conn.close()
+
+
+def test_snapshot_hits_and_misses(db):
+    data = DataImport(checkinterval=0)
+
+    first = data.marketdata
+    for _ in range(10):
+        assert data.marketdata is first
+
+    assert data.cache_stats["misses"] == 1
+    assert data.cache_stats["hits"] == 10
+
+
+def test_snapshot_refreshes_on_new_version(db):
+    data = DataImport(checkinterval=0)
+
+    first = data.marketdata
+    bumpVersion(db)
+
+    assert data.marketdata is not first
+    assert data.cache_stats["misses"] == 2
+    assert data.cache_stats["refreshes"] == 1
+
+
+def test_snapshot_version_check_interval(db):
+    data = DataImport(checkinterval=3600)
+
+    first = data.marketdata
+    bumpVersion(db)
+
+    # within the check interval the snapshot is served as is
+    assert data.marketdata is first
+
+
+def test_widetable_matches_pivot(db):
+    engine = dataimport.DBCONNECTION
+    data = DataImport(checkinterval=0)
+    expected = data.getMarketDataFromLong()
+
+    with engine.begin() as con:
+        rebuildWideTable(con)
+    pd.testing.assert_frame_equal(data.getMarketData(), expected,
+                                  check_freq=False)
+
+    # add new rows and only update the wide table incrementally
+    conn = sqlite3.connect(db)
+    conn.executemany(
+        "INSERT INTO marketdata (date, name, value) VALUES (?, ?, ?)",
+        [("2020-07-06", "IWDA.AS", 56.0), ("2020-07-07", "EUSA30", 0.15)])
+    conn.commit()
+    conn.close()
+
+    with engine.begin() as con:
+        updateWideTable(con, "2020-07-06")
+    pd.testing.assert_frame_equal(data.getMarketData(),
+                                  data.getMarketDataFromLong(),
+                                  check_freq=False)
+
+    # the date filter is applied in the query
+    df = data.getMarketData(start_date="2020-07-03")
+    assert df.index.min() == pd.Timestamp("2020-07-03")
+
+
+def test_empty_widetable_falls_back_to_long(db):
+    # e.g. an empty wide table left by an older init.sql
+    conn = sqlite3.connect(db)
+    conn.execute("CREATE TABLE marketdata_wide "
+                 "(date TEXT NOT NULL PRIMARY KEY)")
+    conn.commit()
+    conn.close()
+
+    data = DataImport(checkinterval=0)
+    expected = data.getMarketDataFromLong()
+
+    assert not expected.empty
+    pd.testing.assert_frame_equal(data.getMarketData(), expected)
+    pd.testing.assert_frame_equal(
+        data.getMarketData(start_date="2020-07-02"),
+        expected[expected.index >= "2020-07-02"])
+
+
+def test_empty_window_does_not_pivot_long(db, monkeypatch):
+    with dataimport.DBCONNECTION.begin() as con:
+        rebuildWideTable(con)
+
+    data = DataImport(checkinterval=0)
+
+    def _fromLong():
+        raise AssertionError("the long table should not be pivoted")
+
+    monkeypatch.setattr(data, "getMarketDataFromLong", _fromLong)
+
+    # a window after the last date is an empty read of the wide table
+    df = data.getMarketData(start_date="2021-01-01")
+    assert df.empty
+    assert list(df.columns) == ["EUSA30", "IWDA.AS"]
+
+
+def test_readwide_streams_chunks(db):
+    engine = dataimport.DBCONNECTION
+
+    with engine.connect() as con:
+        expected = pd.read_sql(
+            "SELECT date, name, value FROM marketdata", con,
+            index_col="date", parse_dates={"date": "%Y-%m-%d"}).pivot_table(
+                values="value", index="date", columns="name")
+
+        # chunks smaller than the number of rows
+        pd.testing.assert_frame_equal(readWide(con, chunksize=3), expected)
+
+        df = readWide(con, "2020-07-02", chunksize=1, dtype=np.float32)
+        assert df.dtypes.eq(np.float32).all()
+        pd.testing.assert_frame_equal(
+            df, expected[expected.index >= "2020-07-02"].astype(np.float32))
+
+
+class AppendingConnection:
+    """
+    A connection on which the backend appends a new date and a new
+    ticker right after readWide has read its lists of dates and names.
+    """
+
+    def __init__(self, con, location):
+        self.con = con
+        self.connection = con.connection
+        self.location = location
+        self.queries = 0
+
+    def execute(self, *args):
+        _result = self.con.execute(*args).fetchall()
+        self.queries += 1
+        if self.queries == 2:
+            conn = sqlite3.connect(self.location)
+            conn.executemany(
+                "INSERT INTO marketdata (date, name, value) "
+                "VALUES (?, ?, ?)",
+                [("2020-07-06", "IWDA.AS", 56.0),
+                 ("2020-07-02", "ZZZ", 1.0)])
+            conn.commit()
+            conn.close()
+        return _result
+
+
+def test_readwide_ignores_rows_added_while_reading(db):
+    engine = dataimport.DBCONNECTION
+
+    with engine.connect() as con:
+        expected = readWide(con)
+        df = readWide(AppendingConnection(con, db), chunksize=2)
+
+    # the new rows are left out, instead of raising or ending up in the
+    # column of the last ticker
+    pd.testing.assert_frame_equal(df, expected)
+
+
+# small reference tables that are read in full by design, and the
+# schema of the db
+FULLREAD_TABLES = ["marketdata_names", "country_exposures", "sqlite_master"]
+
+
+def captureQueries(engine, func):
+    _queries = []
+
+    def _capture(conn, cursor, statement, parameters, context, many):
+        # skip the PRAGMA lookups that pandas does itself
+        if not statement.lstrip().upper().startswith("PRAGMA"):
+            _queries.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", _capture)
+    try:
+        func()
+    finally:
+        event.remove(engine, "before_cursor_execute", _capture)
+
+    return _queries
+
+
+def fullTableScans(location, statement, parameters) -> list:
+    conn = sqlite3.connect(location)
+    _plan = [row[3] for row in conn.execute(
+        "EXPLAIN QUERY PLAN " + statement, parameters)]
+    conn.close()
+
+    # scans of materialized subqueries are fine, scans of tables
+    # without an index are not
+    _subqueries = [line.split()[-1] for line in _plan
+                   if line.startswith(("MATERIALIZE", "CO-ROUTINE"))]
+    return [line for line in _plan
+            if line.startswith("SCAN ") and "USING" not in line
+            and line.split()[1] not in _subqueries + FULLREAD_TABLES]
+
+
+def test_queries_use_index(db, monkeypatch):
+    engine = dataimport.DBCONNECTION
+    migrate(engine)
+    with engine.begin() as con:
+        rebuildWideTable(con)
+    monkeypatch.setattr(backend, "DBCONNECTION", engine)
+
+    data = DataImport(checkinterval=0)
+
+    def _run():
+        data.getDataVersion()
+        data.getMarketData()
+        data.getMarketData(start_date="2020-07-02", end_date="2020-07-03")
+        data.getMarketDataFromLong()
+        data.getMarketDataNames()
+        data.getDekkingsgraden()
+        data.getCountryExposure()
+        data.getDGRPrediction()
+        data.getDGRContribution()
+        data.getLatest()
+        backend.purgeDB()
+
+    _queries = captureQueries(engine, _run)
+    assert len(_queries) >= 10
+
+    for statement, parameters in _queries:
+        assert fullTableScans(db, statement, parameters) == [], statement
+
+
+def test_migrate_is_idempotent(db):
+    engine = dataimport.DBCONNECTION
+    migrate(engine)
+    migrate(engine)
+
+    with engine.connect() as con:
+        assert getSchemaVersion(con) == MIGRATIONS[-1][0]
+
+
+class FakeCollector:
+    def __init__(self, results):
+        self.results = results
+
+    def collect(self):
+        return self.results
+
+
+def test_updatedgr_single_transaction_upsert(db, monkeypatch):
+    engine = dataimport.DBCONNECTION
+    migrate(engine)
+    monkeypatch.setattr(websitesDgr, "DBCONNECTION", engine)
+
+    conn = sqlite3.connect(db)
+    conn.execute("INSERT INTO dekkingsgraad (date, name, value) "
+                 "VALUES ('2020-05-31', 'ABP', 0.9)")
+    conn.commit()
+    conn.close()
+
+    statements = []
+    event.listen(engine, "before_cursor_execute",
+                 lambda *args: statements.append(args[2]))
+
+    update = websitesDgr.UpdateDGR()
+    update.collector = FakeCollector({
+        "ABP": pd.DataFrame({"date": pd.to_datetime(["2020-05-31",
+                                                     "2020-06-30",
+                                                     "2020-07-31"]),
+                             "name": "ABP",
+                             "value": [0.9, 0.91, 0.92]}),
+        "PMT": pd.DataFrame({"date": pd.to_datetime(["2020-07-31"]),
+                             "name": "PMT",
+                             "value": [0.95]})})
+    update.updateDB()
+
+    # one read of the latest values and one batched write
+    assert len([s for s in statements if s.startswith("INSERT")]) == 1
+
+    df = DataImport(checkinterval=0).getDekkingsgraden()
+    assert len(df) == 4
+    assert df[df["fonds"] == "PMT"]["dekkingsgraad"].iloc[0] == \
+        pytest.approx(95)
+
+
+def test_updatedgr_empty_page_of_new_fund(db, monkeypatch):
+    engine = dataimport.DBCONNECTION
+    migrate(engine)
+    monkeypatch.setattr(websitesDgr, "DBCONNECTION", engine)
+
+    # a fund without rows in the db, whose page parses to nothing, does
+    # not stop the rows of the other funds from being written
+    update = websitesDgr.UpdateDGR()
+    update.collector = FakeCollector({
+        "ABP": pd.DataFrame(columns=["date", "name", "value"]),
+        "PMT": pd.DataFrame({"date": pd.to_datetime(["2020-07-31"]),
+                             "name": "PMT",
+                             "value": [0.95]})})
+    update.updateDB()
+
+    df = DataImport(checkinterval=0).getDekkingsgraden()
+    assert list(df["fonds"]) == ["PMT"]
+
+
+def test_latest_snapshot(db):
+    engine = dataimport.DBCONNECTION
+    migrate(engine)
+    conn = sqlite3.connect(db)
+    conn.executemany(
+        "INSERT INTO marketdata_names (short_name, long_name) "
+        "VALUES (?, ?)",
+        [("IWDA.AS", "MSCI World"), ("EUSA30", "30y EUR swap rate"),
+         ("GSG", "Commodities")])
+    conn.executemany(
+        "INSERT INTO marketdata (date, name, value) VALUES (?, ?, ?)",
+        [("2020-07-06", "IWDA.AS", 56.0), ("2020-07-06", "GSG", 10.0)])
+    conn.executemany(
+        "INSERT INTO dekkingsgraad (date, name, value) VALUES (?, ?, ?)",
+        [("2020-05-31", "ABP", 0.9), ("2020-06-30", "ABP", 0.92),
+         ("2020-06-30", "PMT", 0.88)])
+    conn.executemany(
+        "INSERT INTO dgr_prediction_current (fund, date, value) "
+        "VALUES (?, ?, ?)",
+        [("ABP", "2020-07-03", 92.5), ("ABP", "2020-07-06", 93.0),
+         ("PMT", "2020-07-06", 87.0)])
+    conn.commit()
+    conn.close()
+
+    latest = DataImport(checkinterval=0).getLatest()
+    funds = latest["funds"]
+    markets = latest["markets"]
+
+    assert list(funds.index) == ["ABP", "PMT"]
+    assert funds.loc["ABP", "official"] == pytest.approx(92)
+    assert funds.loc["ABP", "official_date"] == pd.Timestamp("2020-06-30")
+    assert funds.loc["ABP", "predict"] == 93.0
+    assert funds.loc["ABP", "predict_date"] == pd.Timestamp("2020-07-06")
+
+    assert list(markets.index) == ["EUSA30", "GSG", "IWDA.AS"]
+    assert markets.loc["IWDA.AS", "value"] == 56.0
+    assert markets.loc["IWDA.AS", "previous"] == 55.6
+    assert markets.loc["IWDA.AS", "date"] == pd.Timestamp("2020-07-06")
+    assert markets.loc["EUSA30", "previous"] == 0.1
+    assert pd.isna(markets.loc["GSG", "previous"])
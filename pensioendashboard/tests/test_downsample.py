@@ -0,0 +1,42 @@
+# tests for the downsampling of long histories
+import numpy as np
+import pandas as pd
+
+from ..backend.downsample import downsampleFrame, lttb
+
+
+def test_lttb_keeps_shape():
+    x = np.arange(10000)
+    y = np.sin(x / 500)
+    y[4321] = 10  # a spike that must survive
+
+    indices = lttb(x, y, 200)
+
+    assert len(indices) == 200
+    assert indices[0] == 0 and indices[-1] == len(x) - 1
+    assert np.all(np.diff(indices) > 0)
+    assert 4321 in indices
+    assert y[indices].min() < -0.99 and y[indices].max() == 10
+
+
+def test_lttb_short_series_untouched():
+    np.testing.assert_array_equal(lttb(np.arange(5), np.ones(5), 10),
+                                  np.arange(5))
+
+
+def test_downsample_frame():
+    dates = pd.bdate_range("1990-01-01", periods=8000)
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({"A": np.cumsum(rng.normal(size=len(dates))),
+                       "B": np.cumsum(rng.normal(size=len(dates)))},
+                      index=dates)
+    df.iloc[:100, 1] = np.nan
+
+    result = downsampleFrame(df, 300)
+
+    assert len(result) <= 2 * 300
+    assert result.index.is_monotonic_increasing
+    assert result.index[0] == dates[0] and result.index[-1] == dates[-1]
+    # the first valid value of every column is kept
+    assert dates[100] in result.index
+    assert downsampleFrame(df.iloc[:100], 300) is not None
@@ -0,0 +1,69 @@
+# tests for the parser of the Dutch dates on the scraped websites
+import numpy as np
+import pandas as pd
+import pytest
+from dateparser import parse
+
+from ..backend import dutchdates
+from ..backend.dutchdates import parseDates
+
+MONTHSTRINGS = ["Februari 2020", "juni 2020", "Mei 2020*", "Mrt 2020",
+                "december 2019", " Juli  2020 ", "31-05-2020",
+                "1 juni 2020", "30 jun. 2020", "17 september 2020"]
+
+
+@pytest.fixture
+def counters(monkeypatch):
+    monkeypatch.setattr(dutchdates, "COUNTERS", dutchdates.Counter())
+    return dutchdates.COUNTERS
+
+
+def test_parse_matches_dateparser(counters):
+    expected = [parse(value, languages=["nl"],
+                      settings={"PREFER_DAY_OF_MONTH": "last"})
+                for value in MONTHSTRINGS]
+
+    assert list(parseDates(pd.Series(MONTHSTRINGS))) == expected
+    assert counters == {"fast": len(MONTHSTRINGS)}
+
+
+def test_parse_first_day_of_month(counters):
+    parsed = parseDates(pd.Series(["Februari 2020", "17-07-2020"]),
+                        monthend=False)
+
+    assert list(parsed) == [pd.Timestamp("2020-02-01"),
+                            pd.Timestamp("2020-07-17")]
+
+
+def test_parse_falls_back_for_unknown_strings(counters):
+    values = pd.Series(["juni 2020", "2020-06-30", None, "Q2 2020"],
+                       index=[3, 5, 7, 9])
+    parsed = parseDates(values)
+
+    assert list(parsed.index) == [3, 5, 7, 9]
+    assert parsed[3] == pd.Timestamp("2020-06-30")
+    assert parsed[5] == pd.Timestamp("2020-06-30")
+    assert parsed[7:].isna().all()
+    assert counters == {"fast": 1, "fallback": 2, "failed": 1}
+
+
+def test_parse_many_dates_without_fallback(counters, monkeypatch):
+    def _fallback(*args, **kwargs):
+        raise AssertionError("dateparser should not be used")
+
+    monkeypatch.setattr(dutchdates, "fallback", _fallback)
+
+    days = pd.bdate_range("2000-01-01", "2020-07-17")
+    parsed = parseDates(pd.Series(days.strftime("%d-%m-%Y")))
+    np.testing.assert_array_equal(parsed.values, days.values)
+
+    months = pd.Series(["{} {}".format(month, year)
+                        for year in range(2000, 2021)
+                        for month in ["januari", "februari", "maart",
+                                      "april", "mei", "juni", "juli",
+                                      "augustus", "september", "oktober",
+                                      "november", "december"]])
+    parsed = parseDates(months)
+    assert list(parsed) == list(pd.date_range("2000-01-31", "2020-12-31",
+                                              freq="M"))
+    assert counters["fast"] == len(days) + len(months)
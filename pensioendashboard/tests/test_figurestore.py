@@ -0,0 +1,198 @@
+# tests for the figure store, with two GraphLibrary instances sharing
+# one store in the same way as the workers of the dashboard
+import base64
+import os
+import sqlite3
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+from ..backend import dataimport
+from ..backend.migrations import migrate
+from ..backend.widetable import ensureColumns, rebuildWideTable
+from ..figurestore import FigureStore
+from ..graphs import CONTRIBUTIONBINS, GraphLibrary
+
+
+def prepareDB(location):
+    conn = sqlite3.connect(location)
+    conn.executemany(
+        "INSERT INTO marketdata_names (short_name, long_name) "
+        "VALUES (?, ?)",
+        [("IWDA.AS", "MSCI World"), ("EUSA30", "30y EUR swap rate")])
+    conn.commit()
+    conn.close()
+
+    with dataimport.DBCONNECTION.begin() as con:
+        rebuildWideTable(con)
+
+
+def traceValues(values) -> np.ndarray:
+    # recent versions of plotly store arrays as base64 typed arrays
+    if isinstance(values, dict):
+        return np.frombuffer(base64.b64decode(values["bdata"]),
+                             dtype=values["dtype"])
+    return np.asarray(values)
+
+
+def test_figurestore_roundtrip_and_purge(tmp_path):
+    store = FigureStore(str(tmp_path))
+    fig = go.Figure(go.Scatter(x=[1, 2], y=[3, 4]))
+
+    saved = store.save(1, "test", fig)
+    assert store.load(1, "test") == saved
+    assert list(traceValues(saved["data"][0]["y"])) == [3, 4]
+    assert store.load(2, "test") is None
+
+    store.save(2, "test", fig)
+    store.purge(2)
+    assert store.load(1, "test") is None
+    assert store.load(2, "test") == saved
+
+
+def test_figurestore_purges_on_new_version(tmp_path):
+    store = FigureStore(str(tmp_path))
+    fig = go.Figure(go.Scatter(x=[1, 2], y=[3, 4]))
+
+    store.save(1, "a", fig)
+    store.save(1, "b", fig)
+    assert store.load(1, "a") is not None
+
+    # the first figure of version 2 removes version 1
+    store.save(2, "a", fig)
+    assert sorted(os.listdir(tmp_path)) == ["v2"]
+
+    # a worker still on an older version leaves the newer one alone
+    store.save(1, "a", fig)
+    assert sorted(os.listdir(tmp_path)) == ["v1", "v2"]
+    store.save(3, "a", fig)
+    assert sorted(os.listdir(tmp_path)) == ["v3"]
+
+
+def test_figures_built_once_per_version(db, tmp_path):
+    prepareDB(db)
+    store = FigureStore(str(tmp_path))
+    builds = []
+
+    def worker():
+        library = GraphLibrary(["EUSA30"], figurestore=store)
+        make = library.makeEquityFigure
+
+        def _makeEquityFigure(start_date):
+            builds.append(start_date)
+            return make(start_date)
+
+        library.makeEquityFigure = _makeEquityFigure
+        return library
+
+    first = worker()
+    graph = first.buildEquityGraph(start_date=None)
+    assert len(builds) == 1
+    assert graph.figure["data"][0]["name"] == "MSCI World"
+
+    # the same worker serves the figure from its snapshot, another
+    # worker from the store
+    first.buildEquityGraph(start_date=None)
+    second = worker()
+    assert second.buildEquityGraph(start_date=None).figure == graph.figure
+    assert len(builds) == 1
+
+    # a new data version is built again
+    conn = sqlite3.connect(db)
+    conn.execute("UPDATE data_version SET version = version + 1")
+    conn.commit()
+    conn.close()
+    worker().buildEquityGraph(start_date=None)
+    assert len(builds) == 2
+
+
+def test_contribution_variants(db, tmp_path):
+    prepareDB(db)
+    engine = dataimport.DBCONNECTION
+    migrate(engine)
+
+    # without a holiday on friday 3 July
+    dates = pd.bdate_range("2020-06-01", "2020-07-17").drop(
+        pd.Timestamp("2020-07-03"))
+    rng = np.random.default_rng(1)
+    wide = pd.concat([
+        pd.DataFrame({"fund": fund,
+                      "date": dates.strftime("%Y-%m-%d"),
+                      "IWDA.AS": rng.normal(0, 0.1, len(dates)),
+                      "EUSA30": rng.normal(0, 0.1, len(dates))})
+        for fund in ["ABP", "PFZW"]])
+    with engine.begin() as con:
+        ensureColumns(con, "dgr_contribution_current", ["IWDA.AS", "EUSA30"])
+        wide.to_sql("dgr_contribution_current", con, index=False,
+                    if_exists="append")
+        wide.assign(value=95.0)[["fund", "date", "value"]].to_sql(
+            "dgr_prediction_current", con, index=False, if_exists="append")
+
+    store = FigureStore(str(tmp_path))
+    library = GraphLibrary(["EUSA30"], figurestore=store)
+    library.prerender()
+
+    for fund in ["ABP", "PFZW"]:
+        for bin in CONTRIBUTIONBINS:
+            assert store.load(0, "contribution_{}_{}".format(fund, bin))
+
+    # the weekly bins equal the grouping of the long format
+    df = library.dgr_contribution
+    expected = df[df["fund"] == "PFZW"].groupby(
+        ["index", pd.Grouper(level="date", freq="W-FRI")])["value"].sum()
+    figure = library.buildContributionGraph("PFZW", "W-FRI")
+    bars = {trace["name"]: traceValues(trace["y"]) for trace in figure["data"]
+            if trace["type"] == "bar"}
+
+    assert sorted(bars) == ["30y EUR swap rate", "MSCI World"]
+    np.testing.assert_allclose(bars["MSCI World"],
+                               expected["IWDA.AS"].values)
+    np.testing.assert_allclose(bars["30y EUR swap rate"],
+                               expected["EUSA30"].values)
+
+    # the daily bins only have bars on the days with data
+    figure = library.buildContributionGraph("PFZW", "D")
+    for trace in figure["data"]:
+        if trace["type"] == "bar":
+            np.testing.assert_array_equal(
+                traceValues(trace["x"]).astype("datetime64[ms]"),
+                dates.values.astype("datetime64[ms]"))
+
+
+def test_equity_window_and_downsampling(db, tmp_path):
+    prepareDB(db)
+    library = GraphLibrary(["EUSA30"], figurestore=FigureStore(str(tmp_path)))
+
+    window = library.marketdataWindow(pd.Timestamp("2020-07-02"))
+    expected = library.marketdata[library.marketdata.index >= "2020-07-02"]
+    pd.testing.assert_frame_equal(window, expected, check_freq=False)
+
+    # a long history is sent with at most chartpoints points per line
+    library.chartpoints = 3
+    dates = pd.bdate_range("2010-01-01", "2020-07-03")
+    long = pd.DataFrame({"IWDA.AS": np.linspace(1, 2, len(dates))},
+                        index=dates)
+    library.getSnapshot("marketdata", lambda: long)
+
+    figure = library.makeEquityFigure(start_date=None)
+    assert len(figure.data[0].x) == 3
+
+
+def test_top_cards(db, tmp_path):
+    prepareDB(db)
+    migrate(dataimport.DBCONNECTION)
+    conn = sqlite3.connect(db)
+    conn.execute("INSERT INTO dekkingsgraad (date, name, value) "
+                 "VALUES ('2020-06-30', 'ABP', 0.92)")
+    conn.execute("INSERT INTO dgr_prediction_current (fund, date, value) "
+                 "VALUES ('ABP', '2020-07-03', 93.0)")
+    conn.commit()
+    conn.close()
+
+    library = GraphLibrary(["EUSA30"], figurestore=FigureStore(str(tmp_path)))
+    cards = library.buildTopCards()
+    funds, markets = cards.children
+
+    assert len(funds.children) == 1
+    assert len(markets.children) == 2
+    assert "+1.0%" in str(funds.children[0])
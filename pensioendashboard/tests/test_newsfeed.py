@@ -0,0 +1,116 @@
+# tests for the news feed, run against a local fake of NewsAPI
+import json
+import threading
+import time
+import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from ..newsfeed import NewsFeed
+
+TOPICS = ["pensioenfondsen", "beurs", "rente", "valuta"]
+
+
+class NewsServer(ThreadingHTTPServer):
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), NewsHandler)
+        self.requests = []
+        self.inflight = 0
+        self.maxinflight = 0
+        self.delay = 0.1
+        self.failing = set()
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{}/v2/everything".format(
+            self.server_address[1])
+
+
+class NewsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        _topic = parse_qs(urlparse(self.path).query)["q"][0]
+        with server.lock:
+            server.requests.append((_topic, self.headers["X-Api-Key"]))
+            server.inflight += 1
+            server.maxinflight = max(server.maxinflight, server.inflight)
+
+        time.sleep(server.delay)
+
+        if _topic in server.failing:
+            self.send_response(500)
+            self.end_headers()
+        else:
+            _body = json.dumps({"status": "ok", "articles": [{
+                "title": "Nieuws over {} ({})".format(
+                    _topic, len(server.requests)),
+                "source": {"name": "Bron"},
+                "publishedAt": "2020-07-17T10:00:00Z",
+                "url": "https://example.com/{}".format(_topic)}]}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(_body)))
+            self.end_headers()
+            self.wfile.write(_body)
+
+        with server.lock:
+            server.inflight -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    _server = NewsServer()
+    _thread = threading.Thread(target=_server.serve_forever, daemon=True)
+    _thread.start()
+    yield _server
+    _server.shutdown()
+    _server.server_close()
+
+
+def test_refresh_fetches_topics_concurrently(server, tmp_path):
+    feed = NewsFeed("key", url=server.url, topics=TOPICS,
+                    location=str(tmp_path / "news.json"))
+    feed.refresh()
+
+    assert sorted(topic for topic, _ in server.requests) == sorted(TOPICS)
+    assert all(key == "key" for _, key in server.requests)
+    assert server.maxinflight > 1
+
+    articles, fetched = feed.getNews("beurs")
+    assert articles[0]["title"].startswith("Nieuws over beurs")
+    assert fetched is not None
+
+    # another worker reads the shared cache instead of the api
+    other = NewsFeed("key", url=server.url, topics=TOPICS,
+                     location=str(tmp_path / "news.json"))
+    assert other.getNews("beurs") == (articles, fetched)
+    assert len(server.requests) == len(TOPICS)
+
+
+def test_getnews_does_not_block(server):
+    server.delay = 0.5
+    feed = NewsFeed("key", url=server.url, topics=TOPICS, ttl=60,
+                    location=None)
+
+    # nothing cached yet: return at once, refresh in the background
+    _start = time.monotonic()
+    assert feed.getNews("rente") == ([], None)
+    assert time.monotonic() - _start < server.delay
+
+    feed.refreshInBackground().join()
+    articles, fetched = feed.getNews("rente")
+    assert len(articles) == 1
+
+    # stale news is served while it is refreshed
+    feed.ttl = 0
+    server.failing.add("rente")
+    assert feed.getNews("rente") == (articles, fetched)
+    feed.refreshInBackground().join()
+
+    # a failing topic keeps its stale news, the others are updated
+    assert feed.getNews("rente") == (articles, fetched)
+    assert feed.getNews("beurs")[1] > fetched
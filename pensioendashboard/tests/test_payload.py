@@ -0,0 +1,46 @@
+# tests for the typed array encoding of the figures
+import base64
+import numpy as np
+
+from ..payload import compactFigure
+
+
+def decode(values) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(values["bdata"]),
+                         dtype=values["dtype"])
+
+
+def test_compact_figure():
+    figure = {
+        "data": [{"type": "scatter",
+                  "x": ["2020-07-01", "2020-07-02"],
+                  "y": [95.5, 96.25],
+                  "customdata": [1, None]},
+                 {"type": "bar", "xaxis": "x2", "orientation": "h",
+                  "x": [0.1, 0.2],
+                  "y": ["Nederland", "Duitsland"]}],
+        "layout": {}}
+
+    compact = compactFigure(figure)
+    scatter, bar = compact["data"]
+
+    np.testing.assert_array_equal(
+        decode(scatter["x"]).astype("datetime64[ms]"),
+        np.array(["2020-07-01", "2020-07-02"], dtype="datetime64[ms]"))
+    np.testing.assert_array_equal(decode(scatter["y"]), [95.5, 96.25])
+    assert np.isnan(decode(scatter["customdata"])[1])
+    assert compact["layout"]["xaxis"]["type"] == "date"
+
+    # categories are left as they are
+    assert bar["y"] == ["Nederland", "Duitsland"]
+    np.testing.assert_array_equal(decode(bar["x"]), [0.1, 0.2])
+    assert "xaxis2" not in compact["layout"]
+
+
+def test_customdata_keeps_full_precision():
+    # the hover of the country exposures shows the amounts in full
+    amounts = [123456789012, 45678901234]
+    compact = compactFigure({"data": [{"type": "bar", "x": [0.1, 0.2],
+                                       "customdata": list(amounts)}]})
+
+    assert list(decode(compact["data"][0]["customdata"])) == amounts
@@ -0,0 +1,135 @@
+# tests for the stage runner of the backend
+import threading
+import pandas as pd
+import pytest
+
+from ..backend import dataimport
+from ..backend.migrations import migrate
+from ..backend.pipeline import (Pipeline, Stage, DONE, SKIPPED, FAILED,
+                                UPSTREAMFAILED)
+from ..backend.riskmodel import RiskModelPF
+
+
+def test_pipeline_runs_independent_stages_concurrently(db):
+    engine = dataimport.DBCONNECTION
+    migrate(engine)
+
+    # both download stages have to be running at the same time to pass
+    # the barrier; run in sequence they would time out
+    barrier = threading.Barrier(2, timeout=5)
+    order = []
+
+    def download(name):
+        def _run():
+            barrier.wait()
+            order.append(name)
+        return _run
+
+    pipeline = Pipeline(
+        [Stage("model", lambda: order.append("model"),
+               after=["equity", "rates"]),
+         Stage("equity", download("equity")),
+         Stage("rates", download("rates"))],
+        engine)
+
+    assert pipeline.run() == {"equity": DONE, "rates": DONE,
+                              "model": DONE}
+    assert order[-1] == "model"
+    assert set(pipeline.timings) == {"equity", "rates", "model"}
+
+
+def test_pipeline_skips_unchanged_inputs(db):
+    engine = dataimport.DBCONNECTION
+    migrate(engine)
+
+    inputs = ["a"]
+    runs = []
+
+    def makePipeline():
+        return Pipeline(
+            [Stage("model", lambda: runs.append(inputs[0]),
+                   fingerprint=lambda: inputs[0])],
+            engine)
+
+    assert makePipeline().run() == {"model": DONE}
+    assert makePipeline().run() == {"model": SKIPPED}
+
+    inputs[0] = "b"
+    assert makePipeline().run() == {"model": DONE}
+    assert runs == ["a", "b"]
+
+    with engine.connect() as con:
+        row = con.execute("SELECT fingerprint, seconds FROM pipeline_state "
+                          "WHERE stage = 'model'").first()
+    assert row[0] == "b" and row[1] >= 0
+
+
+def test_pipeline_failed_stage_stops_dependents(db):
+    engine = dataimport.DBCONNECTION
+    migrate(engine)
+
+    def fail():
+        raise RuntimeError("website down")
+
+    ran = []
+    pipeline = Pipeline(
+        [Stage("dekkingsgraad", fail),
+         Stage("equity", lambda: ran.append("equity")),
+         Stage("model", lambda: ran.append("model"),
+               after=["dekkingsgraad", "equity"]),
+         Stage("version", lambda: ran.append("version"), after=["model"])],
+        engine)
+
+    assert pipeline.run() == {"dekkingsgraad": FAILED, "equity": DONE,
+                              "model": UPSTREAMFAILED,
+                              "version": UPSTREAMFAILED}
+    assert ran == ["equity"]
+
+
+def test_pipeline_reruns_stage_with_logged_error(db, monkeypatch):
+    engine = dataimport.DBCONNECTION
+    migrate(engine)
+
+    # without market data, runLinearModel logs an error and returns
+    # False instead of raising
+    df_dgr = pd.DataFrame({"date": pd.to_datetime(["2020-05-31",
+                                                   "2020-06-30"]),
+                           "fonds": "ABP",
+                           "dekkingsgraad": [0.95, 0.96]})
+    marketdata = [pd.DataFrame(index=pd.DatetimeIndex([], name="date"))]
+    runs = []
+
+    def runModel():
+        runs.append(len(marketdata[0]))
+        return RiskModelPF(marketdata[0], df_dgr).runLinearModel(
+            batched=True)
+
+    def makePipeline():
+        return Pipeline(
+            [Stage("model", runModel, fingerprint=lambda: "same inputs"),
+             Stage("version", lambda: runs.append("version"),
+                   after=["model"])],
+            engine)
+
+    assert makePipeline().run() == {"model": FAILED,
+                                    "version": UPSTREAMFAILED}
+    with engine.connect() as con:
+        assert con.execute("SELECT COUNT(*) FROM pipeline_state").scalar() \
+            == 0
+
+    # the inputs did not change, but the failed model runs again
+    assert makePipeline().run()["model"] == FAILED
+    assert runs == [0, 0]
+
+    # a successful run is stored, and only then skipped
+    monkeypatch.setattr(RiskModelPF, "runLinearModel",
+                        lambda self, batched=False: True)
+    assert makePipeline().run() == {"model": DONE, "version": DONE}
+    assert makePipeline().run() == {"model": SKIPPED, "version": DONE}
+
+
+def test_pipeline_rejects_cycles(db):
+    with pytest.raises(ValueError):
+        Pipeline([Stage("a", print, after=["b"]),
+                  Stage("b", print, after=["a"])],
+                 dataimport.DBCONNECTION)
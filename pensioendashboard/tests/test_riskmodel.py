@@ -0,0 +1,226 @@
+# tests for the risk model, based on generated market data and
+# dekkingsgraden instead of the db
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.linear_model import LinearRegression
+
+from ..backend import dataimport
+from ..backend.migrations import migrate
+from ..backend.riskmodel import (ABSCHANGE, LinearFactorModel, RiskModelPF,
+                                 fitLinearModels)
+
+FUNDS = ["ABP", "PFZW", "PMT"]
+TICKERS = ["EMIM.AS", "EURUSD", ABSCHANGE, "GSG", "IWDA.AS"]
+
+
+@pytest.fixture(scope="module")
+def riskmodel():
+    rng = np.random.default_rng(42)
+    dates = pd.bdate_range("2015-01-01", "2020-07-17", name="date")
+
+    # random walks for the risk factors
+    df_marketdata = pd.DataFrame(
+        100 * np.exp(np.cumsum(rng.normal(0, 0.01, (len(dates),
+                                                    len(TICKERS))),
+                               axis=0)),
+        index=dates, columns=TICKERS)
+    df_marketdata[ABSCHANGE] = 1 + np.cumsum(rng.normal(0, 0.02,
+                                                        len(dates)))
+    df_marketdata.columns.name = "name"
+
+    # monthly dekkingsgraden, driven by the risk factors plus noise
+    monthends = pd.date_range("2015-01-31", "2020-06-30", freq="M")
+    _df_month = df_marketdata.reindex(monthends, method="ffill")
+    rows = []
+    for i, fund in enumerate(FUNDS):
+        _dgr = 95 + 10 * np.log(_df_month["IWDA.AS"] / 100) * (1 + i) \
+            + 20 * (_df_month[ABSCHANGE] - 1) \
+            + rng.normal(0, 0.2, len(monthends))
+        # funds publish up to different months
+        _dgr = _dgr.iloc[:len(_dgr) - i]
+        rows.append(pd.DataFrame({"date": _dgr.index, "fonds": fund,
+                                  "dekkingsgraad": _dgr.values}))
+
+    model = RiskModelPF(df_marketdata, pd.concat(rows))
+    model.runLinearModel()
+
+    return model
+
+
+def contributionLoop(model: RiskModelPF) -> dict:
+    # the original implementation: a prediction per fund per risk factor
+    _df_marketdata = model.df_marketdata.copy()
+    _df_dgr = model.df_dgr.copy()
+    _result = {}
+
+    for fund in model.regr_model:
+        _df_input = _df_marketdata[
+            _df_marketdata.index >= _df_dgr[fund].dropna().index.max()
+            ].copy()
+
+        _df_input[_df_input.columns.difference([ABSCHANGE])] = \
+            _df_input[
+                _df_input.columns.difference([ABSCHANGE])
+                ].pct_change().fillna(0)
+        _df_input[ABSCHANGE] = _df_input[ABSCHANGE].diff().fillna(0)
+
+        _df_input_firstrow = _df_input.iloc[:1]
+        _df_predict = pd.DataFrame(index=_df_input.index)
+
+        for riskfactor in _df_input.columns:
+            _df_input_contribution = _df_input.copy()
+            _df_input_contribution.loc[
+                :, ~_df_input_contribution.columns.isin([riskfactor])
+                ] = _df_input_firstrow.loc[
+                :, ~_df_input_firstrow.columns.isin([riskfactor])
+                ].values
+            _predict = model.regr_model[fund].predict(_df_input_contribution)
+            _df_predict_right = pd.DataFrame(
+                data=_predict + 1,
+                index=_df_input.index,
+                columns=[riskfactor])
+            _df_predict = _df_predict.merge(
+                right=_df_predict_right.diff().fillna(0),
+                on="date")
+
+        _result[fund] = _df_predict
+
+    return _result
+
+
+def test_contribution_matches_loop(riskmodel):
+    expected = contributionLoop(riskmodel)
+    assert sorted(expected) == sorted(FUNDS)
+
+    riskmodel.makeContribution(debug=True)
+
+    assert sorted(riskmodel.df_contributions) == sorted(expected)
+    for fund in expected:
+        df = riskmodel.df_contributions[fund]
+        np.testing.assert_allclose(
+            df[list(expected[fund].columns)].values,
+            expected[fund].values,
+            rtol=1e-9, atol=1e-12)
+        assert list(df["date"]) == \
+            list(expected[fund].index.strftime("%Y-%m-%d"))
+
+
+def test_batched_fit_matches_per_fund_fit(riskmodel):
+    df_marketdata_ffil = riskmodel.df_marketdata.reindex(
+        pd.date_range(riskmodel.df_marketdata.index.min(),
+                      riskmodel.df_marketdata.index.max()),
+        method="ffill")
+    models = fitLinearModels(riskmodel.df_dgr, df_marketdata_ffil,
+                             test_size=0)
+
+    for fund in FUNDS:
+        # the per fund preparation of runLinearModel
+        df_join = pd.DataFrame(riskmodel.df_dgr[fund]).join(
+            df_marketdata_ffil, how="left").dropna()
+        relative = df_join.columns.difference([ABSCHANGE, fund])
+        df_join[relative] = df_join[relative].pct_change().fillna(0)
+        df_join[[ABSCHANGE, fund]] = \
+            df_join[[ABSCHANGE, fund]].diff().fillna(0)
+        X = df_join.drop(columns=fund)
+
+        regr = LinearRegression().fit(X, df_join[fund])
+
+        np.testing.assert_allclose(models[fund].coef_, regr.coef_,
+                                   rtol=1e-6, atol=1e-8)
+        assert models[fund].intercept_ == pytest.approx(regr.intercept_,
+                                                        abs=1e-8)
+        np.testing.assert_allclose(models[fund].predict(X),
+                                   regr.predict(X), atol=1e-8)
+
+
+def test_batched_models_in_prediction_and_contribution(riskmodel):
+    batched = RiskModelPF(riskmodel.df_marketdata,
+                          riskmodel.df_dgr.stack().rename(
+                              "dekkingsgraad").reset_index())
+    batched.runLinearModel(batched=True)
+
+    assert sorted(batched.regr_model) == sorted(FUNDS)
+    assert all(isinstance(model, LinearFactorModel)
+               for model in batched.regr_model.values())
+
+    batched.makeContribution(debug=True)
+    assert sorted(batched.df_contributions) == sorted(FUNDS)
+
+
+def test_incremental_prediction(riskmodel, db):
+    engine = dataimport.DBCONNECTION
+    migrate(engine)
+
+    df_dgr = riskmodel.df_dgr.stack().rename("dekkingsgraad").reset_index()
+    model = RiskModelPF(riskmodel.df_marketdata.iloc[:-5], df_dgr)
+    model.conn = engine
+    model.runLinearModel(batched=True)
+
+    def storedRows():
+        return pd.read_sql("SELECT * FROM dgr_prediction_current "
+                           "ORDER BY fund, date", engine)
+
+    def historyRows():
+        return pd.read_sql("SELECT * FROM dgr_prediction_history", engine)
+
+    # number of rows written per fund in the last run
+    written = {}
+    write = model.writePredictions
+
+    def _writePredictions(writes):
+        written.clear()
+        written.update({fund: len(df_predict)
+                        for fund, df_predict, full, state in writes})
+        write(writes)
+
+    model.writePredictions = _writePredictions
+
+    # first run: no state yet, so a full run
+    model.makePrediction(incremental=True)
+    first = storedRows()
+    assert sorted(first["fund"].unique()) == sorted(FUNDS)
+    assert len(historyRows()) == len(FUNDS)
+
+    # same data again: nothing changes, nothing is written
+    model.makePrediction(incremental=True)
+    assert written == {fund: 0 for fund in FUNDS}
+    pd.testing.assert_frame_equal(storedRows(), first)
+
+    # five new trading days: only these are added
+    model.df_marketdata = riskmodel.df_marketdata
+    model.makePrediction(incremental=True)
+    second = storedRows()
+    assert written == {fund: 5 for fund in FUNDS}
+    assert len(second) == len(first) + 5 * len(FUNDS)
+
+    # and the result equals a full recalculation
+    model.makePrediction(debug=True)
+    for fund in FUNDS:
+        stored = second[second["fund"] == fund].set_index("date")["value"]
+        full = model.df_predictions[fund].set_index("date")["value"]
+        np.testing.assert_allclose(stored.sort_index().values,
+                                   full.sort_index().values, rtol=1e-12)
+
+    # a full run replaces the rows of the fund
+    model.makePrediction()
+    pd.testing.assert_frame_equal(storedRows(), second, rtol=1e-12)
+
+
+def test_contributions_stored_wide(riskmodel, db, monkeypatch):
+    engine = dataimport.DBCONNECTION
+    migrate(engine)
+    monkeypatch.setattr(riskmodel, "conn", engine)
+
+    riskmodel.makeContribution()
+    riskmodel.makeContribution()
+
+    data = dataimport.DataImport(checkinterval=0)
+    wide = data.getDGRContributionWide()
+    long = data.getDGRContribution()
+
+    expected = pd.concat(riskmodel.df_contributions.values())
+    assert len(wide) == len(expected)
+    assert sorted(wide.columns.difference(["fund"])) == sorted(TICKERS)
+    assert len(long) == len(expected) * len(TICKERS)
+    assert list(long.columns) == ["fund", "index", "value"]
@@ -0,0 +1,265 @@
+# tests for the scrapers of the backend, run against a local
+# http server instead of the real websites
+import io
+import os
+import threading
+import time
+import pytest
+import pandas as pd
+from bs4 import BeautifulSoup
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from ..backend.iexscraper import IEXHistory, parseIEXDates
+from ..backend.fundsources import (SOURCES, FundSource, SourceCollector,
+                                   transformMonthsToDate)
+
+# synthetic pages with the structure of the websites of the funds, per
+# fund in SOURCES; see fixtures/README.md
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+FIXTUREFILES = {"ABP": "abp.html",
+                "PFZW": "pfzw.html",
+                "BPF Bouw": "bpfbouw.html",
+                "PMT": "pmt.html"}
+
+
+def readFixture(name: str) -> str:
+    with open(os.path.join(FIXTURES, FIXTUREFILES[name])) as f:
+        return f.read()
+
+
+def readTableBaseline(html: str, datecolumn: str, valuecolumn: str,
+                      name: str) -> pd.DataFrame:
+    # a website with a table, parsed as before the extraction layer
+    _df = pd.read_html(io.StringIO(html), header=0)[0]
+    _df = _df[[datecolumn, valuecolumn]].rename(
+        columns={datecolumn: "date", valuecolumn: "value"})
+    _df["value"] = _df["value"].str.replace(",", ".").str.replace(
+        "*", "", regex=False).str.rstrip("%").astype(float) / 100
+    _df["name"] = name
+
+    return _df[["date", "name", "value"]]
+
+
+def parseBaseline(name: str, html: str) -> pd.DataFrame:
+    """
+    The website of fund `name` parsed as before the extraction layer:
+    the tables with pandas.read_html, the spans of PFZW with the pure
+    python html.parser of BeautifulSoup.
+    """
+    if name == "PFZW":
+        _soup = BeautifulSoup(html, "html.parser")
+        _df = pd.DataFrame(columns=["date", "name", "value"])
+        for index, dgrinfo in enumerate(_soup.find_all(
+                name="span", attrs={"slot": "pfzw-collapsible--head"})):
+            split = dgrinfo.get_text().strip().rsplit(" ", 1)
+            _df.loc[index] = [split[0], name, float(
+                split[1].replace(",", ".").rstrip("%")) / 100]
+    elif name == "ABP":
+        # without the beleidsdekkingsgraad in the last row
+        _df = readTableBaseline(html, "Maanden", "Dekkingsgraad",
+                                name)[:-1]
+    elif name == "BPF Bouw":
+        _df = readTableBaseline(html, "Datum", "Dekkingsgraad",
+                                name).dropna()
+    else:
+        _df = readTableBaseline(html, "Maanden", "Actuele dekkingsgraad",
+                                name)
+
+    return transformMonthsToDate(_df)
+
+
+def iexPage(month: str) -> str:
+    _days = pd.date_range(pd.Period(month, freq="M").start_time,
+                          pd.Period(month, freq="M").end_time,
+                          freq="B")
+    _rows = "".join(
+        "<tr><td>{}</td><td>{}</td></tr>".format(
+            day.strftime("%d-%m-%Y"),
+            "1.{:03d},{:02d}".format(day.day, day.month))
+        for day in _days[::-1])
+
+    return "<html><body><table><thead><tr><th>Datum</th><th>Slot</th>" \
+        "</tr></thead><tbody>{}</tbody></table></body></html>".format(_rows)
+
+
+class FixtureServer(ThreadingHTTPServer):
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FixtureHandler)
+        self.requests = []
+        self.inflight = 0
+        self.maxinflight = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{}".format(self.server_address[1])
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append(self.path)
+            server.inflight += 1
+            server.maxinflight = max(server.maxinflight, server.inflight)
+
+        # slow enough to let concurrent requests overlap
+        time.sleep(0.05)
+        if self.path.startswith("/dgr/"):
+            self.sendDgrPage()
+        else:
+            _month = parse_qs(urlparse(self.path).query)["maand"][0]
+            self.sendBody(iexPage("{}-{}".format(_month[:4], _month[4:])))
+
+        with server.lock:
+            server.inflight -= 1
+
+    def sendBody(self, body: str, headers: dict = {}):
+        _body = body.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(_body)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(_body)
+
+    def sendDgrPage(self):
+        _etag = '"{}"'.format(self.path.rsplit("/", 1)[-1])
+
+        if self.headers.get("If-None-Match") == _etag:
+            self.send_response(304)
+            self.end_headers()
+        else:
+            self.sendBody(DGRPAGE, {"ETag": _etag})
+
+    def log_message(self, *args):
+        pass
+
+
+DGRPAGE = "<html><body><table><thead><tr><th>Maanden</th>" \
+    "<th>Dekkingsgraad</th></tr></thead><tbody>" \
+    "<tr><td>Mei 2020</td><td>91,2%</td></tr>" \
+    "<tr><td>Juni 2020</td><td>92,3%</td></tr>" \
+    "</tbody></table></body></html>"
+
+
+class TableSource(FundSource):
+    def __init__(self, name, url):
+        self.name = name
+        self.url = url
+        self.parsed = 0
+
+    def parse(self, html):
+        self.parsed += 1
+        _df = pd.read_html(io.StringIO(html), header=0)[0]
+        _df = _df.rename(columns={"Maanden": "date",
+                                  "Dekkingsgraad": "value"})
+        _df["name"] = self.name
+        _df["value"] = _df["value"].str.replace(",", ".").str.rstrip(
+            "%").astype(float) / 100
+        return transformMonthsToDate(_df[["date", "name", "value"]])
+
+
+@pytest.fixture
+def server():
+    _server = FixtureServer()
+    _thread = threading.Thread(target=_server.serve_forever, daemon=True)
+    _thread.start()
+    yield _server
+    _server.shutdown()
+    _server.server_close()
+
+
+def test_parse_iex_dates():
+    dates = pd.Series(["17-07-2020", "01-02-2019"])
+    parsed = parseIEXDates(dates)
+
+    assert list(parsed) == [pd.Timestamp("2020-07-17"),
+                            pd.Timestamp("2019-02-01")]
+
+
+def test_iexhistory_concurrent_and_cached(server, tmp_path):
+    link = server.url + "/historische-koersen.aspx?maand={}"
+    today = pd.Timestamp("today")
+    start = today - pd.DateOffset(months=3)
+
+    scraper = IEXHistory("TEST", link, cachedir=str(tmp_path),
+                         max_workers=4)
+    df = scraper.fetch(start, today)
+
+    assert len(server.requests) == 4
+    assert server.maxinflight > 1
+    assert df.index.is_monotonic_increasing
+    assert list(df.columns) == ["value", "name"]
+    assert df.index.min().to_period("M") == start.to_period("M")
+    assert df.loc[df.index.max(), "value"] == \
+        1000 + df.index.max().day + df.index.max().month / 100
+
+    # the three closed months are now served from the cache
+    df_cached = scraper.fetch(start, today)
+
+    assert len(server.requests) == 5
+    assert server.requests[-1].endswith(today.strftime("%Y%m"))
+    pd.testing.assert_frame_equal(df, df_cached)
+
+
+def test_sourcecollector_concurrent_and_conditional(server, tmp_path):
+    sources = [TableSource("Fund{}".format(i),
+                           server.url + "/dgr/fund{}".format(i))
+               for i in range(4)]
+    collector = SourceCollector(sources, cachedir=str(tmp_path))
+
+    results = collector.collect()
+
+    assert sorted(results) == ["Fund0", "Fund1", "Fund2", "Fund3"]
+    assert server.maxinflight > 1
+    assert max(results["Fund0"]["date"]) == pd.Timestamp("2020-06-30")
+    assert results["Fund0"]["value"].iloc[-1] == pytest.approx(0.923)
+
+    # second run: every site answers 304, the cached result is used
+    again = collector.collect()
+
+    assert [source.parsed for source in sources] == [1, 1, 1, 1]
+
+    for name in results:
+        pd.testing.assert_frame_equal(
+            again[name].reset_index(drop=True),
+            results[name].reset_index(drop=True),
+            check_dtype=False)
+
+
+def test_sourcecollector_skips_failing_site(server, tmp_path):
+    sources = [TableSource("Fund0", server.url + "/dgr/fund0"),
+               TableSource("Down", "http://127.0.0.1:9/dgr")]
+    results = SourceCollector(sources, timeout=1).collect()
+
+    assert list(results) == ["Fund0"]
+
+
+@pytest.mark.parametrize("source", SOURCES, ids=lambda source: source.name)
+def test_fund_sources_parse_fixtures(source):
+    df = source.parse(readFixture(source.name))
+
+    assert list(df.columns) == ["date", "name", "value"]
+    assert str(df["date"].dtype) == "datetime64[ns]"
+    assert df["value"].dtype == float
+    assert (df["name"] == source.name).all()
+
+    # three years of month ends, without the beleidsdekkingsgraad (ABP)
+    # and without the empty row (BPF Bouw)
+    assert len(df) == 36
+    assert df["date"].max() == pd.Timestamp("2020-06-30")
+    assert df["date"].min() == pd.Timestamp("2017-07-31")
+    assert df["value"].between(0.8, 1.3).all()
+
+
+@pytest.mark.parametrize("source", SOURCES, ids=lambda source: source.name)
+def test_fund_sources_match_baseline(source):
+    html = readFixture(source.name)
+
+    pd.testing.assert_frame_equal(
+        source.parse(html).reset_index(drop=True),
+        parseBaseline(source.name, html).reset_index(drop=True),
+        check_dtype=False)
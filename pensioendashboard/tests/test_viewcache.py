@@ -0,0 +1,58 @@
+# tests for the view cache, with two instances sharing one store in the
+# same way as the workers of the dashboard
+import json
+from dash import html
+from plotly.utils import PlotlyJSONEncoder
+
+from ..viewcache import ViewCache
+
+
+class Version:
+    def __init__(self):
+        self.version = 1
+
+    def __call__(self):
+        return self.version
+
+
+def test_viewcache_tiers_and_versions(tmp_path):
+    location = str(tmp_path / "views.db")
+    version = Version()
+    calls = []
+
+    def render(tab):
+        calls.append(tab)
+        return html.Div([html.P("tab {}".format(tab))], id=tab)
+
+    first = ViewCache(version, location=location)
+    view = first.memoize(render)
+
+    assert view("a").id == "a"
+    assert view("a").id == "a"
+    assert calls == ["a"]
+    assert first.stats == {"local": 1, "shared": 0, "misses": 1}
+
+    # another worker (or a restart) gets the page from the shared tier
+    second = ViewCache(version, location=location)
+    other = second.memoize(render)
+    assert json.dumps(other("a"), cls=PlotlyJSONEncoder) == \
+        json.dumps(view("a"), cls=PlotlyJSONEncoder)
+    assert second.stats["shared"] == 1
+    assert calls == ["a"]
+
+    # a new data version renders the page again
+    version.version = 2
+    assert other("a").id == "a"
+    assert calls == ["a", "a"]
+
+
+def test_viewcache_local_tier_is_bounded():
+    cache = ViewCache(lambda: 1, location=None, maxsize=2)
+    square = cache.memoize(lambda x: x * x)
+
+    for x in [1, 2, 3]:
+        square(x)
+    square(1)
+
+    assert cache.stats == {"local": 0, "shared": 0, "misses": 4}
+    assert len(cache._local) == 2
@@ -0,0 +1,136 @@
+import os
+import pickle
+import sqlite3
+import threading
+import functools
+import logging as LOG
+from collections import OrderedDict
+from contextlib import contextmanager
+from .backend.dataimport import DIRPATH
+
+VIEWCACHELOCATION = os.path.join(DIRPATH, "db/cache/views.db")
+# maximum number of entries in the in-process tier
+VIEWCACHESIZE = 64
+
+
+class ViewCache:
+    """
+    Two tier cache for rendered views, keyed by the data version instead
+    of a timeout. The first tier is an LRU dict in the worker itself; the
+    second tier is a sqlite file next to the db, shared by all workers
+    and surviving a restart. Entries of older data versions are never
+    returned and are removed from the shared tier on a new version.
+    """
+
+    def __init__(self,
+                 getversion,
+                 location: str = VIEWCACHELOCATION,
+                 maxsize: int = VIEWCACHESIZE):
+        self.getversion = getversion
+        self.location = location
+        self.maxsize = maxsize
+        self.stats = {"local": 0, "shared": 0, "misses": 0}
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+        self._purged = None
+        self._created = False
+
+    @contextmanager
+    def connect(self):
+        # a connection per call, since the callbacks run in several
+        # threads; committed and closed at the end of the block. The
+        # store is created on first use, not when the app is imported
+        if not self._created:
+            os.makedirs(os.path.dirname(self.location), exist_ok=True)
+
+        _con = sqlite3.connect(self.location, timeout=10)
+        try:
+            if not self._created:
+                with _con:
+                    _con.execute("CREATE TABLE IF NOT EXISTS views ("
+                                 "key TEXT NOT NULL PRIMARY KEY, "
+                                 "version INTEGER NOT NULL, "
+                                 "value BLOB NOT NULL)")
+                self._created = True
+            with _con:
+                yield _con
+        finally:
+            _con.close()
+
+    def readShared(self, key: str, version: int):
+        with self.connect() as con:
+            _row = con.execute("SELECT value FROM views "
+                               "WHERE key = ? AND version = ?",
+                               (key, version)).fetchone()
+        return None if _row is None else pickle.loads(_row[0])
+
+    def writeShared(self, key: str, version: int, value):
+        with self.connect() as con:
+            if self._purged != version:
+                con.execute("DELETE FROM views WHERE version < ?",
+                            (version, ))
+                self._purged = version
+            con.execute("INSERT OR REPLACE INTO views (key, version, value) "
+                        "VALUES (?, ?, ?)",
+                        (key, version, pickle.dumps(value)))
+
+    def setLocal(self, key: tuple, value):
+        with self._lock:
+            self._local[key] = value
+            self._local.move_to_end(key)
+            while len(self._local) > self.maxsize:
+                self._local.popitem(last=False)
+
+    def get(self, key: str, loader):
+        """
+        Return the value of `key` for the current data version, calling
+        `loader` when neither tier has it.
+        """
+        _version = self.getversion()
+        _localkey = (key, _version)
+
+        with self._lock:
+            if _localkey in self._local:
+                self._local.move_to_end(_localkey)
+                self.stats["local"] += 1
+                return self._local[_localkey]
+
+        _value = None
+        if self.location is not None:
+            try:
+                _value = self.readShared(key, _version)
+            except Exception as err:
+                LOG.error("Reading the view cache resulted in an error: "
+                          "{}".format(err))
+
+        if _value is not None:
+            self.stats["shared"] += 1
+        else:
+            self.stats["misses"] += 1
+            _value = loader()
+            if self.location is not None:
+                try:
+                    self.writeShared(key, _version, _value)
+                except Exception as err:
+                    LOG.error("Writing the view cache resulted in an "
+                              "error: {}".format(err))
+
+        self.setLocal(_localkey, _value)
+        return _value
+
+    def memoize(self, func):
+        # cache the result of func per data version and arguments
+        @functools.wraps(func)
+        def _wrapper(*args):
+            _key = "{}.{}{}".format(func.__module__, func.__qualname__,
+                                    repr(args))
+            return self.get(_key, lambda: func(*args))
+
+        return _wrapper
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+        if self.location is not None:
+            with self.connect() as con:
+                con.execute("DELETE FROM views")